@@ -1,9 +1,36 @@
-from fastapi import FastAPI
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from llm_chat import chat_turn
+from llm_chat import chat_turn, chat_turn_stream, get_state, SLOT_FLIGHTS, TURN_STATS, SESSIONS
+import llm_tiers
+import metrics
+import ollama_client
+from ollama_client import OllamaOverloaded
+from llm_cache import LLM_CACHE
+from candidates import CANDIDATES
+import fuzzy
+from results import RANKED, RESULTS_PAGE_SIZE, InvalidCursor, decode_cursor, results_page
+from semantic_index import EMBED_QUEUE
+from warmup import WARMUP
+
+metrics.register(metrics.Gauge("smartdrive_ready", "1 une fois le préchauffage terminé", lambda: int(WARMUP.ready)))
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # préchauffage en tâche de fond: /healthz répond tout de suite, /readyz après
+    warmup = asyncio.create_task(WARMUP.run())
+    yield
+    warmup.cancel()
+    await ollama_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,7 +43,92 @@ app.add_middleware(
 class ChatIn(BaseModel):
     session_id: str
     message: str
+    # latence max souhaitée pour ce tour (bornée par TURN_BUDGET_S)
+    budget_ms: Optional[int] = None
+
+    def budget_s(self) -> Optional[float]:
+        return self.budget_ms / 1000 if self.budget_ms else None
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    # durées par étape (metrics.stage) dans l'en-tête Server-Timing;
+    # en streaming: seulement les étapes terminées avant le premier octet
+    timings = metrics.begin_request()
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    if request.url.path.startswith("/chat") and response.status_code < 400:
+        WARMUP.first_response()
+    if timings:
+        timings.append(("total", time.perf_counter() - t0))
+        response.headers["Server-Timing"] = metrics.server_timing(timings)
+    return response
+
+@app.exception_handler(OllamaOverloaded)
+async def overloaded(request: Request, exc: OllamaOverloaded):
+    # surcharge => on rejette vite au lieu d'empiler les requêtes. /chat: file
+    # pleine ou attente trop longue; disjoncteur ouvert => tour dégradé (200)
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"error": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+@app.get("/healthz")
+def healthz():
+    # liveness: le process répond
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    # readiness: catalogue, index et modèles préchauffés
+    return JSONResponse(status_code=200 if WARMUP.ready else 503, content=WARMUP.stats())
 
 @app.post("/chat")
-def chat(payload: ChatIn):
-    return chat_turn(payload.session_id, payload.message)
+async def chat(payload: ChatIn):
+    return await chat_turn(payload.session_id, payload.message, payload.budget_s())
+
+@app.post("/chat/stream")
+async def chat_stream(payload: ChatIn):
+    # NDJSON: un événement JSON par ligne, le dernier ("final") = réponse de /chat
+    async def events():
+        async for ev in chat_turn_stream(payload.session_id, payload.message, payload.budget_s()):
+            yield json.dumps(ev, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.get("/results")
+def results(session_id: Optional[str] = None, cursor: Optional[str] = None, limit: int = RESULTS_PAGE_SIZE):
+    # 1re page: slots de la session; pages suivantes: slots et position du curseur
+    if cursor:
+        try:
+            slots, after = decode_cursor(cursor)
+        except InvalidCursor as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+    elif session_id:
+        slots, after = get_state(session_id)["slots"], None
+    else:
+        return JSONResponse(status_code=400, content={"error": "session_id or cursor required"})
+    return results_page(slots, after, limit)
+
+@app.get("/stats")
+def stats():
+    # combien de tours ont évité le LLM (fast path) + état de la file Ollama + cache LLM
+    return {
+        **TURN_STATS,
+        "ollama": ollama_client.gate.stats(),
+        "ollama_breaker": ollama_client.breaker_stats(),
+        "ollama_batching": ollama_client.batcher.stats(),
+        "llm_coalescing": SLOT_FLIGHTS.stats(),
+        "llm_cache": LLM_CACHE.stats(),
+        "llm_tiers": llm_tiers.stats(),
+        "sessions": SESSIONS.stats(),
+        "ranked_results": RANKED.stats(),
+        "candidates": CANDIDATES.stats(),
+        "fuzzy": fuzzy.stats(),
+        "semantic_updates": EMBED_QUEUE.stats(),
+        "startup": WARMUP.stats(),
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,201 @@
+"""Scoring SmartDrive vectorisé (NumPy) pour rejouer beaucoup de requêtes.
+
+Même filtres et même score que smart_ai.smartdrive_results, mais calculés
+sur des colonnes NumPy au lieu d'une boucle Python par voiture.
+
+Usage hors ligne:
+    python batch_scoring.py --check        # compare au chemin scalaire
+"""
+import sys
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from catalog import CarCatalog, get_catalog
+import smart_ai
+
+# Poids du score (valeurs par défaut = smart_ai.static_score / budget_bonus)
+DEFAULT_WEIGHTS = {
+    "year_base": 20, "year_step": 2,
+    "km_base": 20, "km_step": 2,
+    "tier_cheap": 25, "tier_mid": 15, "tier_high": 5,
+    "reliable": 10,
+    "maintenance_costly": 2, "maintenance_cheap": 10,
+    "diesel": 10, "electrique": 10,
+    "resale": 5,
+    "budget_max": 10, "budget_min": 10,
+}
+
+
+def _int_column(values) -> Tuple[np.ndarray, np.ndarray]:
+    """Colonne int64 + masque 'valeur entière présente' (comme isinstance(v, int))."""
+    ok = np.array([isinstance(v, int) and not isinstance(v, bool) for v in values], dtype=bool)
+    col = np.array([v if o else 0 for v, o in zip(values, ok)], dtype=np.int64)
+    return col, ok
+
+
+# =========================
+# Colonnes du catalogue
+# =========================
+class CatalogColumns:
+    def __init__(self, catalog: CarCatalog):
+        self.catalog = catalog
+        self.version = catalog.version
+        cars = [c if c is not None else {} for c in catalog.cars]
+
+        self.alive = np.array([c is not None for c in catalog.cars], dtype=bool)
+        self.price, self.price_int = _int_column([c.get("price") for c in cars])
+        # filtre budget: une annonce sans prix (ou prix 0) passe, comme CarCatalog.select
+        raw = [c.get("price") for c in cars]
+        self.priced = np.array([isinstance(p, (int, float)) and bool(p) for p in raw], dtype=bool)
+        self.price_f = np.array([float(p) if o else 0.0 for p, o in zip(raw, self.priced)])
+        self.year, self.year_ok = _int_column([c.get("year") for c in cars])
+        self.km, self.km_ok = _int_column([c.get("km") for c in cars])
+
+        self.brand = np.array(catalog.codes["brand"], dtype=np.int32)
+        self.fuel = np.array(catalog.codes["fuel"], dtype=np.int32)
+        self.city = np.array(catalog.codes["city"], dtype=np.int32)
+
+        brands = [(c.get("brand") or "").lower() for c in cars]
+        self.reliable = np.array([b in smart_ai.RELIABLE_BRANDS for b in brands], dtype=bool)
+        self.costly = np.array([b in smart_ai.COSTLY_BRANDS for b in brands], dtype=bool)
+        self.resale = np.array([b in smart_ai.RESALE_BRANDS for b in brands], dtype=bool)
+        self.diesel = np.array([c.get("fuel") == "diesel" for c in cars], dtype=bool)
+        self.electrique = np.array([c.get("fuel") == "electrique" for c in cars], dtype=bool)
+
+    def static_scores(self, w: Dict[str, int]) -> np.ndarray:
+        year_pts = np.maximum(0, w["year_base"] - (2026 - self.year) * w["year_step"])
+        km_pts = np.maximum(0, w["km_base"] - (self.km // 10000) * w["km_step"])
+        tier = np.where(self.price < 180000, w["tier_cheap"],
+                        np.where(self.price < 300000, w["tier_mid"], w["tier_high"]))
+        return (
+            np.where(self.year_ok, year_pts, 0)
+            + np.where(self.km_ok, km_pts, 0)
+            + np.where(self.price_int, tier, 0)
+            + self.reliable * w["reliable"]
+            + np.where(self.costly, w["maintenance_costly"], w["maintenance_cheap"])
+            + self.diesel * w["diesel"]
+            + self.electrique * w["electrique"]
+            + self.resale * w["resale"]
+        ).astype(np.int64)
+
+
+_COLUMNS: Optional[CatalogColumns] = None
+
+def get_columns() -> CatalogColumns:
+    global _COLUMNS
+    catalog = get_catalog()
+    if _COLUMNS is None or _COLUMNS.catalog is not catalog or _COLUMNS.version != catalog.version:
+        _COLUMNS = CatalogColumns(catalog)
+    return _COLUMNS
+
+
+# =========================
+# Filtres + score d'une requête
+# =========================
+def _code_mask(col: np.ndarray, catalog: CarCatalog, field: str, value: str, contains: bool) -> np.ndarray:
+    codes = catalog.codes_for(field, value, contains)
+    return np.isin(col, np.array(codes, dtype=np.int32))
+
+def _query_mask(cols: CatalogColumns, p: Dict[str, Any]) -> np.ndarray:
+    mask = cols.alive.copy()
+    if p.get("city"):
+        mask &= _code_mask(cols.city, cols.catalog, "city", p["city"], False)
+    if p.get("fuel"):
+        mask &= _code_mask(cols.fuel, cols.catalog, "fuel", p["fuel"], False)
+    if p.get("brand"):
+        mask &= _code_mask(cols.brand, cols.catalog, "brand", p["brand"], True)
+    lo, hi = p.get("budget_min"), p.get("budget_max")
+    if lo or hi:
+        in_range = np.ones_like(mask)
+        if lo:
+            in_range &= cols.price_f >= lo
+        if hi:
+            in_range &= cols.price_f <= hi
+        mask &= ~cols.priced | in_range
+    return mask
+
+def _budget_bonus(cols: CatalogColumns, p: Dict[str, Any], w: Dict[str, int]) -> np.ndarray:
+    bonus = np.zeros(len(cols.alive), dtype=np.int64)
+    lo, hi = p.get("budget_min"), p.get("budget_max")
+    if hi:
+        bonus += np.where(cols.price_int & (cols.price <= hi), w["budget_max"], 0)
+    if lo:
+        bonus += np.where(cols.price_int & (cols.price >= lo), w["budget_min"], 0)
+    return bonus
+
+def _top_k(ids: np.ndarray, scores: np.ndarray, limit: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Top `limit` par score décroissant puis id croissant (comme le tri stable).
+    argpartition d'abord, puis tri des seuls k retenus."""
+    if limit is not None and len(ids) > limit:
+        key = -scores * (int(ids.max()) + 1) + ids
+        part = np.argpartition(key, limit - 1)[:limit]
+        ids, scores = ids[part], scores[part]
+    order = np.lexsort((ids, -scores))
+    return ids[order], scores[order]
+
+
+def batch_results(
+        queries: Sequence[Union[str, Dict[str, Any]]],
+        limit: Optional[int] = 12,
+        weights: Optional[Dict[str, int]] = None,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Classe plusieurs requêtes d'un coup.
+
+    queries: textes bruts ou dicts smart_ai.parse_query
+    Retourne, par requête, (ids classés, scores) en tableaux NumPy.
+    """
+    w = dict(DEFAULT_WEIGHTS, **(weights or {}))
+    cols = get_columns()
+    static = cols.static_scores(w)
+
+    out = []
+    for q in queries:
+        p = smart_ai.parse_query(q) if isinstance(q, str) else q
+        ids = np.flatnonzero(_query_mask(cols, p))
+        scores = static[ids] + _budget_bonus(cols, p, w)[ids]
+        out.append(_top_k(ids, scores, limit))
+    return out
+
+
+# =========================
+# Parité avec le chemin scalaire
+# =========================
+def scalar_results(q: Union[str, Dict[str, Any]], limit: Optional[int] = 12) -> List[Tuple[int, int]]:
+    """Chemin scalaire de smart_ai (filtre catalogue + rank_cars). La parité avec
+    la boucle par voiture d'origine est vérifiée par tests/test_scoring_parity.py."""
+    p = smart_ai.parse_query(q) if isinstance(q, str) else q
+    catalog = get_catalog()
+    ids = catalog.select(**smart_ai.query_filters(p))
+    pos = {id(catalog.cars[i]): i for i in ids}
+    ranked = smart_ai.rank_cars(ids, p["budget_min"], p["budget_max"], limit=limit, catalog=catalog)
+    return [(pos[id(c)], score) for score, c, _ in ranked]
+
+def check_parity(queries: Sequence[Union[str, Dict[str, Any]]], limit: Optional[int] = 12) -> List[str]:
+    """Retourne la liste des requêtes dont le résultat diffère (vide = OK)."""
+    mismatches = []
+    for q, (ids, scores) in zip(queries, batch_results(queries, limit=limit)):
+        got = [(int(i), int(s)) for i, s in zip(ids, scores)]
+        if got != scalar_results(q, limit=limit):
+            mismatches.append(str(q))
+    return mismatches
+
+def sample_queries() -> List[str]:
+    budgets = ["", "moins de 150000", "plus de 200000", "plus de 130000 moins de 300000"]
+    cities = ["", "rabat", "casablanca", "fes", "kenitra"]
+    fuels = ["", "diesel", "essence", "electrique"]
+    brands = ["", "toyota", "dacia", "golf", "bmw"]
+    return [
+        " ".join(x for x in (b, c, f, br) if x)
+        for b in budgets for c in cities for f in fuels for br in brands
+    ]
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        qs = sample_queries()
+        bad = check_parity(qs) + check_parity(qs, limit=None)
+        for q in bad:
+            print("MISMATCH:", q)
+        print(f"{len(qs) * 2 - len(bad)}/{len(qs) * 2} requêtes identiques")
+        sys.exit(1 if bad else 0)
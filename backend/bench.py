@@ -0,0 +1,310 @@
+"""Micro-benchmarks recherche / scoring / extraction sur catalogues synthétiques.
+
+Chaque cas est mesuré pour chaque taille de catalogue (les extracteurs ne
+dépendent pas du catalogue: mesurés une seule fois). Résultat JSON
+(temps par appel en µs) + comparaison à des seuils de régression.
+
+    python bench.py                                  # 50 -> 1M annonces, tableau
+    python bench.py --sizes 50,10000 --json out.json
+    python bench.py --check                          # échoue si un seuil est dépassé
+    python bench.py --baseline out.json              # compare à un run précédent
+    python bench.py --update-thresholds              # réécrit bench_thresholds.json
+    python bench.py --prefill                        # prefill Ollama avant/après (serveur requis)
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Dict, Any, Callable, List, Optional, Sequence
+
+import entities
+import car_engine
+import llm_chat
+import ollama_client
+import smart_ai
+from catalog import CarCatalog, set_catalog
+from synthetic import generate_cars
+
+SIZES = (50, 1000, 10_000, 100_000, 1_000_000)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+THRESHOLDS_PATH = os.path.join(BASE_DIR, "bench_thresholds.json")
+# seuil = mesure de référence x HEADROOM (machines de CI plus lentes, bruit)
+HEADROOM = 3.0
+ROUNDS = 5
+ROUND_TIME = 0.05  # durée min d'une manche (s)
+
+
+# =========================
+# Entrées représentatives
+# =========================
+MESSAGES = [
+    "je cherche un SUV diesel automatique à Casablanca",
+    "moins de 150000 dh",
+    "plutôt essence, boîte manuelle",
+    "peu importe",
+    "une citadine hybride à rabat pour 120 000",
+    "Fès",
+    "budget max 200k, pas de préférence pour la ville",
+    "bonjour, vous pouvez m'aider ?",
+]
+
+RAW_SLOTS = [
+    {"type": "SUV", "fuel": "diesel", "gearbox": "automatique", "price_max": 200000, "city": "Casablanca"},
+    {"type": None, "fuel": "Diesel ", "gearbox": "UNSET", "price_max": "150 000 DH", "city": "fes"},
+    {"type": "citadine", "fuel": "ANY", "gearbox": "manuelle", "price_max": "ANY", "city": "Marrakesh"},
+    {"fuel": "gasoil", "price_max": 95000.0},
+]
+
+SEARCH_SLOTS = [
+    {"type": "UNSET", "fuel": "UNSET", "gearbox": "UNSET", "price_max": "UNSET", "city": "UNSET"},
+    {"type": "SUV", "fuel": "diesel", "gearbox": "automatique", "price_max": 200000, "city": "Casablanca"},
+    {"type": "citadine", "fuel": "essence", "gearbox": "ANY", "price_max": 120000, "city": "ANY"},
+    {"type": "ANY", "fuel": "hybride", "gearbox": "UNSET", "price_max": "UNSET", "city": "Fès"},
+    {"type": "berline", "fuel": "ANY", "gearbox": "manuelle", "price_max": 90000, "city": "Rabat"},
+]
+
+QUERIES = [
+    "voiture diesel moins de 150000",
+    "toyota à casablanca",
+    "essence plus de 100000 moins de 250000 rabat",
+    "dacia",
+    "voiture",
+]
+
+
+# =========================
+# Mesure
+# =========================
+def measure(fn: Callable[[Any], Any], inputs: Sequence[Any], rounds: int = ROUNDS,
+            round_time: float = ROUND_TIME) -> Dict[str, Any]:
+    """Temps par appel (µs) sur `rounds` manches; chaque manche rejoue les entrées
+    jusqu'à durer au moins `round_time`."""
+    per_call = []
+    calls = 0
+    for _ in range(rounds):
+        n = 0
+        t0 = time.perf_counter()
+        while True:
+            for x in inputs:
+                fn(x)
+            n += len(inputs)
+            elapsed = time.perf_counter() - t0
+            if elapsed >= round_time:
+                break
+        per_call.append(elapsed / n * 1e6)
+        calls += n
+    median = statistics.median(per_call)
+    return {
+        "calls": calls,
+        "min_us": round(min(per_call), 3),
+        "median_us": round(median, 3),
+        "max_us": round(max(per_call), 3),
+        "ops_per_s": round(1e6 / median, 1) if median else None,
+    }
+
+
+def _uncached(fn: Callable[[str], Any]) -> Callable[[str], Any]:
+    # extract() est mis en cache par message: on mesure l'extraction elle-même
+    def run(msg):
+        entities.extract.cache_clear()
+        return fn(msg)
+    return run
+
+
+EXTRACTION_CASES: Dict[str, Callable[[Any], Any]] = {
+    "extract_city": _uncached(llm_chat.extract_city),
+    "extract_fuel": _uncached(llm_chat.extract_fuel),
+    "extract_gearbox": _uncached(llm_chat.extract_gearbox),
+    "extract_type": _uncached(llm_chat.extract_type),
+    "extract_int": _uncached(llm_chat.extract_int),
+    "normalize_slots": llm_chat.normalize_slots,
+}
+
+CATALOG_CASES: Dict[str, tuple] = {
+    "search_cars": (llm_chat.search_cars, SEARCH_SLOTS),
+    "smartdrive_results": (smart_ai.smartdrive_results, QUERIES),
+    "find_cars": (car_engine.find_cars, QUERIES),
+}
+
+
+def run(sizes: Sequence[int] = SIZES, rounds: int = ROUNDS, log=print) -> Dict[str, Any]:
+    results = []
+
+    for name, fn in EXTRACTION_CASES.items():
+        inputs = RAW_SLOTS if name == "normalize_slots" else MESSAGES
+        r = {"case": name, "size": None, **measure(fn, inputs, rounds)}
+        results.append(r)
+        log(_row(r))
+
+    original, swapped = None, False
+    try:
+        for n in sizes:
+            cars = generate_cars(n)
+            t0 = time.perf_counter()
+            catalog = CarCatalog(cars)
+            build_us = (time.perf_counter() - t0) * 1e6
+            prev = set_catalog(catalog)
+            if not swapped:
+                original, swapped = prev, True
+            smart_ai.get_static_scores()  # construit hors mesure
+            r = {"case": "catalog_build", "size": n, "calls": 1, "min_us": round(build_us, 3),
+                 "median_us": round(build_us, 3), "max_us": round(build_us, 3),
+                 "ops_per_s": round(1e6 / build_us, 1)}
+            results.append(r)
+            log(_row(r))
+
+            for name, (fn, inputs) in CATALOG_CASES.items():
+                r = {"case": name, "size": n, **measure(fn, inputs, rounds)}
+                results.append(r)
+                log(_row(r))
+    finally:
+        if swapped:
+            set_catalog(original)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "rounds": rounds,
+        },
+        "results": results,
+    }
+
+
+def _key(r: Dict[str, Any]) -> str:
+    return r["case"] if r["size"] is None else f"{r['case']}@{r['size']}"
+
+def _row(r: Dict[str, Any]) -> str:
+    return f"{_key(r):<32} {r['median_us']:>14.1f} µs  (min {r['min_us']:.1f}, max {r['max_us']:.1f})"
+
+
+# =========================
+# Seuils / comparaison
+# =========================
+def check_thresholds(report: Dict[str, Any], thresholds: Dict[str, float]) -> List[str]:
+    """Cas dont la médiane dépasse le seuil (µs). Les cas sans seuil sont ignorés."""
+    failures = []
+    for r in report["results"]:
+        limit = thresholds.get(_key(r))
+        if limit is not None and r["median_us"] > limit:
+            failures.append(f"{_key(r)}: {r['median_us']:.1f} µs > seuil {limit:.1f} µs")
+    return failures
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Cas plus lents que `tolerance` x le run de référence."""
+    base = {_key(r): r["median_us"] for r in baseline["results"]}
+    failures = []
+    for r in report["results"]:
+        ref = base.get(_key(r))
+        if ref and r["median_us"] > ref * tolerance:
+            failures.append(f"{_key(r)}: {r['median_us']:.1f} µs vs {ref:.1f} µs (x{r['median_us'] / ref:.2f})")
+    return failures
+
+def thresholds_from(report: Dict[str, Any], headroom: float = HEADROOM) -> Dict[str, float]:
+    return {
+        _key(r): float(math.ceil(r["median_us"] * headroom))
+        for r in report["results"] if r["case"] != "catalog_build"
+    }
+
+# =========================
+# Prefill Ollama (serveur requis)
+# =========================
+PREFILL_TURNS = ["je cherche un SUV familial", "diesel", "automatique", "moins de 250000", "Casablanca"]
+
+def _legacy_messages(prompt: str, history) -> List[Dict[str, str]]:
+    # ancienne mise en page: partie variable d'abord, règles ensuite, pas d'historique
+    return [{"role": "user", "content": prompt + "\n\n" + llm_chat.SYSTEM_PREFIX}]
+
+PREFILL_LAYOUTS = {
+    "legacy": _legacy_messages,
+    "prefix": lambda prompt, history: llm_chat.llm_messages(prompt),
+    "history": llm_chat.llm_messages,
+}
+
+def prefill(turns: Sequence[str] = PREFILL_TURNS) -> Dict[str, Any]:
+    """prompt_eval_count / prompt_eval_duration rapportés par Ollama à chaque tour
+    d'une conversation, pour chaque mise en page du prompt. num_predict=1: on
+    ne mesure que le prefill."""
+    out = {}
+    for name, build in PREFILL_LAYOUTS.items():
+        slots, last_asked, history, rows = dict(llm_chat.SLOT_DEFAULTS), None, [], []
+        for msg in turns:
+            slots = llm_chat.normalize_slots(llm_chat.update_slots_from_message(dict(slots), msg, last_asked))
+            prompt = llm_chat.build_prompt(msg, slots, last_asked)
+            r = ollama_client.session().post(f"{ollama_client.OLLAMA_BASE}/api/chat", json={
+                "model": llm_chat.OLLAMA_MODEL,
+                "messages": build(prompt, history[-llm_chat.LLM_HISTORY_TURNS:]),
+                "stream": False,
+                "format": llm_chat.LLM_FORMAT,
+                "options": dict(llm_chat.LLM_OPTIONS, num_predict=1),
+            }, timeout=ollama_client.OLLAMA_TIMEOUT)
+            r.raise_for_status()
+            data = r.json()
+            rows.append({"tokens": data.get("prompt_eval_count", 0),
+                         "ms": round(data.get("prompt_eval_duration", 0) / 1e6, 1)})
+            history.append([prompt, json.dumps({"updated_slots": slots, "done": False}, ensure_ascii=False)])
+            last_asked = llm_chat.pick_missing(slots)
+        out[name] = {"tokens": sum(r["tokens"] for r in rows),
+                     "ms": round(sum(r["ms"] for r in rows), 1), "turns": rows}
+    return out
+
+
+def load_json(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmarks recherche/scoring/extraction")
+    ap.add_argument("--sizes", default=",".join(str(n) for n in SIZES))
+    ap.add_argument("--rounds", type=int, default=ROUNDS)
+    ap.add_argument("--json", help="écrit le rapport JSON dans ce fichier ('-' = stdout)")
+    ap.add_argument("--check", action="store_true", help=f"compare aux seuils de {THRESHOLDS_PATH}")
+    ap.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    ap.add_argument("--baseline", help="rapport JSON précédent")
+    ap.add_argument("--tolerance", type=float, default=1.25)
+    ap.add_argument("--update-thresholds", action="store_true")
+    ap.add_argument("--prefill", action="store_true", help="mesure le prefill Ollama par mise en page")
+    args = ap.parse_args()
+
+    if args.prefill:
+        result = prefill()
+        for name, r in result.items():
+            print(f"{name:<8} {r['tokens']:>6} tokens  {r['ms']:>10.1f} ms  "
+                  + " ".join(f"{t['tokens']}/{t['ms']}" for t in r["turns"]))
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+        sys.exit(0)
+
+    sizes: List[int] = [int(s) for s in args.sizes.split(",") if s]
+    quiet = args.json == "-"
+    report = run(sizes, args.rounds, log=(lambda *_: None) if quiet else print)
+
+    if args.json:
+        out = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.json == "-":
+            print(out)
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                f.write(out + "\n")
+
+    if args.update_thresholds:
+        with open(args.thresholds, "w", encoding="utf-8") as f:
+            json.dump(thresholds_from(report), f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    failures: List[str] = []
+    if args.check:
+        failures += check_thresholds(report, load_json(args.thresholds))
+    if args.baseline:
+        failures += compare(report, load_json(args.baseline), args.tolerance)
+    for line in failures:
+        print("REGRESSION:", line, file=sys.stderr)
+    sys.exit(1 if failures else 0)
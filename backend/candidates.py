@@ -0,0 +1,143 @@
+"""Ensemble de candidats de chaque session, mis à jour slot par slot.
+
+Chaque session garde, pour les slots qui l'ont produit, un masque compact
+(np.packbits, 1 bit par annonce) par filtre et l'ensemble des candidats
+(ids triés, ou bitmap compact si plus petit). Au tour suivant:
+  - mêmes filtres: ensemble réutilisé tel quel
+  - filtres ajoutés seulement: on filtre les ids déjà retenus
+  - filtre changé ou retiré: seul ce filtre est recalculé, puis ET des masques
+Tout est recalculé si le catalogue a changé (rechargement ou version).
+Mémoire bornée: plafond par session (on abandonne alors les masques par
+filtre) et plafond global (éviction LRU des sessions).
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from facets import FacetIndex, filter_dimensions, get_facets
+
+CANDIDATES_MAX_BYTES = int(os.environ.get("CANDIDATES_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_CANDIDATES_MAX_BYTES = int(os.environ.get("SESSION_CANDIDATES_MAX_BYTES", str(1024 * 1024)))
+
+
+def _unpack(packed: np.ndarray, n: int) -> np.ndarray:
+    return np.unpackbits(packed, count=n).view(bool)
+
+
+class SessionCandidates:
+    __slots__ = ("facets", "version", "dims", "masks", "ids", "packed")
+
+    def __init__(self, facets: FacetIndex, dims, masks: Dict[tuple, np.ndarray],
+                 ids: Optional[np.ndarray] = None, packed: Optional[np.ndarray] = None):
+        self.facets = facets
+        self.version = facets.catalog.version
+        self.dims = frozenset(dims)  # filtres qui ont produit l'ensemble
+        self.masks = masks           # filtre -> masque compact: tous, ou aucun si abandonnés
+        self.ids = ids               # candidats (int32 triés) ...
+        self.packed = packed         # ... ou bitmap compact
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [*self.masks.values(), self.ids, self.packed]
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def candidate_ids(self) -> np.ndarray:
+        if self.ids is not None:
+            return self.ids
+        return np.flatnonzero(_unpack(self.packed, self.facets.size)).astype(np.int32)
+
+    def compact(self, max_bytes: int) -> None:
+        # ids si plus petits que le bitmap, sinon bitmap
+        n = self.facets.size
+        if self.ids is not None and self.ids.nbytes > (n + 7) // 8:
+            mask = np.zeros(n, dtype=bool)
+            mask[self.ids] = True
+            self.ids, self.packed = None, np.packbits(mask)
+        if self.nbytes > max_bytes:
+            self.masks = {}  # seul l'ensemble reste: un changement de slot recalculera tout
+
+
+class CandidateCache:
+    def __init__(self, max_bytes: int = CANDIDATES_MAX_BYTES,
+                 session_max_bytes: int = SESSION_CANDIDATES_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.session_max_bytes = session_max_bytes
+        self._data: "OrderedDict[str, SessionCandidates]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.counts = {"full": 0, "narrow": 0, "partial": 0, "reuse": 0}
+
+    def get(self, session_id: str, filters: Dict[str, Any]) -> Tuple[FacetIndex, np.ndarray]:
+        """(index de facettes, ids triés des candidats) pour les filtres de la session."""
+        facets = get_facets()
+        dims = filter_dimensions(filters)
+        with self._lock:
+            prev = self._data.get(session_id)
+
+        new = frozenset(dims)
+        if prev is None or prev.facets is not facets or prev.version != facets.catalog.version:
+            entry, mode = self._full(facets, dims), "full"
+        elif prev.dims == new:
+            entry, mode = prev, "reuse"
+        elif prev.dims < new:
+            entry, mode = self._narrow(prev, [d for d in dims if d not in prev.dims]), "narrow"
+        elif len(prev.masks) == len(prev.dims):
+            entry, mode = self._partial(prev, dims), "partial"
+        else:
+            entry, mode = self._full(facets, dims), "full"
+
+        ids = entry.candidate_ids()
+        entry.compact(self.session_max_bytes)
+        self._put(session_id, entry, mode)
+        return facets, ids
+
+    def _full(self, facets: FacetIndex, dims) -> SessionCandidates:
+        mask = facets.alive.copy()
+        masks = {}
+        for d, m in zip(dims, facets.masks(dims)):
+            mask &= m
+            masks[d] = np.packbits(m)
+        return SessionCandidates(facets, dims, masks, ids=np.flatnonzero(mask).astype(np.int32))
+
+    def _narrow(self, prev: SessionCandidates, added) -> SessionCandidates:
+        ids = prev.candidate_ids()
+        keep = len(prev.masks) == len(prev.dims)
+        masks = dict(prev.masks)
+        for d, m in zip(added, prev.facets.masks(added)):
+            ids = ids[m[ids]]
+            if keep:
+                masks[d] = np.packbits(m)
+        return SessionCandidates(prev.facets, [*prev.dims, *added], masks, ids=ids)
+
+    def _partial(self, prev: SessionCandidates, dims) -> SessionCandidates:
+        facets = prev.facets
+        missing = [d for d in dims if d not in prev.masks]
+        masks = {d: prev.masks[d] for d in dims if d in prev.masks}
+        masks.update({d: np.packbits(m) for d, m in zip(missing, facets.masks(missing))})
+        acc = np.packbits(facets.alive)
+        for p in masks.values():
+            acc &= p
+        ids = np.flatnonzero(_unpack(acc, facets.size)).astype(np.int32)
+        return SessionCandidates(facets, dims, masks, ids=ids)
+
+    def _put(self, session_id: str, entry: SessionCandidates, mode: str) -> None:
+        with self._lock:
+            self.counts[mode] += 1
+            self._data.pop(session_id, None)
+            self.nbytes -= self._sizes.pop(session_id, 0)
+            self._data[session_id] = entry
+            self._sizes[session_id] = entry.nbytes
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes and len(self._data) > 1:
+                evicted, _ = self._data.popitem(last=False)
+                self.nbytes -= self._sizes.pop(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sessions": len(self._data), "bytes": self.nbytes, **self.counts}
+
+
+CANDIDATES = CandidateCache()
@@ -1,20 +1,17 @@
-import json, re
-
-cars = json.load(open("cars.json", encoding="utf-8"))
+import entities
+from catalog import get_catalog
 
 def find_cars(query):
-    q = query.lower()
-
-    budget_max = None
-    m = re.findall(r"\d+", q)
-    if m: budget_max = int(m[0])
+    e = entities.extract(query)
 
-    fuel = "diesel" if "diesel" in q else "essence" if "essence" in q else None
+    # budget explicite seulement ("moins de 150000", "max 150k"): une année
+    # ou un nombre de places n'est pas un prix
+    budget_max = e.budget_max
 
-    results = []
-    for c in cars:
-        if budget_max and c["price"] > budget_max: continue
-        if fuel and c["fuel"] != fuel: continue
-        results.append(c)
+    fuels = e.all("fuel")
+    fuel = "diesel" if "diesel" in fuels else "essence" if "essence" in fuels else None
 
-    return results
+    return get_catalog().select_cars(
+        exact={"fuel": fuel} if fuel else None,
+        price_max=budget_max,
+    )
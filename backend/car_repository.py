@@ -1,36 +1,124 @@
-from neo4j_db import driver
+import hashlib
+import json
+import sys
+from typing import Dict, Any, List, Optional, Tuple
+
+from catalog import CARS_PATH
+from neo4j_db import get_driver
+
+# (paramètre, relation, label) des filtres catégoriels
+FILTER_RELS = [
+    ("type", "HAS_TYPE", "Type"),
+    ("fuel", "HAS_FUEL", "Fuel"),
+    ("gearbox", "HAS_GEARBOX", "Gearbox"),
+    ("city", "LOCATED_IN", "City"),
+]
+
+ORDER_FIELDS = {"price": "c.price", "year": "c.year", "km": "c.km"}
+
+IMPORT_BATCH_SIZE = 1000
+
+# champs qui identifient une annonce (prix et kilométrage peuvent changer)
+LISTING_KEY_FIELDS = ("whatsapp", "brand", "model", "title", "year", "city", "image")
+
+
+# =========================
+# Schéma (index / contraintes)
+# =========================
+SCHEMA = [
+    "CREATE CONSTRAINT type_name IF NOT EXISTS FOR (t:Type) REQUIRE t.name IS UNIQUE",
+    "CREATE CONSTRAINT fuel_name IF NOT EXISTS FOR (f:Fuel) REQUIRE f.name IS UNIQUE",
+    "CREATE CONSTRAINT gearbox_name IF NOT EXISTS FOR (g:Gearbox) REQUIRE g.name IS UNIQUE",
+    "CREATE CONSTRAINT city_name IF NOT EXISTS FOR (ci:City) REQUIRE ci.name IS UNIQUE",
+    # ancienne clé: un vendeur avec plusieurs annonces n'avait qu'un seul Car
+    "DROP CONSTRAINT car_whatsapp IF EXISTS",
+    "CREATE CONSTRAINT car_listing_id IF NOT EXISTS FOR (c:Car) REQUIRE c.listing_id IS UNIQUE",
+    "CREATE INDEX car_price IF NOT EXISTS FOR (c:Car) ON (c.price)",
+]
+
+def ensure_schema():
+    with get_driver().session() as session:
+        for stmt in SCHEMA:
+            session.run(stmt).consume()
+
+
+# =========================
+# Recherche
+# =========================
+def build_search_query(
+        filters: Dict[str, Any],
+        price_max=None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        limit: Optional[int] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """Construit la requête Cypher avec un MATCH par filtre renseigné seulement.
+
+    Les filtres absents ne génèrent aucune clause: le planner part des
+    index (Fuel.name, City.name, Car.price...) au lieu de scanner tous les Car.
+    ORDER BY / LIMIT sont appliqués avant de récupérer les noms des
+    relations non filtrées.
+    """
+    clauses = []
+    params: Dict[str, Any] = {}
+
+    for key, rel, label in FILTER_RELS:
+        v = filters.get(key)
+        if v is not None:
+            clauses.append(f"MATCH (c:Car)-[:{rel}]->(:{label} {{name: ${key}}})")
+            params[key] = v
+
+    if price_max is not None:
+        clauses.append("MATCH (c:Car) WHERE c.price <= $price_max")
+        params["price_max"] = price_max
+
+    if not clauses:
+        clauses.append("MATCH (c:Car)")
+
+    clauses.append("WITH DISTINCT c")
+    if order_by is not None:
+        if order_by not in ORDER_FIELDS:
+            raise ValueError(f"Unknown order_by: {order_by}")
+        clauses.append(f"ORDER BY {ORDER_FIELDS[order_by]}" + (" DESC" if descending else ""))
+    if limit is not None:
+        clauses.append("LIMIT $limit")
+        params["limit"] = int(limit)
+
+    returns = []
+    var_names = {"type": "t", "fuel": "f", "gearbox": "g", "city": "ci"}
+    for key, rel, label in FILTER_RELS:
+        if key in params:
+            # valeur connue: pas besoin de relire la relation
+            returns.append(f"${key} AS {key}")
+        else:
+            var = var_names[key]
+            clauses.append(f"OPTIONAL MATCH (c)-[:{rel}]->({var}:{label})")
+            returns.append(f"{var}.name AS {key}")
+
+    clauses.append("RETURN c, " + ", ".join(returns))
+    return "\n".join(clauses), params
+
 
 def search_cars(
         car_type=None,
         fuel=None,
         gearbox=None,
         city=None,
-        price_max=None
+        price_max=None,
+        order_by=None,
+        descending=False,
+        limit=None,
 ):
-    query = """
-    MATCH (c:Car)
-    OPTIONAL MATCH (c)-[:HAS_TYPE]->(t:Type)
-    OPTIONAL MATCH (c)-[:HAS_FUEL]->(f:Fuel)
-    OPTIONAL MATCH (c)-[:HAS_GEARBOX]->(g:Gearbox)
-    OPTIONAL MATCH (c)-[:LOCATED_IN]->(ci:City)
-    WHERE
-        ($type IS NULL OR t.name = $type) AND
-        ($fuel IS NULL OR f.name = $fuel) AND
-        ($gearbox IS NULL OR g.name = $gearbox) AND
-        ($city IS NULL OR ci.name = $city) AND
-        ($price_max IS NULL OR c.price <= $price_max)
-    RETURN c, t.name AS type, f.name AS fuel, g.name AS gearbox, ci.name AS city
-    """
+    query, params = build_search_query(
+        {"type": car_type, "fuel": fuel, "gearbox": gearbox, "city": city},
+        price_max=price_max,
+        order_by=order_by,
+        descending=descending,
+        limit=limit,
+    )
 
-    with driver.session() as session:
-        result = session.run(
-            query,
-            type=car_type,
-            fuel=fuel,
-            gearbox=gearbox,
-            city=city,
-            price_max=price_max
-        )
+    with get_driver().session() as session:
+        result = session.run(query, **params)
 
         return [
             {
@@ -48,3 +136,54 @@ def search_cars(
             }
             for r in result
         ]
+
+
+# =========================
+# Import en masse (cars.json -> graphe)
+# =========================
+IMPORT_QUERY = """
+UNWIND $rows AS row
+MERGE (c:Car {listing_id: row.listing_id})
+SET c.model = row.model, c.title = row.title, c.brand = row.brand, c.whatsapp = row.whatsapp,
+    c.price = row.price, c.year = row.year, c.km = row.km, c.image = row.image
+WITH c, row
+OPTIONAL MATCH (c)-[old:HAS_TYPE|HAS_FUEL|HAS_GEARBOX|LOCATED_IN]->()
+DELETE old
+WITH DISTINCT c, row
+FOREACH (_ IN CASE WHEN row.type IS NULL THEN [] ELSE [1] END |
+    MERGE (t:Type {name: row.type}) MERGE (c)-[:HAS_TYPE]->(t))
+FOREACH (_ IN CASE WHEN row.fuel IS NULL THEN [] ELSE [1] END |
+    MERGE (f:Fuel {name: row.fuel}) MERGE (c)-[:HAS_FUEL]->(f))
+FOREACH (_ IN CASE WHEN row.gearbox IS NULL THEN [] ELSE [1] END |
+    MERGE (g:Gearbox {name: row.gearbox}) MERGE (c)-[:HAS_GEARBOX]->(g))
+FOREACH (_ IN CASE WHEN row.city IS NULL THEN [] ELSE [1] END |
+    MERGE (ci:City {name: row.city}) MERGE (c)-[:LOCATED_IN]->(ci))
+"""
+
+def listing_id(car: Dict[str, Any]) -> str:
+    """Clé d'une annonce: son "id" s'il existe, sinon un hash stable des champs
+    qui l'identifient (pas le whatsapp seul: un vendeur a plusieurs annonces)."""
+    if car.get("id") is not None:
+        return str(car["id"])
+    raw = json.dumps([car.get(k) for k in LISTING_KEY_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def import_cars(cars: List[Dict[str, Any]], batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """Charge les annonces par lots UNWIND (une transaction par lot).
+    Clé d'annonce: listing_id. Ré-importer met à jour."""
+    ensure_schema()
+    rows = [{**c, "listing_id": listing_id(c)} for c in cars if c]
+    with get_driver().session() as session:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            session.execute_write(lambda tx: tx.run(IMPORT_QUERY, rows=batch).consume())
+    return len(rows)
+
+
+if __name__ == "__main__":
+    # python car_repository.py import [cars.json]  (défaut: CARS_PATH, à côté du module)
+    if len(sys.argv) >= 2 and sys.argv[1] == "import":
+        path = sys.argv[2] if len(sys.argv) > 2 else CARS_PATH
+        with open(path, encoding="utf-8") as f:
+            n = import_cars(json.load(f))
+        print(f"{n} annonces importées")
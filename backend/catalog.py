@@ -0,0 +1,490 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Callable, Sequence, Tuple
+
+import numpy as np
+
+from entities import fold
+from snapshot import VALUE, Snapshot, source_signature, write_snapshot
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CARS_PATH = os.environ.get("CARS_PATH", os.path.join(BASE_DIR, "cars.json"))
+# snapshot binaire (voir snapshot.py), régénéré quand le JSON change
+CATALOG_SNAPSHOT = os.environ.get("CATALOG_SNAPSHOT", os.path.splitext(CARS_PATH)[0] + ".snap")
+CATALOG_WRITE_SNAPSHOT = os.environ.get("CATALOG_WRITE_SNAPSHOT", "1") == "1"
+# au-delà de cette taille, le JSON est lu annonce par annonce (pas tout le texte en mémoire)
+CATALOG_STREAM_BYTES = int(os.environ.get("CATALOG_STREAM_BYTES", str(32 * 1024 * 1024)))
+# intervalle de surveillance du fichier source (s); 0 = pas de rechargement à chaud
+CATALOG_WATCH_SECONDS = float(os.environ.get("CATALOG_WATCH_SECONDS", "2"))
+
+# Champs catégoriels indexés (valeurs comparées sans accents ni casse)
+INDEXED_FIELDS = ("fuel", "gearbox", "city", "type", "brand")
+
+
+def _has_price(p) -> bool:
+    # même règle que les anciens filtres: une annonce sans prix passe le filtre budget
+    return isinstance(p, (int, float)) and bool(p)
+
+
+def _field_codes(cars: List[Dict[str, Any]], field: str):
+    """(valeur normalisée -> code, code de chaque annonce). fold() n'est
+    appelé qu'une fois par valeur brute distincte."""
+    keys: Dict[str, int] = {}
+    by_raw: Dict[str, int] = {}
+    codes: List[int] = []
+    for c in cars:
+        v = c.get(field) if c is not None else None
+        if not isinstance(v, str) or not v:
+            codes.append(-1)
+            continue
+        code = by_raw.get(v)
+        if code is None:
+            k = fold(v)
+            code = keys.get(k)
+            if code is None:
+                code = keys[k] = len(keys)
+            by_raw[v] = code
+        codes.append(code)
+    return keys, codes
+
+
+# =========================
+# Catalogue indexé (construit une seule fois)
+# =========================
+class CarCatalog:
+    """Catalogue en mémoire avec index inversés par champ et prix trié.
+
+    Chaque annonce a un id = sa position dans `cars` (None si supprimée). Pour chaque champ de
+    INDEXED_FIELDS on garde:
+      - keys[field]: valeurs distinctes (minuscules) -> code
+      - codes[field]: code de chaque annonce (-1 si absent)
+      - postings[field][code]: liste triée des ids ayant cette valeur
+    Les prix sont indexés dans un tableau trié pour les requêtes par intervalle.
+    """
+
+    def __init__(self, cars: List[Dict[str, Any]], index: Optional[Dict[str, tuple]] = None):
+        """index: structures déjà calculées (snapshot), sinon dérivées de cars:
+        index[field] = (keys, codes, postings), index["price"] = (prix triés, ids, ids sans prix)."""
+        index = index or {}
+        self.cars = cars
+        self.keys: Dict[str, Dict[str, int]] = {}
+        self.codes: Dict[str, List[int]] = {}
+        self.postings: Dict[str, List[List[int]]] = {}
+
+        for field in INDEXED_FIELDS:
+            if field in index:
+                keys, codes, postings = index[field]
+            else:
+                keys, codes = _field_codes(cars, field)
+                postings = [[] for _ in keys]
+                for i, code in enumerate(codes):
+                    if code >= 0:
+                        postings[code].append(i)
+            self.keys[field] = keys
+            self.codes[field] = codes
+            self.postings[field] = postings
+
+        self.prices = [c.get("price") if c is not None else None for c in cars]
+        if "price" in index:
+            self._price_sorted, self._price_ids, self._unpriced = index["price"]
+        else:
+            priced = sorted((p, i) for i, p in enumerate(self.prices) if _has_price(p))
+            self._price_sorted = [p for p, _ in priced]
+            self._price_ids = [i for _, i in priced]
+            self._unpriced = [
+                i for i, p in enumerate(self.prices) if not _has_price(p) and cars[i] is not None
+            ]
+
+        self.version = 0
+        self._listeners: List[Callable[["CarCatalog", int], None]] = []
+
+    def __len__(self) -> int:
+        return len(self.cars)
+
+    # -------- mises à jour d'annonces --------
+    def subscribe(self, fn: Callable[["CarCatalog", int], None]) -> None:
+        """fn(catalog, car_id) est appelé après chaque ajout/modif/suppression."""
+        self._listeners.append(fn)
+
+    def _notify(self, i: int) -> None:
+        self.version += 1
+        for fn in self._listeners:
+            fn(self, i)
+
+    def _index(self, i: int) -> None:
+        c = self.cars[i]
+        for field in INDEXED_FIELDS:
+            v = c.get(field)
+            if not isinstance(v, str) or not v:
+                self.codes[field][i] = -1
+                continue
+            keys, postings = self.keys[field], self.postings[field]
+            k = fold(v)
+            code = keys.get(k)
+            if code is None:
+                code = keys[k] = len(postings)
+                postings.append([])
+            self.codes[field][i] = code
+            insort(postings[code], i)
+
+        p = c.get("price")
+        self.prices[i] = p
+        if _has_price(p):
+            pos = bisect_right(self._price_sorted, p)
+            self._price_sorted.insert(pos, p)
+            self._price_ids.insert(pos, i)
+        else:
+            insort(self._unpriced, i)
+
+    def _unindex(self, i: int) -> None:
+        for field in INDEXED_FIELDS:
+            code = self.codes[field][i]
+            if code >= 0:
+                posting = self.postings[field][code]
+                del posting[bisect_left(posting, i)]
+            self.codes[field][i] = -1
+
+        p = self.prices[i]
+        if _has_price(p):
+            pos = bisect_left(self._price_sorted, p)
+            while self._price_ids[pos] != i:
+                pos += 1
+            del self._price_sorted[pos]
+            del self._price_ids[pos]
+        else:
+            del self._unpriced[bisect_left(self._unpriced, i)]
+        self.prices[i] = None
+
+    def upsert(self, car: Dict[str, Any], car_id: Optional[int] = None) -> int:
+        """Ajoute une annonce (car_id=None) ou remplace l'annonce car_id."""
+        if car_id is None:
+            car_id = len(self.cars)
+            self.cars.append(car)
+            for field in INDEXED_FIELDS:
+                self.codes[field].append(-1)
+            self.prices.append(None)
+        else:
+            if self.cars[car_id] is not None:
+                self._unindex(car_id)
+            self.cars[car_id] = car
+        self._index(car_id)
+        self._notify(car_id)
+        return car_id
+
+    def remove(self, car_id: int) -> None:
+        """Supprime une annonce. Les ids restent stables (case vide = None)."""
+        if self.cars[car_id] is None:
+            return
+        self._unindex(car_id)
+        self.cars[car_id] = None
+        self._notify(car_id)
+
+    # -------- résolution des filtres --------
+    def codes_for(self, field: str, value: str, contains: bool) -> List[int]:
+        v = fold(value)
+        keys = self.keys[field]
+        if not contains:
+            code = keys.get(v)
+            return [] if code is None else [code]
+        return [code for k, code in keys.items() if v in k]
+
+    def _price_ids_in(self, price_min, price_max) -> List[int]:
+        lo = bisect_left(self._price_sorted, price_min) if price_min else 0
+        hi = bisect_right(self._price_sorted, price_max) if price_max else len(self._price_sorted)
+        return self._price_ids[lo:hi]
+
+    def select(
+            self,
+            exact: Optional[Dict[str, str]] = None,
+            contains: Optional[Dict[str, str]] = None,
+            price_min=None,
+            price_max=None,
+            limit: Optional[int] = None,
+            within: Optional[Sequence[int]] = None,
+    ) -> List[int]:
+        """Ids (ordre du fichier) des annonces qui passent tous les filtres.
+
+        exact: champ -> valeur (égalité sans accents ni casse)
+        contains: champ -> sous-chaîne (ex: "suv" dans le type)
+        price_min / price_max: bornes incluses, ignorées si falsy
+        within: ne garder que ces ids, dans cet ordre (ex: résultats sémantiques)
+        """
+        allowed: Dict[str, set] = {}
+        drivers = []  # (taille, générateur d'ids triés)
+
+        for specs, is_contains in ((exact, False), (contains, True)):
+            for field, value in (specs or {}).items():
+                codes = self.codes_for(field, value, is_contains)
+                if not codes:
+                    return []
+                prev = allowed.get(field)
+                allowed[field] = set(codes) if prev is None else prev & set(codes)
+                if not allowed[field]:
+                    return []
+
+        for field, codes in allowed.items():
+            lists = [self.postings[field][c] for c in codes]
+            size = sum(len(l) for l in lists)
+            drivers.append((size, lists[0] if len(lists) == 1 else merge(*lists)))
+
+        use_price = bool(price_min) or bool(price_max)
+        if use_price:
+            ranged = self._price_ids_in(price_min, price_max)
+            size = len(ranged) + len(self._unpriced)
+            drivers.append((size, None))
+
+        if within is not None:
+            n = len(self.cars)
+            ids: Iterable[int] = (i for i in within if 0 <= i < n and self.cars[i] is not None)
+        elif not drivers:
+            ids = (i for i, c in enumerate(self.cars) if c is not None)
+        else:
+            size, ids = min(drivers, key=lambda d: d[0])
+            if ids is None:
+                # le prix est le filtre le plus sélectif
+                ids = merge(sorted(self._price_ids_in(price_min, price_max)), self._unpriced)
+                use_price = False
+
+        checks = [(self.codes[f], codes) for f, codes in allowed.items()]
+        prices = self.prices
+        out: List[int] = []
+        for i in ids:
+            if any(col[i] not in codes for col, codes in checks):
+                continue
+            if use_price:
+                p = prices[i]
+                if _has_price(p) and ((price_min and p < price_min) or (price_max and p > price_max)):
+                    continue
+            out.append(i)
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def select_cars(self, **kwargs) -> List[Dict[str, Any]]:
+        return [self.cars[i] for i in self.select(**kwargs)]
+
+
+# =========================
+# Chargement: snapshot binaire, sinon JSON (en flux si gros)
+# =========================
+def iter_json_array(path: str, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """Éléments d'un tableau JSON, lus bloc par bloc: on ne garde jamais
+    tout le texte du fichier en mémoire."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8-sig") as f:
+        buf, pos, eof = f.read(chunk_size).lstrip(), 1, False
+        if not buf.startswith("["):
+            raise ValueError(f"{path}: expected a JSON array")
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            item = end = None
+            if pos < len(buf):
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            # élément coupé en fin de bloc (un nombre coupé se décode aussi): bloc suivant
+            if end is None or (end == len(buf) and not eof):
+                if eof:
+                    raise ValueError(f"{path}: unterminated JSON array")
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield item
+            pos = end
+
+
+def load_cars(path: str = CARS_PATH) -> List[Dict[str, Any]]:
+    if os.path.getsize(path) > CATALOG_STREAM_BYTES:
+        return list(iter_json_array(path))
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def catalog_from_snapshot(snap: Snapshot) -> CarCatalog:
+    """Index construits à partir des colonnes, en NumPy: fold() n'est
+    appelé qu'une fois par valeur distincte, postings et ordre des prix
+    par tri des tableaux."""
+    index: Dict[str, tuple] = {}
+    for field in INDEXED_FIELDS:
+        if snap.columns.get(field, {}).get("kind") != "str":
+            continue  # colonne absente ou mixte: calculée depuis les annonces
+        keys: Dict[str, int] = {}
+        remap = []
+        for v in snap.dictionary(field):
+            remap.append(keys.setdefault(fold(v), len(keys)) if v else -1)
+        table = np.array(remap + [-1], dtype=np.int64)  # code -1 -> dernier
+        codes = table[snap.codes(field)]
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(keys))
+        starts = len(codes) - int(counts.sum())  # les -1 sont en tête
+        bounds = np.cumsum(counts)[:-1] + starts
+        postings = [p.tolist() for p in np.split(order[starts:], bounds - starts)] if len(keys) else []
+        index[field] = (keys, codes.tolist(), postings)
+
+    price = snap.columns.get("price", {}).get("kind")
+    if price in ("int", "float"):
+        values = snap.array("price.values")
+        alive = snap.array("alive").astype(bool)
+        priced = (snap.array("price.state") == VALUE) & (values != 0)
+        ids = np.flatnonzero(priced)
+        ids = ids[np.argsort(values[ids], kind="stable")]
+        index["price"] = (values[ids].tolist(), ids.tolist(), np.flatnonzero(alive & ~priced).tolist())
+    return CarCatalog(snap.cars(), index=index)
+
+
+def load_catalog(path: str = CARS_PATH, snapshot: Optional[str] = CATALOG_SNAPSHOT) -> Tuple[CarCatalog, str]:
+    """(catalogue, origine): le snapshot s'il est à jour, sinon le JSON
+    (et le snapshot est réécrit pour le prochain démarrage)."""
+    if snapshot and os.path.exists(snapshot):
+        snap = Snapshot(snapshot)
+        if snap.is_fresh(path):
+            return catalog_from_snapshot(snap), "snapshot"
+
+    cars = load_cars(path)
+    if snapshot and CATALOG_WRITE_SNAPSHOT:
+        try:
+            write_snapshot(cars, snapshot, source=path)
+        except OSError:
+            pass  # dossier en lecture seule: on relira le JSON la prochaine fois
+    return CarCatalog(cars), "json"
+
+
+# =========================
+# Service partagé + rechargement à chaud
+# =========================
+class CatalogService:
+    """Catalogue partagé, chargé au premier accès.
+
+    Un thread surveille le fichier source (mtime, taille). Quand il change,
+    le nouveau catalogue et ses index sont construits dans ce thread, les
+    hooks on_reload(old, new) préparent leurs structures dérivées, puis la
+    référence est remplacée d'un bloc. Une requête en cours garde le
+    catalogue qu'elle a obtenu: elle n'est ni bloquée ni mélangée.
+    """
+
+    def __init__(self, path: str = CARS_PATH, snapshot: Optional[str] = CATALOG_SNAPSHOT,
+                 watch: float = CATALOG_WATCH_SECONDS):
+        self.path = path
+        self.snapshot = snapshot
+        self.watch = watch
+        self.catalog: Optional[CarCatalog] = None
+        self.origin: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._hooks: List[Callable[[CarCatalog, CarCatalog], None]] = []
+        self._lock = threading.Lock()  # un seul chargement à la fois
+        self._signature = None
+        self._failed_signature = None
+        self._watcher: Optional[threading.Thread] = None
+
+    def _watched(self) -> str:
+        # sans JSON (déploiement avec le seul snapshot), on surveille le snapshot
+        return self.path if os.path.exists(self.path) or not self.snapshot else self.snapshot
+
+    def get(self) -> CarCatalog:
+        catalog = self.catalog
+        if catalog is None:
+            with self._lock:
+                if self.catalog is None:
+                    self._load(notify=False)
+            catalog = self.catalog
+            self.start_watching()
+        return catalog
+
+    def on_reload(self, fn: Callable[[CarCatalog, CarCatalog], None]) -> None:
+        """fn(ancien, nouveau) est appelé avant chaque remplacement par rechargement."""
+        self._hooks.append(fn)
+
+    def _load(self, notify: bool) -> None:
+        signature = source_signature(self._watched())
+        t0 = time.perf_counter()
+        catalog, origin = load_catalog(self.path, self.snapshot)
+        previous = self.catalog
+        if notify and previous is not None:
+            for fn in list(self._hooks):
+                fn(previous, catalog)
+        self.catalog = catalog
+        self._signature = signature
+        self.origin = origin
+        self.load_seconds = time.perf_counter() - t0
+
+    def reload(self) -> bool:
+        """Recharge si la source a changé. False si inchangée ou en erreur
+        (l'ancien catalogue reste alors en service)."""
+        with self._lock:
+            signature = source_signature(self._watched())
+            if signature == self._signature or signature == self._failed_signature:
+                return False
+            try:
+                self._load(notify=True)
+            except Exception as e:
+                # fichier en cours d'écriture ou invalide: réessayé au prochain changement
+                self._failed_signature = signature
+                self.last_error = f"{type(e).__name__}: {e}"
+                return False
+            self.reloads += 1
+            self.last_error = None
+            return True
+
+    def swap(self, catalog: CarCatalog) -> Optional[CarCatalog]:
+        """Remplace le catalogue sans passer par le fichier (benchmarks). Rend l'ancien."""
+        with self._lock:
+            previous, self.catalog = self.catalog, catalog
+            return previous
+
+    def start_watching(self) -> None:
+        if self.watch <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch_loop, name="catalog-watch", daemon=True)
+        self._watcher.start()
+
+    def _watch_loop(self) -> None:
+        while True:
+            time.sleep(self.watch)
+            self.reload()
+
+    def stats(self) -> Dict[str, Any]:
+        catalog = self.catalog
+        return {
+            "cars": len(catalog) if catalog else 0,
+            "version": catalog.version if catalog else None,
+            "origin": self.origin,
+            "load_s": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+
+CATALOG = CatalogService()
+
+
+def get_catalog() -> CarCatalog:
+    return CATALOG.get()
+
+
+def set_catalog(catalog: CarCatalog) -> Optional[CarCatalog]:
+    """Remplace le catalogue partagé (benchmarks). Rend l'ancien."""
+    return CATALOG.swap(catalog)
+
+
+if __name__ == "__main__":
+    # python catalog.py snapshot [cars.json [cars.snap]]
+    if len(sys.argv) >= 2 and sys.argv[1] == "snapshot":
+        src = sys.argv[2] if len(sys.argv) >= 3 else CARS_PATH
+        dst = sys.argv[3] if len(sys.argv) >= 4 else os.path.splitext(src)[0] + ".snap"
+        t0 = time.perf_counter()
+        cars = load_cars(src)
+        write_snapshot(cars, dst, source=src)
+        print(f"{len(cars)} annonces -> {dst} ({os.path.getsize(dst) / 1e6:.1f} Mo, {time.perf_counter() - t0:.1f}s)")
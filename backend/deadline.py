@@ -0,0 +1,75 @@
+"""Budget de latence d'une requête, transmis d'étape en étape.
+
+    deadline = Deadline(20.0)
+    data = await deadline.run(client.get(...))          # DeadlineExceeded si dépassé
+    async for chunk in deadline.iterate(stream):         # idem, entre deux éléments
+        ...
+    httpx_timeout = deadline.cap(OLLAMA_TIMEOUT)         # ne jamais attendre plus que le reste
+
+Deadline(None) = pas de budget (comportement précédent).
+
+current_deadline(): le budget dont deadline.run attend l'étape en cours. Une
+annulation sous un budget épuisé vient du budget; sinon c'est le client parti
+ou une tâche sœur annulée (ollama_client ne compte que la première en panne).
+"""
+import asyncio
+import contextvars
+import time
+from typing import AsyncIterator, Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+_CURRENT: "contextvars.ContextVar[Optional[Deadline]]" = contextvars.ContextVar("deadline", default=None)
+
+def current_deadline() -> "Optional[Deadline]":
+    return _CURRENT.get()
+
+
+class Deadline:
+    __slots__ = ("budget", "expires")
+
+    def __init__(self, budget_s: Optional[float]):
+        self.budget = budget_s if budget_s and budget_s > 0 else None
+        self.expires = time.monotonic() + self.budget if self.budget else None
+
+    def remaining(self) -> Optional[float]:
+        """Secondes restantes (None = illimité, 0 = épuisé)."""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def cap(self, timeout: Optional[float]) -> Optional[float]:
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
+
+    async def run(self, aw: Awaitable[T]) -> T:
+        if self.expired():
+            if asyncio.iscoroutine(aw):
+                aw.close()
+            raise DeadlineExceeded("request budget exhausted")
+        token = _CURRENT.set(self)
+        try:
+            return await asyncio.wait_for(aw, self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("request budget exhausted") from None
+        finally:
+            _CURRENT.reset(token)
+
+    async def iterate(self, items: AsyncIterator[T]) -> AsyncIterator[T]:
+        it = items.__aiter__()
+        while True:
+            try:
+                item = await self.run(it.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
@@ -0,0 +1,210 @@
+"""Extraction d'entités en une passe (ville, marque, carburant, boîte, type, budget).
+
+Une seule table de vocabulaire -> une regex compilée une fois. Les formes
+sont factorisées en trie dans la regex, donc le coût reste linéaire en la
+taille du message même avec des milliers de marques/modèles. Le texte est
+comparé sans accents ni majuscules (fold).
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+
+def fold(text: str) -> str:
+    """Minuscules sans accents: "Fès" -> "fes", "Électrique" -> "electrique"."""
+    t = unicodedata.normalize("NFKD", text or "")
+    t = "".join(ch for ch in t if not unicodedata.combining(ch))
+    return t.lower().replace("’", "'")
+
+
+# =========================
+# Vocabulaire (source unique)
+# =========================
+CITIES = [
+    "Casablanca", "Rabat", "Tanger", "Marrakech", "Agadir", "Fès", "Meknès", "Kénitra", "Oujda",
+    "Tétouan", "Safi", "Laâyoune", "Dakhla", "Ouarzazate",
+]
+
+# (entité, valeur canonique, formes)
+# formes exactes: un mot qui ne fait que commencer par une forme n'est pas
+# reconnu ("auto" ne doit pas prendre "automobile" ni "autoroute"), donc les
+# variantes (pluriel, anglais, abréviations) sont listées une par une
+VOCABULARY: List[Tuple[str, str, List[str]]] = [
+    ("fuel", "essence", ["essence"]),
+    ("fuel", "diesel", ["diesel", "gasoil", "gazoil", "gaz oil"]),
+    ("fuel", "hybride", ["hybride", "hybrides", "hybrid", "hybrids"]),
+    ("fuel", "electrique", ["electrique", "electriques", "electric", "elec", "ev"]),
+
+    ("gearbox", "automatique", ["automatique", "automatiques", "auto", "bva",
+                                "boite auto", "boite automatique", "automatic"]),
+    ("gearbox", "manuelle", ["manuelle", "manuelles", "manuel", "bvm",
+                             "boite manuelle", "manual"]),
+
+    ("type", "SUV", ["suv"]),
+    ("type", "berline", ["berline"]),
+    ("type", "citadine", ["citadine"]),
+    ("type", "compacte", ["compacte", "compactes", "compact"]),
+    ("type", "break", ["break"]),
+    ("type", "pickup", ["pickup", "pick-up", "pick up"]),
+    ("type", "coupé", ["coupe"]),
+    ("type", "utilitaire", ["utilitaire"]),
+    ("type", "4x4", ["4x4"]),
+
+    ("brand", "dacia", ["dacia"]),
+    ("brand", "renault", ["renault"]),
+    ("brand", "peugeot", ["peugeot"]),
+    ("brand", "citroen", ["citroen"]),
+    ("brand", "toyota", ["toyota"]),
+    ("brand", "hyundai", ["hyundai"]),
+    ("brand", "kia", ["kia"]),
+    ("brand", "mazda", ["mazda"]),
+    ("brand", "nissan", ["nissan"]),
+    ("brand", "honda", ["honda"]),
+    ("brand", "suzuki", ["suzuki"]),
+    ("brand", "mitsubishi", ["mitsubishi"]),
+    ("brand", "ford", ["ford"]),
+    ("brand", "opel", ["opel"]),
+    ("brand", "fiat", ["fiat"]),
+    ("brand", "skoda", ["skoda"]),
+    ("brand", "volkswagen", ["volkswagen", "vw", "golf"]),
+    ("brand", "tesla", ["tesla"]),
+    ("brand", "mercedes", ["mercedes"]),
+    ("brand", "bmw", ["bmw"]),
+    ("brand", "audi", ["audi"]),
+    ("brand", "porsche", ["porsche"]),
+    ("brand", "range rover", ["range rover"]),
+    ("brand", "ferrari", ["ferrari"]),
+
+    ("any", "ANY", ["peu importe", "pas important", "n'importe", "comme tu veux",
+                    "aucune preference", "sans preference", "no preference", "any"]),
+
+    # mots qui indiquent une question voiture sans être un critère
+    ("intent", "car", ["voiture", "budget", "prix", "moins", "plus"]),
+] + [("city", c, [c]) for c in CITIES] + [
+    ("city", "Marrakech", ["marrakesh"]),
+    ("city", "Fès", ["fez"]),
+]
+
+CRITERIA = ("city", "brand", "fuel", "gearbox", "type")
+
+# budget: "moins de 200000", "max 150 000", "200k", "plus de 100.000 dh"...
+_NUM = r"\d{1,3}(?:[ .,]\d{3})+|\d+"
+# un budget est un montant: milliers groupés, 4 chiffres ou plus, ou une unité
+# ("plus de 5 places", "moins de 3 ans" ne sont pas des budgets)
+_PRICE = r"\d{1,3}(?:[ .,]\d{3})+|\d{4,}|\d+(?=\s*(?:k|mille|dhs?|mad|dirhams?)\b)"
+_BUDGET_MAX = r"moins\s+de|max(?:imum)?|jusqu'?\s*a|budget(?:\s+(?:max(?:imum)?|de))?|sous|<"
+_BUDGET_MIN = r"plus\s+de|au\s+moins|min(?:imum)?|a\s+partir\s+de|>"
+
+
+def _trie_regex(words: List[str]) -> str:
+    """Alternative factorisée en trie: "casa|casablanca" -> "casa(?:blanca)?"."""
+    trie: Dict[str, dict] = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if end else body
+
+    return build(trie)
+
+
+class EntityExtractor:
+    def __init__(self, vocabulary=VOCABULARY):
+        self.exact: Dict[str, Tuple[str, str]] = {}
+        for kind, value, forms in vocabulary:
+            for form in forms:
+                self.exact[fold(form)] = (kind, value)
+
+        words = _trie_regex(sorted(self.exact))
+        self.regex = re.compile(
+            r"(?<!\w)(?:"
+            rf"(?:{_BUDGET_MAX})\s*(?P<max>{_PRICE})(?:\s*(?P<kmax>k|mille)\b)?"
+            rf"|(?:{_BUDGET_MIN})\s*(?P<min>{_PRICE})(?:\s*(?P<kmin>k|mille)\b)?"
+            rf"|(?P<word>{words})(?P<tail>[\w-]*)"
+            rf"|(?P<num>{_NUM})(?:\s*(?P<knum>k|mille)\b)?"
+            r")"
+        )
+
+    def _lookup(self, word: str, tail: str) -> Optional[Tuple[str, str]]:
+        # le mot entier seulement: "automobile" commence par "auto" mais n'en est pas
+        return None if tail else self.exact.get(word)
+
+    def extract(self, text: str) -> "Entities":
+        t = fold(text)
+        found: Dict[str, List] = {}
+        spans = []
+        for m in self.regex.finditer(t):
+            if m.group("word") is not None:
+                hit = self._lookup(m.group("word"), m.group("tail"))
+                if hit is None:
+                    continue
+                kind, value = hit
+            else:
+                for kind, g, k in (("budget_max", "max", "kmax"), ("budget_min", "min", "kmin"),
+                                   ("number", "num", "knum")):
+                    if m.group(g) is not None:
+                        value = _parse_number(m.group(g), m.group(k))
+                        break
+            found.setdefault(kind, []).append(value)
+            if kind != "intent":
+                spans.append(m.span())
+
+        rest = t
+        for a, b in reversed(spans):
+            rest = rest[:a] + " " + rest[b:]
+        return Entities(found, rest)
+
+
+def _parse_number(digits: str, unit: Optional[str]) -> int:
+    n = int(re.sub(r"[ .,]", "", digits))
+    return n * 1000 if unit else n
+
+
+class Entities:
+    """Résultat d'extraction (lecture seule). Valeurs dans l'ordre du texte."""
+    __slots__ = ("found", "rest")
+
+    def __init__(self, found: Dict[str, List], rest: str):
+        self.found = found
+        self.rest = rest  # texte (fold) sans les critères reconnus
+
+    def all(self, kind: str) -> List:
+        return list(self.found.get(kind, ()))
+
+    def first(self, kind: str):
+        v = self.found.get(kind)
+        return v[0] if v else None
+
+    def has(self, kind: str) -> bool:
+        return kind in self.found
+
+    @property
+    def budget_max(self) -> Optional[int]:
+        return self.first("budget_max")
+
+    @property
+    def budget_min(self) -> Optional[int]:
+        return self.first("budget_min")
+
+    def numbers(self) -> List[int]:
+        return self.all("budget_max") + self.all("budget_min") + self.all("number")
+
+    def is_car_question(self) -> bool:
+        return any(k in self.found for k in CRITERIA + ("budget_max", "budget_min", "intent"))
+
+
+EXTRACTOR = EntityExtractor()
+
+@lru_cache(maxsize=4096)
+def extract(text: str) -> Entities:
+    """Toutes les entités du message en une passe (résultat mis en cache)."""
+    return EXTRACTOR.extract(text or "")
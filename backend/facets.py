@@ -0,0 +1,182 @@
+"""Comptes par facette sur l'ensemble des annonces candidates.
+
+Pour chaque valeur des champs de facette on garde un bitmap (tableau
+booléen NumPy) des annonces qui l'ont. Les candidats d'un jeu de slots
+sont le ET des bitmaps des filtres; les comptes par valeur sont un
+bincount des codes des candidats. Les bitmaps sont créés à la demande et
+tenus à jour à chaque modification d'annonce (CarCatalog.subscribe).
+
+Les comptes servent à l'interface (réponse de /chat) et à la politique de
+questions: un slot dont les candidats n'ont qu'une valeur ne peut pas
+réduire le résultat, on ne le demande pas; sinon on demande d'abord le
+slot dont la réponse sépare le mieux les candidats (entropie maximale).
+"""
+import math
+import threading
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from catalog import CATALOG, CarCatalog, get_catalog
+
+# slot (llm_chat) -> champ du catalogue
+FACET_FIELDS = {"type": "type", "fuel": "fuel", "gearbox": "gearbox", "city": "city"}
+# bornes hautes des tranches de prix (MAD); au-delà: dernière tranche
+PRICE_BUCKETS = (50_000, 100_000, 150_000, 200_000, 300_000, 500_000)
+
+
+def _bucket_labels() -> List[str]:
+    bounds = (0,) + PRICE_BUCKETS
+    labels = [f"{lo}-{hi}" for lo, hi in zip(bounds, bounds[1:])]
+    return labels + [f"{PRICE_BUCKETS[-1]}+"]
+
+
+def entropy(counts: Sequence[int]) -> float:
+    """Entropie (bits) de la répartition des candidats entre les valeurs."""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    return -sum(c / total * math.log2(c / total) for c in counts if c)
+
+
+def filter_dimensions(filters: Dict[str, Any]) -> List[tuple]:
+    """slot_filters -> un tuple par filtre (dimension indépendante des autres)."""
+    dims = [("exact", f, v) for f, v in (filters.get("exact") or {}).items()]
+    dims += [("contains", f, v) for f, v in (filters.get("contains") or {}).items()]
+    if filters.get("price_max"):
+        dims.append(("price_max", filters["price_max"]))
+    return dims
+
+
+# =========================
+# Colonnes + bitmaps d'un catalogue
+# =========================
+class FacetIndex:
+    def __init__(self, catalog: CarCatalog):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._bitmaps: Dict[tuple, np.ndarray] = {}
+        self._load()
+        catalog.subscribe(self._on_change)
+
+    def _load(self) -> None:
+        catalog = self.catalog
+        self.size = len(catalog)
+        self.alive = np.array([c is not None for c in catalog.cars], dtype=bool)
+        self.codes = {f: np.array(catalog.codes[f], dtype=np.int32) for f in FACET_FIELDS.values()}
+        prices = [p if self._priced(p) else None for p in catalog.prices]
+        self.priced = np.array([p is not None for p in prices], dtype=bool)
+        self.price = np.array([p or 0 for p in prices], dtype=np.float64)
+        self.price_bucket = np.where(
+            self.priced, np.searchsorted(PRICE_BUCKETS, self.price, side="left"), -1
+        ).astype(np.int32)
+        self._bitmaps.clear()
+
+    @staticmethod
+    def _priced(p) -> bool:
+        # même règle que CarCatalog: sans prix (ou 0) => passe le filtre budget
+        return isinstance(p, (int, float)) and not isinstance(p, bool) and bool(p)
+
+    def _on_change(self, catalog: CarCatalog, car_id: int) -> None:
+        with self._lock:
+            if car_id >= self.size:
+                self._load()  # annonce ajoutée: colonnes reconstruites
+                return
+            self.alive[car_id] = catalog.cars[car_id] is not None
+            for field, col in self.codes.items():
+                old, new = col[car_id], catalog.codes[field][car_id]
+                col[car_id] = new
+                for code, present in ((old, False), (new, True)):
+                    bitmap = self._bitmaps.get((field, int(code)))
+                    if bitmap is not None:
+                        bitmap[car_id] = present
+            p = catalog.prices[car_id]
+            self.priced[car_id] = self._priced(p)
+            self.price[car_id] = p if self.priced[car_id] else 0
+            self.price_bucket[car_id] = int(np.searchsorted(PRICE_BUCKETS, p)) if self.priced[car_id] else -1
+
+    # -------- bitmaps et candidats --------
+    def bitmap(self, field: str, code: int) -> np.ndarray:
+        key = (field, code)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            bitmap = self._bitmaps[key] = self.codes[field] == code
+        return bitmap
+
+    def value_mask(self, field: str, value: str, contains: bool) -> np.ndarray:
+        codes = self.catalog.codes_for(field, value, contains)
+        mask = np.zeros(self.size, dtype=bool)
+        for code in codes:
+            mask |= self.bitmap(field, code)
+        return mask
+
+    def dimension(self, dim: tuple) -> np.ndarray:
+        """Masque d'un seul filtre: ("exact"|"contains", champ, valeur) ou ("price_max", prix)."""
+        if dim[0] == "price_max":
+            return ~self.priced | (self.price <= dim[1])
+        kind, field, value = dim
+        return self.value_mask(field, value, kind == "contains")
+
+    def masks(self, dims: Sequence[tuple]) -> List[np.ndarray]:
+        with self._lock:
+            return [self.dimension(d) for d in dims]
+
+    def candidates(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Masque des annonces qui passent slot_filters (mêmes règles que select)."""
+        with self._lock:
+            mask = self.alive.copy()
+            for dim in filter_dimensions(filters):
+                mask &= self.dimension(dim)
+            return mask
+
+    # -------- comptes --------
+    def labels(self, field: str) -> List[str]:
+        """Libellé de chaque code: la valeur telle qu'écrite dans la première annonce."""
+        cars, postings = self.catalog.cars, self.catalog.postings[field]
+        return [cars[p[0]][field] if p else k for k, p in zip(self.catalog.keys[field], postings)]
+
+    def counts(self, mask: np.ndarray) -> Dict[str, Dict[str, int]]:
+        """slot -> {valeur: nombre de candidats}, tranches de prix pour price_max.
+        mask: masque booléen ou tableau d'ids des candidats."""
+        out: Dict[str, Dict[str, int]] = {}
+        for slot, field in FACET_FIELDS.items():
+            codes = self.codes[field][mask]
+            n = np.bincount(codes[codes >= 0], minlength=len(self.catalog.keys[field]))
+            out[slot] = {label: int(c) for label, c in zip(self.labels(field), n) if c}
+        buckets = self.price_bucket[mask]
+        n = np.bincount(buckets[buckets >= 0], minlength=len(PRICE_BUCKETS) + 1)
+        out["price_max"] = {label: int(c) for label, c in zip(_bucket_labels(), n) if c}
+        return out
+
+
+# catalogue en service + celui en préparation pendant un rechargement
+_FACETS: List[FacetIndex] = []
+
+def get_facets(catalog: Optional[CarCatalog] = None) -> FacetIndex:
+    catalog = catalog or get_catalog()
+    for f in _FACETS:
+        if f.catalog is catalog:
+            return f
+    f = FacetIndex(catalog)
+    _FACETS[:] = [*_FACETS[-1:], f]
+    return f
+
+CATALOG.on_reload(lambda old, new: get_facets(new))
+
+
+def facet_counts(filters: Dict[str, Any]) -> Tuple[int, Dict[str, Dict[str, int]]]:
+    """(nombre de candidats, comptes par slot) pour des filtres slot_filters."""
+    facets = get_facets()
+    mask = facets.candidates(filters)
+    return int(mask.sum()), facets.counts(mask)
+
+
+def most_informative(unset: Sequence[str], counts: Dict[str, Dict[str, int]]) -> Optional[str]:
+    """Slot à demander parmi `unset` (ordre = départage): entropie maximale;
+    None si aucun ne peut réduire les candidats."""
+    best, best_h = None, 0.0
+    for slot in unset:
+        h = entropy(list(counts.get(slot, {}).values()))
+        if h > best_h + 1e-9:
+            best, best_h = slot, h
+    return best
@@ -0,0 +1,171 @@
+"""Faux serveur Ollama pour les tests de charge (aucun modèle chargé).
+
+/api/generate et /api/chat répondent un JSON LLMResponse plausible: il reprend les slots
+du prompt et y ajoute ce que l'extracteur trouve dans le message. Une
+fraction des réponses est volontairement invalide (JSON tronqué) pour
+exercer la relance de chat_turn. La latence suit une distribution
+configurable:
+
+    const:0.5  uniform:0.2,1.5  normal:0.8,0.2  lognormal:-0.5,0.6  exp:0.8
+
+    python fake_ollama.py --port 11434 --latency lognormal:-0.5,0.6 --malformed 0.05
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, Optional
+
+import entities
+
+SLOTS_RE = re.compile(r"Slots actuels \(JSON\):\s*(\{.*?\})\s*\n", re.DOTALL)
+MESSAGE_RE = re.compile(r"Message utilisateur:\s*\n(.*?)(?:\n\s*\n|\Z)", re.DOTALL)
+TOKEN_SIZE = 12  # caractères par chunk en mode stream
+
+
+def latency_sampler(spec: str, seed: Optional[int] = None) -> Callable[[], float]:
+    """"kind:a,b" -> fonction qui tire une latence (s, >= 0)."""
+    rng = random.Random(seed)
+    kind, _, args = spec.partition(":")
+    a = [float(x) for x in args.split(",") if x]
+    draws = {
+        "const": lambda: a[0],
+        "uniform": lambda: rng.uniform(a[0], a[1]),
+        "normal": lambda: rng.gauss(a[0], a[1]),
+        "lognormal": lambda: rng.lognormvariate(a[0], a[1]),
+        "exp": lambda: rng.expovariate(1 / a[0]),
+    }
+    if kind not in draws:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    draw = draws[kind]
+    return lambda: max(0.0, draw())
+
+
+def fake_answer(prompt: str) -> Dict[str, Any]:
+    """Ce qu'un modèle raisonnable répondrait: slots du prompt + entités du message."""
+    m = SLOTS_RE.search(prompt)
+    try:
+        slots = json.loads(m.group(1)) if m else {}
+    except ValueError:
+        slots = {}
+    m = MESSAGE_RE.search(prompt)
+    e = entities.extract(m.group(1) if m else "")
+    for slot in ("type", "fuel", "gearbox", "city"):
+        if e.has(slot):
+            slots[slot] = e.first(slot)
+    numbers = e.numbers()
+    if numbers:
+        slots["price_max"] = numbers[0]
+    if e.has("any") and slots:
+        # "peu importe" => premier slot encore vide
+        for k, v in slots.items():
+            if v == "UNSET":
+                slots[k] = "ANY"
+                break
+    return {"updated_slots": slots, "done": "UNSET" not in slots.values()}
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send(200, json.dumps({"models": [{"name": self.server.model}]}).encode())
+        else:
+            self._send(404, b"{}")
+
+    def do_POST(self):
+        srv = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        if self.path == "/api/embed":
+            n = len(body.get("input") or [])
+            self._send(200, json.dumps({"embeddings": [[0.0] * srv.embed_dim for _ in range(n)]}).encode())
+            return
+        if self.path == "/api/chat":
+            messages = body.get("messages") or []
+            prompt = messages[-1].get("content", "") if messages else ""
+            full = "\n".join(m.get("content", "") for m in messages)
+            wrap = lambda t: {"message": {"role": "assistant", "content": t}}
+        elif self.path == "/api/generate":
+            prompt = body.get("prompt", "")
+            full = prompt
+            wrap = lambda t: {"response": t}
+        else:
+            self._send(404, b"{}")
+            return
+
+        text = json.dumps(fake_answer(prompt), ensure_ascii=False)
+        with srv.lock:
+            # comme le KV cache d'Ollama: seul ce qui suit le préfixe commun avec
+            # l'appel précédent est évalué
+            common = os.path.commonprefix([srv.kv, full])
+            prompt_chars = len(full) - len(common)
+            srv.kv = full + text
+            srv.calls += 1
+            malformed = srv.rng.random() < srv.malformed
+            if malformed:
+                srv.malformed_sent += 1
+            delay = srv.latency()
+        if malformed:
+            text = text[: len(text) // 2]  # JSON tronqué
+        time.sleep(delay)
+
+        done = {"done": True, "prompt_eval_count": prompt_chars // 4,
+                "eval_count": len(text) // 4, "total_duration": int(delay * 1e9)}
+        if not body.get("stream"):
+            self._send(200, json.dumps({"model": body.get("model"), **wrap(text), **done}).encode())
+            return
+
+        lines = [json.dumps({**wrap(text[i:i + TOKEN_SIZE]), "done": False}) for i in range(0, len(text), TOKEN_SIZE)]
+        lines.append(json.dumps({**wrap(""), **done}))
+        self._send(200, ("\n".join(lines) + "\n").encode(), "application/x-ndjson")
+
+
+def start(port: int = 11434, latency: str = "const:0", malformed: float = 0.0,
+          seed: Optional[int] = None, model: str = "fake") -> ThreadingHTTPServer:
+    """Démarre le serveur dans un thread (daemon). srv.shutdown() pour l'arrêter."""
+    srv = ThreadingHTTPServer(("127.0.0.1", port), FakeOllamaHandler)
+    srv.daemon_threads = True
+    srv.latency = latency_sampler(latency, seed)
+    srv.malformed = malformed
+    srv.rng = random.Random(seed)
+    srv.lock = threading.Lock()
+    srv.calls = 0
+    srv.kv = ""
+    srv.malformed_sent = 0
+    srv.embed_dim = 8
+    srv.model = model
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Faux serveur Ollama")
+    ap.add_argument("--port", type=int, default=11434)
+    ap.add_argument("--latency", default="lognormal:-0.5,0.6")
+    ap.add_argument("--malformed", type=float, default=0.05)
+    ap.add_argument("--seed", type=int)
+    args = ap.parse_args()
+
+    srv = start(args.port, args.latency, args.malformed, args.seed)
+    print(f"fake ollama on http://127.0.0.1:{srv.server_port} (latency {args.latency}, malformed {args.malformed})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,383 @@
+"""Recherche tolérante aux fautes: marques, modèles et villes ("mercedez",
+"peugot", "casa", "marakech").
+
+Index SymSpell: pour chaque terme connu on précalcule les variantes obtenues
+en supprimant jusqu'à 2 lettres. Une requête génère ses propres suppressions
+et n'est comparée (distance de Damerau-Levenshtein restreinte) qu'aux termes
+qui partagent une variante: quelques dizaines d'accès dict, sans parcourir
+le vocabulaire. Résultat déterministe: plus petite distance, puis terme le
+plus fréquent dans le catalogue, puis ordre alphabétique.
+
+Termes: valeurs brand / model / city du catalogue, formes marque/ville du
+vocabulaire d'entities et ALIASES; un modèle est aussi indexé sans sa
+marque ni son numéro de génération ("Renault Clio 4" -> "clio 4", "clio").
+Distance tolérée selon la longueur (comme SymSpell): 0 jusqu'à 5 lettres
+("paris" n'est pas "yaris"), 1 jusqu'à 7, 2 au-delà.
+confidence = 1 - distance / longueur (1.0 pour une forme exacte ou un alias);
+une correction n'est retenue qu'au-dessus de FUZZY_MIN_CONFIDENCE (strict).
+Les modèles qui sont aussi des mots courants ("ranger", "fiesta", "rio")
+ne comptent qu'avec une marque ou un critère voiture dans le message.
+
+L'index suit le catalogue: annonces ajoutées (subscribe) et rechargement du
+fichier (CATALOG.on_reload).
+"""
+import os
+import re
+import threading
+from typing import Dict, Any, List, Optional, Sequence, Set, Tuple
+
+import entities
+from catalog import CATALOG, CarCatalog, get_catalog
+from entities import fold
+
+# une correction n'est appliquée automatiquement qu'au-dessus (strictement)
+FUZZY_MIN_CONFIDENCE = float(os.environ.get("FUZZY_MIN_CONFIDENCE", "0.8"))
+MAX_DISTANCE = 2
+# recherches mémorisées par index (vidé quand un terme est ajouté)
+FUZZY_CACHE_SIZE = int(os.environ.get("FUZZY_CACHE_SIZE", "10000"))
+KINDS = ("city", "brand", "model")
+
+# surnoms et graphies courantes (forme -> (kind, valeur))
+ALIASES: Dict[str, Tuple[str, str]] = {
+    "casa": ("city", "Casablanca"),
+    "kaza": ("city", "Casablanca"),
+    "dar el beida": ("city", "Casablanca"),
+    "marrakesh": ("city", "Marrakech"),
+    "kech": ("city", "Marrakech"),
+    "fez": ("city", "Fès"),
+    "tanja": ("city", "Tanger"),
+    "tangier": ("city", "Tanger"),
+    "tangiers": ("city", "Tanger"),
+    "tetuan": ("city", "Tétouan"),
+    "el aaiun": ("city", "Laâyoune"),
+    "benz": ("brand", "mercedes"),
+    "mercedes-benz": ("brand", "mercedes"),
+    "mercedes benz": ("brand", "mercedes"),
+    "merco": ("brand", "mercedes"),
+    "vw": ("brand", "volkswagen"),
+    "volks": ("brand", "volkswagen"),
+    "beemer": ("brand", "bmw"),
+    "citro": ("brand", "citroen"),
+}
+
+# mots courants à ne jamais corriger ("fait" -> "fiat", "mais" -> "mazda"...)
+COMMON_WORDS = {
+    "fait", "faire", "mais", "plus", "pour", "avec", "dans", "sans", "tres", "bien", "bonne",
+    "cher", "chere", "moins", "veux", "voudrais", "cherche", "besoin", "voiture", "voitures",
+    "auto", "ville", "prix", "budget", "merci", "bonjour", "salut", "quel", "quelle", "comme",
+    "aussi", "alors", "petit", "petite", "grand", "grande", "neuve", "neuf", "occasion",
+    "familiale", "famille", "marque", "modele", "annee", "peux", "cette", "entre", "vers",
+    "chez", "tout", "toute", "rien", "encore", "autre", "avoir", "etre", "sont", "mode",
+    "model", "place", "places", "porte", "portes", "plutot", "importe", "propose", "donne",
+    "sport", "sportive", "sportif", "fiable", "recente", "recent", "rouge", "noire", "blanche",
+}
+
+# modèles (sans la marque) qui sont aussi des mots ou noms courants:
+# "ranger la chambre", "fiesta ce soir", "rio de janeiro"
+ORDINARY_MODELS = {
+    "ranger", "fiesta", "rio", "partner", "polo", "swift", "leaf", "zoe", "civic",
+    "captur", "model", "model 3", "golf", "note", "jazz", "ioniq electric",
+}
+
+_TOKEN_RE = re.compile(r"[\w-]+")
+_GENERATION_RE = re.compile(r"^(.*[a-z].*?)\s+(?:\d+|i{1,3}|iv|v|vi{1,3})$")
+
+
+def max_distance(length: int) -> int:
+    return 0 if length <= 5 else 1 if length <= 7 else MAX_DISTANCE
+
+
+def deletes(word: str, depth: int) -> Set[str]:
+    """Le mot et toutes ses variantes à `depth` suppressions au plus."""
+    out = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - out
+        out |= frontier
+    return out
+
+
+def osa_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein restreinte (transposition de lettres voisines = 1).
+    Rend limit + 1 dès que la distance dépasse limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def is_ordinary_model(m: "FuzzyMatch") -> bool:
+    """Modèle reconnu par un mot courant seul ("ranger"; pas "ford ranger")."""
+    if m.kind != "model":
+        return False
+    short = fold(m.value)
+    if m.brand and short.startswith(fold(m.brand) + " "):
+        short = short[len(m.brand) + 1:]
+    if m.text.count(" ") > short.count(" "):
+        return False  # la marque fait partie du texte reconnu
+    return short in ORDINARY_MODELS or _GENERATION_RE.sub(r"\1", short) in ORDINARY_MODELS
+
+
+class FuzzyMatch:
+    """Terme reconnu: kind (city, brand, model), valeur canonique, marque
+    (pour un modèle), confiance, distance et texte (fold) du message."""
+    __slots__ = ("kind", "value", "brand", "confidence", "distance", "text")
+
+    def __init__(self, kind: str, value: str, brand: Optional[str], confidence: float, distance: int, text: str):
+        self.kind = kind
+        self.value = value
+        self.brand = brand
+        self.confidence = confidence
+        self.distance = distance
+        self.text = text
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"FuzzyMatch({self.kind}={self.value!r}, confidence={self.confidence}, text={self.text!r})"
+
+
+# =========================
+# Index d'un catalogue
+# =========================
+class FuzzyIndex:
+    def __init__(self, catalog: CarCatalog):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self.terms: List[str] = []
+        # terme -> {(kind, valeur fold): [kind, valeur, marque, poids]}
+        self.entries: List[Dict[Tuple[str, str], list]] = []
+        self._ids: Dict[str, int] = {}
+        self._variants: Dict[str, List[int]] = {}
+        # premiers mots des termes en plusieurs mots ("range" de "range rover")
+        self._head_variants: Set[str] = set()
+        self._cache: Dict[Tuple[str, Tuple[str, ...]], Any] = {}
+        self.max_words = 1
+        self._build()
+        catalog.subscribe(self._on_change)
+
+    def _build(self) -> None:
+        for kind, value, forms in entities.VOCABULARY:
+            if kind in ("city", "brand"):
+                for form in forms:
+                    self.add(form, kind, value)
+        for form, (kind, value) in ALIASES.items():
+            self.add(form, kind, value)
+        for c in self.catalog.cars:
+            if c is not None:
+                self.add_car(c)
+
+    def _canonical_city(self, city: str) -> str:
+        # même graphie que entities.CITIES quand elle existe (slots de llm_chat)
+        k = fold(city)
+        for c in entities.CITIES:
+            if fold(c) == k:
+                return c
+        return city
+
+    def add_car(self, c: Dict[str, Any]) -> None:
+        brand, model, city = c.get("brand"), c.get("model"), c.get("city")
+        if isinstance(city, str) and city:
+            self.add(city, "city", self._canonical_city(city), weight=1)
+        if isinstance(brand, str) and brand:
+            self.add(brand, "brand", brand, weight=1)
+        if isinstance(model, str) and model:
+            self.add(model, "model", model, brand, weight=1)
+            # "Dacia Logan" -> aussi "logan"; "Renault Clio 4" -> "clio 4" et "clio"
+            short = fold(model)
+            if isinstance(brand, str) and short.startswith(fold(brand) + " "):
+                short = short[len(brand) + 1:]
+                self.add(short, "model", model, brand, weight=1)
+            m = _GENERATION_RE.match(short)
+            if m and m.group(1) not in COMMON_WORDS:
+                self.add(m.group(1), "model", model, brand, weight=1)
+
+    def add(self, form: str, kind: str, value: str, brand: Optional[str] = None, weight: int = 0) -> None:
+        term = " ".join(_TOKEN_RE.findall(fold(form)))
+        if not term:
+            return
+        with self._lock:
+            tid = self._ids.get(term)
+            if tid is None:
+                tid = self._ids[term] = len(self.terms)
+                self.terms.append(term)
+                self.entries.append({})
+                self.max_words = max(self.max_words, term.count(" ") + 1)
+                for v in deletes(term, max_distance(len(term))):
+                    self._variants.setdefault(v, []).append(tid)
+                if " " in term:
+                    head = term.split(" ", 1)[0]
+                    self._head_variants |= deletes(head, max_distance(len(head)))
+                self._cache.clear()
+            key = (kind, fold(value))
+            entry = self.entries[tid].get(key)
+            if entry is None:
+                self.entries[tid][key] = [kind, value, brand if kind == "model" else None, weight]
+            else:
+                entry[3] += weight
+
+    def _on_change(self, catalog: CarCatalog, car_id: int) -> None:
+        # nouvelles valeurs seulement: un terme sans annonce reste (inoffensif)
+        c = catalog.cars[car_id]
+        if c is not None:
+            self.add_car(c)
+
+    # -------- recherche --------
+    def lookup(self, text: str, kinds: Sequence[str] = KINDS) -> Optional[FuzzyMatch]:
+        """Meilleur terme pour `text` (un mot ou une expression), None si aucun."""
+        q = " ".join(_TOKEN_RE.findall(fold(text)))
+        if not q:
+            return None
+        return self.match(q, tuple(kinds))
+
+    def match(self, q: str, kinds: Tuple[str, ...] = KINDS) -> Optional[FuzzyMatch]:
+        """lookup d'un texte déjà normalisé (fold, mots séparés par une espace)."""
+        key = (q, kinds)
+        if key in self._cache:
+            return self._cache[key]
+        return self._remember(key, self._lookup(q, kinds))
+
+    def _remember(self, key: tuple, value):
+        if len(self._cache) >= FUZZY_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[key] = value
+        return value
+
+    def _lookup(self, q: str, kinds: Sequence[str]) -> Optional[FuzzyMatch]:
+        tid = self._ids.get(q)
+        if tid is not None and self._best(tid, kinds) is not None:
+            return self._match(tid, kinds, 0, q)
+
+        # suppressions niveau par niveau: une distance d trouvée dispense
+        # des niveaux > d (elles ne peuvent donner que plus loin)
+        candidates: List[Tuple[int, int]] = []
+        seen: Set[int] = set()
+        level = {q}
+        explored = {q}
+        for depth in range(max_distance(len(q)) + 1):
+            if depth:
+                level = {w[:i] + w[i + 1:] for w in level for i in range(len(w))} - explored
+                explored |= level
+            for v in level:
+                for tid in self._variants.get(v, ()):
+                    if tid in seen:
+                        continue
+                    seen.add(tid)
+                    term = self.terms[tid]
+                    limit = max_distance(min(len(q), len(term)))
+                    d = osa_distance(q, term, limit)
+                    if d <= limit and self._best(tid, kinds) is not None:
+                        candidates.append((d, tid))
+            if candidates and min(d for d, _ in candidates) <= depth:
+                break
+        if not candidates:
+            return None
+        ranked = sorted(candidates, key=lambda t: (t[0], -self._best(t[1], kinds)[3], self.terms[t[1]]))
+        d, tid = ranked[0]
+        match = self._match(tid, kinds, d, q)
+        # autre valeur à la même distance: on ne sait pas trancher
+        for d2, tid2 in ranked[1:]:
+            if d2 > d:
+                break
+            other = self._best(tid2, kinds)
+            if other[0] == match.kind and fold(other[1]) != fold(match.value):
+                match.confidence = round(match.confidence / 2, 3)
+                break
+        return match
+
+    def _best(self, tid: int, kinds: Sequence[str]) -> Optional[list]:
+        best = None
+        for entry in self.entries[tid].values():
+            if entry[0] in kinds and (best is None or (entry[3], -KINDS.index(entry[0])) > (best[3], -KINDS.index(best[0]))):
+                best = entry
+        return best
+
+    def _match(self, tid: int, kinds: Sequence[str], d: int, q: str) -> FuzzyMatch:
+        kind, value, brand, _ = self._best(tid, kinds)
+        confidence = round(1 - d / max(len(q), len(self.terms[tid])), 3)
+        return FuzzyMatch(kind, value, brand if kind == "model" else value if kind == "brand" else None,
+                          confidence, d, q)
+
+    def find(self, text: str, kinds: Sequence[str] = KINDS,
+             min_confidence: float = FUZZY_MIN_CONFIDENCE, car_context: bool = False) -> List[FuzzyMatch]:
+        """Termes du message (fold), expressions les plus longues d'abord, sans
+        chevauchement. Mots courants et nombres seuls ne sont jamais corrigés.
+        Un modèle de ORDINARY_MODELS n'est gardé qu'avec car_context (le message
+        parle de voiture) ou une marque reconnue dans text."""
+        kinds = tuple(kinds)
+        words = _TOKEN_RE.findall(fold(text))
+        used = [False] * len(words)
+        found: List[Tuple[int, FuzzyMatch]] = []
+        for n in range(min(self.max_words, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                span = words[i:i + n]
+                if any(used[i:i + n]) or span[0] in COMMON_WORDS or span[-1] in COMMON_WORDS:
+                    continue
+                if n == 1 and span[0].isdigit():
+                    continue
+                if n > 1 and not self._may_start_phrase(span[0]):
+                    continue
+                m = self.match(" ".join(span), kinds)
+                if m is not None and (m.distance == 0 or m.confidence > min_confidence):
+                    found.append((i, m))
+                    used[i:i + n] = [True] * n
+        if not car_context and not any(m.kind == "brand" for _, m in found):
+            found = [(i, m) for i, m in found if not is_ordinary_model(m)]
+        return [m for _, m in sorted(found, key=lambda t: t[0])]
+
+    def _may_start_phrase(self, word: str) -> bool:
+        """Filtre rapide: le mot est-il proche d'un premier mot de terme composé ?"""
+        key = (word, ("head",))
+        if key in self._cache:
+            return self._cache[key]
+        return self._remember(key, any(v in self._head_variants for v in deletes(word, max_distance(len(word)))))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"terms": len(self.terms), "variants": len(self._variants), "cached": len(self._cache)}
+
+
+# catalogue en service + celui en préparation pendant un rechargement
+_FUZZY: List[FuzzyIndex] = []
+_FUZZY_LOCK = threading.Lock()
+
+def get_fuzzy(catalog: Optional[CarCatalog] = None) -> FuzzyIndex:
+    catalog = catalog or get_catalog()
+    for f in _FUZZY:
+        if f.catalog is catalog:
+            return f
+    with _FUZZY_LOCK:
+        for f in _FUZZY:
+            if f.catalog is catalog:
+                return f
+        f = FuzzyIndex(catalog)
+        _FUZZY[:] = [*_FUZZY[-1:], f]
+        return f
+
+CATALOG.on_reload(lambda old, new: get_fuzzy(new))
+
+
+def stats() -> Dict[str, Any]:
+    return _FUZZY[-1].stats() if _FUZZY else {"terms": 0}
+
+
+def resolve(text: str, kind: str) -> Optional[FuzzyMatch]:
+    """Premier terme de type `kind` reconnu avec assez de confiance dans le
+    reste du message (ce que entities n'a pas déjà reconnu). kind="brand"
+    accepte aussi un modèle (sa marque est dans .brand)."""
+    e = entities.extract(text or "")
+    for m in get_fuzzy().find(e.rest, KINDS, car_context=e.is_car_question()):
+        if m.kind == kind or (kind == "brand" and m.kind == "model"):
+            return m
+    return None
@@ -0,0 +1,85 @@
+"""Lecture incrémentale d'un objet JSON au fil des tokens du LLM.
+
+On suit la profondeur des accolades (en ignorant celles des chaînes) pour
+savoir dès le dernier token utile que l'objet est fermé, sans attendre la
+fin de la génération. Les valeurs objet/tableau des clés de premier niveau
+sont exposées dès leur fermeture (members), pour les valider avant la fin.
+
+    reader = JsonObjectStream()
+    for tok in tokens:
+        if reader.feed(tok):
+            break
+    data = json.loads(reader.object_text)
+"""
+from typing import Dict, Optional
+
+
+class JsonObjectStream:
+    def __init__(self):
+        self.text = ""                      # tout ce qui a été reçu
+        self.start: Optional[int] = None    # position du "{" de premier niveau
+        self.end: Optional[int] = None      # position après la "}" fermante
+        self.members: Dict[str, str] = {}   # clé de 1er niveau -> texte de la valeur objet/tableau
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._last_str = None
+        self._key = None
+        self._value_start = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    @property
+    def object_text(self) -> Optional[str]:
+        return self.text[self.start:self.end] if self.complete else None
+
+    def feed(self, chunk: str) -> bool:
+        """Ajoute un morceau; True dès que l'objet de premier niveau est fermé."""
+        if self.complete:
+            return True
+        offset = len(self.text)
+        self.text += chunk
+        for i, ch in enumerate(chunk, offset):
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    if self._depth == 1:
+                        self._last_str = self.text[self._str_start + 1:i]
+            elif ch == '"':
+                if self._depth:
+                    self._in_str = True
+                    self._str_start = i
+            elif ch in "{[":
+                if self._depth == 0:
+                    if ch == "[":
+                        continue  # on ne cherche qu'un objet
+                    self.start = i
+                elif self._depth == 1:
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if not self._depth:
+                    continue
+                self._depth -= 1
+                if self._depth == 1 and self._key is not None:
+                    self.members[self._key] = self.text[self._value_start:i + 1]
+                elif self._depth == 0:
+                    self.end = i + 1
+                    return True
+            elif ch == ":" and self._depth == 1:
+                self._key = self._last_str
+        return False
+
+
+def first_json_object(text: str) -> Optional[str]:
+    """Premier objet JSON équilibré du texte (None s'il n'est pas fermé)."""
+    reader = JsonObjectStream()
+    reader.feed(text or "")
+    return reader.object_text
@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# =========================
+# CONFIG
+# =========================
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "10000"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "86400"))
+# chemin SQLite partagé entre workers (vide = mémoire seulement)
+LLM_CACHE_DB = os.environ.get("LLM_CACHE_DB", "")
+# nb max de réponses gardées sur disque
+LLM_CACHE_DB_SIZE = int(os.environ.get("LLM_CACHE_DB_SIZE", "100000"))
+
+
+def normalize_message(msg: str) -> str:
+    t = (msg or "").lower().strip()
+    t = re.sub(r"\s+", " ", t)
+    return t.strip(" .!?,;")
+
+def make_key(
+        slots: Dict[str, Any],
+        last_asked: Optional[str],
+        message: str,
+        model: str,
+        options: Dict[str, Any],
+) -> str:
+    raw = json.dumps(
+        [slots, last_asked, normalize_message(message), model, options],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# =========================
+# Backend disque (SQLite WAL)
+# =========================
+class SQLiteCacheBackend:
+    PURGE_EVERY = 256  # nettoyage TTL/cap toutes les N écritures
+
+    def __init__(self, path: str, max_entries: int = LLM_CACHE_DB_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires ON llm_cache (expires)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        """(valeur, expiration) si l'entrée existe et n'a pas expiré."""
+        row = self._conn().execute(
+            "SELECT value, expires FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < now:
+            return None
+        return row[0], row[1]
+
+    def set(self, key: str, value: str, expires: float) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, value, expires),
+        )
+        conn.commit()
+        with self._writes_lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            self.purge(time.time())
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def purge(self, now: float) -> int:
+        """Supprime les entrées expirées puis, au-delà de max_entries, les plus
+        anciennes écritures (même TTL pour toutes: expires croît avec l'écriture)."""
+        conn = self._conn()
+        expired = conn.execute("DELETE FROM llm_cache WHERE expires < ?", (now,)).rowcount
+        evicted = 0
+        extra = len(self) - self.max_entries
+        if extra > 0:
+            evicted = conn.execute(
+                "DELETE FROM llm_cache WHERE key IN"
+                " (SELECT key FROM llm_cache ORDER BY expires LIMIT ?)", (extra,)
+            ).rowcount
+        conn.commit()
+        self.expired += expired
+        self.evicted += evicted
+        return expired + evicted
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "entries": len(self), "expired": self.expired, "evicted": self.evicted}
+
+
+# =========================
+# Cache LRU + TTL (+ disque optionnel)
+# =========================
+class LLMCache:
+    """Réponses brutes du LLM par clé make_key().
+
+    Mémoire: LRU bornée en nombre d'entrées et en octets, expiration TTL.
+    Si un backend disque est fourni, il sert de second niveau (survit aux
+    redémarrages, partagé entre workers)."""
+
+    def __init__(
+            self,
+            max_entries: int = LLM_CACHE_SIZE,
+            max_bytes: int = LLM_CACHE_MAX_BYTES,
+            ttl: float = LLM_CACHE_TTL,
+            backend: Optional[SQLiteCacheBackend] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.backend = backend
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key) + len(value.encode("utf-8"))
+
+    def _drop(self, key: str) -> None:
+        _, value = self._data.pop(key)
+        self._bytes -= self._size(key, value)
+
+    def _put(self, key: str, value: str, expires: float) -> None:
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = (expires, value)
+        self._bytes += self._size(key, value)
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._data)))
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if item[0] >= now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                self._drop(key)
+                self.expired += 1
+
+        if self.backend is not None:
+            row = self.backend.get(key, now)
+            if row is not None:
+                value, expires = row
+                # remonte en mémoire avec son expiration d'origine (pas un TTL neuf)
+                with self._lock:
+                    self._put(key, value, expires)
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._put(key, value, expires)
+        if self.backend is not None:
+            self.backend.set(key, value, expires)
+
+    # backend disque: lecture et commit SQLite dans un thread, pas sur la boucle
+    async def aget(self, key: str) -> Optional[str]:
+        if self.backend is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: str) -> None:
+        if self.backend is None:
+            self.set(key, value)
+        else:
+            await asyncio.to_thread(self.set, key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "disk": self.backend.stats() if self.backend is not None else None,
+        }
+
+
+LLM_CACHE = LLMCache(backend=SQLiteCacheBackend(LLM_CACHE_DB) if LLM_CACHE_DB else None)
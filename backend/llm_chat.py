@@ -1,20 +1,48 @@
+import asyncio
+import hashlib
 import json
+import os
 import re
-from typing import Dict, Any, List, Optional
+import threading
+import time
+from contextlib import aclosing
+from typing import Dict, Any, List, Optional, AsyncIterator, Sequence
 
-import requests
+import httpx
 from pydantic import BaseModel, Field, ValidationError
 
+import llm_tiers
+import metrics
+import ollama_client
+from ollama_client import OllamaOverloaded, OllamaUnavailable
+from deadline import Deadline, DeadlineExceeded
+from json_stream import JsonObjectStream, first_json_object
+from metrics import stage
+from llm_cache import LLM_CACHE, make_key
+from session_store import create_store
+from singleflight import SingleFlight
+from semantic_index import get_index as get_semantic_index
+import entities
+import fuzzy
+from entities import fold
+from candidates import CANDIDATES
+from facets import most_informative
+
 # =========================
 # OLLAMA CONFIG
 # =========================
-OLLAMA_BASE = "http://127.0.0.1:11434"
-OLLAMA_MODEL = "qwen2.5:14b-instruct"
+# modèle de référence (14B); le routage petit modèle / 14B est dans llm_tiers
+OLLAMA_MODEL = llm_tiers.LARGE.model
 
 # =========================
 # MEMORY (session_id -> session state)
 # =========================
-SESSIONS: Dict[str, Dict[str, Any]] = {}
+# store borné (TTL + LRU), mémoire ou SQLite partagé: voir session_store
+SESSIONS = create_store()
+metrics.register(metrics.Gauge("smartdrive_sessions", "Sessions actives", lambda: len(SESSIONS)))
+metrics.register(metrics.Gauge(
+    "smartdrive_llm_circuit_open", "Nombre de modèles dont le disjoncteur n'est pas fermé",
+    ollama_client.open_circuits))
 
 SLOT_DEFAULTS = {
     "type": "UNSET",
@@ -27,12 +55,15 @@ SLOT_DEFAULTS = {
 ALLOWED_FUEL = ["diesel", "essence", "hybride", "electrique", "ANY", "UNSET"]
 ALLOWED_GEARBOX = ["automatique", "manuelle", "ANY", "UNSET"]
 
-CITIES = ["Casablanca", "Rabat", "Tanger", "Marrakech", "Agadir", "Fès", "Meknès", "Kénitra", "Oujda"]
+# villes connues: même vocabulaire que l'extracteur d'entités
+CITIES = entities.CITIES
 
 QUESTION_ORDER = ["type", "fuel", "gearbox", "price_max", "city"]
+# "gain": slot le plus discriminant d'abord, slots inutiles sautés; "fixed": QUESTION_ORDER
+QUESTION_POLICY = os.environ.get("QUESTION_POLICY", "gain")
 
-# ✅ IMPORTANT: ta liste cars (list[dict])
-from smart_ai import cars
+# ✅ IMPORTANT: catalogue indexé partagé (cars.json)
+from catalog import get_catalog
 
 
 # =========================
@@ -47,113 +78,197 @@ class LLMResponse(BaseModel):
 # Session helpers
 # =========================
 def get_state(session_id: str) -> Dict[str, Any]:
-    if session_id not in SESSIONS:
-        SESSIONS[session_id] = {
+    sess = SESSIONS.get(session_id)
+    if sess is None:
+        sess = {
             "slots": dict(SLOT_DEFAULTS),
             "last_asked": None,
             "turns": 0,
         }
-    return SESSIONS[session_id]
+    return sess
+
+def save_state(session_id: str, sess: Dict[str, Any]) -> None:
+    with stage("chat", "save"):
+        SESSIONS.put(session_id, sess)
+
+# store sur disque (SQLite): lecture et commit dans un thread, pas sur la boucle
+async def load_state(session_id: str) -> Dict[str, Any]:
+    if SESSIONS.on_disk:
+        return await asyncio.to_thread(get_state, session_id)
+    return get_state(session_id)
+
+async def store_state(session_id: str, sess: Dict[str, Any]) -> None:
+    if SESSIONS.on_disk:
+        await asyncio.to_thread(save_state, session_id, sess)
+    else:
+        save_state(session_id, sess)
 
 
 # =========================
 # Cheap understanding (safety net)
 # =========================
 def is_any_reply(txt: str) -> bool:
-    t = (txt or "").lower().strip()
-    return any(x in t for x in [
-        "peu importe", "pas important", "n'importe", "comme tu veux",
-        "aucune préférence", "sans préférence", "no preference", "any"
-    ])
+    return entities.extract(txt).has("any")
 
 def extract_city(msg: str) -> Optional[str]:
-    if not msg:
-        return None
-    low = msg.lower()
-    for c in CITIES:
-        if c.lower() in low:
-            return c
-    return None
+    city = entities.extract(msg).first("city")
+    if city is None:
+        m = fuzzy.resolve(msg, "city")
+        city = m.value if m is not None else None
+    return city
 
 def extract_fuel(msg: str) -> Optional[str]:
-    t = (msg or "").lower()
-    if "essence" in t:
-        return "essence"
-    if "diesel" in t or "gasoil" in t or "gaz oil" in t:
-        return "diesel"
-    if "hybr" in t:
-        return "hybride"
-    if "elect" in t or "élect" in t or "ev" in t:
-        return "electrique"
-    return None
+    return entities.extract(msg).first("fuel")
 
 def extract_gearbox(msg: str) -> Optional[str]:
-    t = (msg or "").lower()
-    if "auto" in t or "automatique" in t or "boite auto" in t:
-        return "automatique"
-    if "manuelle" in t or "manuel" in t or "boite manuelle" in t:
-        return "manuelle"
-    return None
+    return entities.extract(msg).first("gearbox")
 
 def extract_type(msg: str) -> Optional[str]:
-    t = (msg or "").lower()
-    if "suv" in t:
-        return "SUV"
-    if "berline" in t:
-        return "berline"
-    if "citadine" in t:
-        return "citadine"
-    if "compact" in t:
-        return "compacte"
-    if "break" in t:
-        return "break"
-    if "pickup" in t or "pick-up" in t:
-        return "pickup"
-    if "coup" in t:
-        return "coupé"
-    return None
+    return entities.extract(msg).first("type")
 
 def extract_int(msg: str) -> Optional[int]:
-    if not msg:
-        return None
-    m = re.search(r"\b(\d{2,9})\b", msg.replace(" ", ""))
-    if not m:
-        return None
-    try:
-        return int(m.group(1))
-    except:
-        return None
+    nums = [n for n in entities.extract(msg).numbers() if n >= 10]
+    return nums[0] if nums else None
 
 def update_slots_from_message(slots: Dict[str, Any], msg: str, last_asked: Optional[str]) -> Dict[str, Any]:
-    msg = msg or ""
+    # une seule passe d'extraction pour tous les slots
+    e = entities.extract(msg or "")
 
-    if is_any_reply(msg) and last_asked:
+    if e.has("any") and last_asked:
         slots[last_asked] = "ANY"
 
-    c = extract_city(msg)
-    if c:
-        slots["city"] = c
+    for slot in ["city", "fuel", "gearbox", "type"]:
+        v = e.first(slot)
+        if v:
+            slots[slot] = v
+    if not e.has("city"):
+        # fautes de frappe et surnoms: "marakech", "casa"
+        m = fuzzy.resolve(msg or "", "city")
+        if m is not None:
+            slots["city"] = m.value
+
+    if e.budget_max is not None:
+        # "moins de 200000", "max 150k": budget explicite
+        slots["price_max"] = e.budget_max
+    else:
+        n = extract_int(msg)
+        if n is not None:
+            if last_asked == "price_max":
+                slots["price_max"] = n
+            elif slots.get("price_max") in ["UNSET", "ANY"] and n >= 50000:
+                slots["price_max"] = n
 
-    f = extract_fuel(msg)
-    if f:
-        slots["fuel"] = f
+    return slots
 
-    g = extract_gearbox(msg)
-    if g:
-        slots["gearbox"] = g
 
-    ty = extract_type(msg)
-    if ty:
-        slots["type"] = ty
+# =========================
+# Fast path (sans LLM)
+# =========================
+# Mots sans information qu'on peut ignorer dans une réponse courte (forme fold)
+FILLER_WORDS = {
+    "je", "j", "veux", "voudrais", "prefere", "plutot", "une", "un", "en",
+    "a", "de", "du", "la", "le", "l", "boite", "vitesse", "vitesses",
+    "voiture", "ville", "carburant", "moteur", "type", "budget", "prix", "max", "maximum",
+    "mad", "dh", "dhs", "dirhams", "ok", "oui", "svp", "merci", "stp", "c", "est", "bien",
+}
 
-    n = extract_int(msg)
-    if n is not None:
-        if last_asked == "price_max":
-            slots["price_max"] = n
-        elif slots.get("price_max") in ["UNSET", "ANY"] and n >= 50000:
-            slots["price_max"] = n
+FAST_PATH_MAX_WORDS = 6
+
+# un souhait libre ("voiture familiale pas chère pour la montagne") => recherche sémantique
+WISH_MIN_WORDS = 4
+
+# budget de latence d'un tour (s); le client peut demander moins. 0 = sans limite
+TURN_BUDGET_S = float(os.environ.get("TURN_BUDGET_S", "25"))
+
+# compteurs globaux des tours (voir /stats)
+TURN_STATS = {"turns": 0, "llm_called": 0, "llm_skipped": 0, "degraded": 0}
+_STATS_LOCK = threading.Lock()
+
+def count_turn(sess: Dict[str, Any], skipped: bool) -> None:
+    key = "llm_skipped" if skipped else "llm_called"
+    with _STATS_LOCK:
+        TURN_STATS["turns"] += 1
+        TURN_STATS[key] += 1
+    metrics.TURNS.inc("fast" if skipped else "llm")
+    sess[key] = sess.get(key, 0) + 1
+
+def turn_deadline(budget_s: Optional[float] = None) -> Deadline:
+    """Budget du tour: celui demandé s'il est plus court que TURN_BUDGET_S."""
+    budgets = [b for b in (budget_s, TURN_BUDGET_S) if b and b > 0]
+    return Deadline(min(budgets) if budgets else None)
+
+def degraded_reason(e: Exception) -> Optional[str]:
+    """Pourquoi le tour se passe du LLM; None = on laisse remonter l'erreur.
+
+    La surcharge de la file (OllamaOverloaded hors disjoncteur) n'est pas une
+    panne: /chat la remonte en 429/503 + Retry-After (api.py) et le client
+    réessaie. Seul chat_turn_stream, dont la réponse est déjà partie, la
+    traite en tour dégradé ("overloaded")."""
+    if isinstance(e, DeadlineExceeded):
+        return "deadline"
+    if isinstance(e, OllamaUnavailable):
+        return "circuit_open"
+    if isinstance(e, OllamaOverloaded):
+        return None
+    if isinstance(e, httpx.HTTPError):
+        return "llm_error"
+    if isinstance(e, (ValueError, ValidationError)):
+        return "invalid_llm_output"
+    return None
 
-    return slots
+def count_degraded(reason: str) -> None:
+    with _STATS_LOCK:
+        TURN_STATS["degraded"] += 1
+    metrics.DEGRADED_TURNS.inc(reason)
+
+def with_degraded(out: Dict[str, Any], reason: Optional[str]) -> Dict[str, Any]:
+    out["degraded"] = reason is not None
+    if reason is not None:
+        out["degraded_reason"] = reason
+    return out
+
+def cheap_extraction_sufficient(
+        msg: str,
+        before: Dict[str, Any],
+        after: Dict[str, Any],
+        last_asked: Optional[str],
+) -> bool:
+    """True si update_slots_from_message explique tout le message:
+    réponse courte, uniquement des mots connus (mots entiers du vocabulaire),
+    sans valeurs contradictoires, et cohérente avec last_asked.
+    Dans ce cas le LLM n'apporterait rien (temperature 0, mêmes slots)."""
+    e = entities.extract(msg or "")
+    if not (msg or "").strip():
+        return False
+    # "essence diesel": l'extraction garderait la première, au LLM de trancher
+    if any(len(set(e.all(k))) > 1 for k in entities.CRITERIA):
+        return False
+
+    changed = {k for k in after if after[k] != before.get(k)}
+    if not changed:
+        return False
+    # "peu importe" n'est sûr que s'il répond à la question posée
+    if e.has("any") and (not last_asked or after.get(last_asked) != "ANY"):
+        return False
+    if last_asked and last_asked not in changed:
+        return False
+    if len(re.findall(r"[\w-]+", fold(msg))) > FAST_PATH_MAX_WORDS:
+        return False
+
+    # tout ce que l'extracteur n'a pas reconnu doit être du remplissage
+    # (ou la ville corrigée par fuzzy)
+    understood = set(FILLER_WORDS)
+    if "city" in changed and not e.has("city"):
+        m = fuzzy.resolve(msg, "city")
+        if m is not None:
+            understood.update(m.text.split())
+    if any(w not in understood for w in re.findall(r"[\w-]+", e.rest)):
+        return False
+    has_number = bool(e.numbers())
+    # un nombre qui n'a pas servi au budget reste à interpréter
+    if has_number and "price_max" not in changed:
+        return False
+    return True
 
 
 # =========================
@@ -195,11 +310,11 @@ def normalize_slots(slots: Dict[str, Any]) -> Dict[str, Any]:
     else:
         out["price_max"] = "UNSET"
 
-    # city normalize
+    # city normalize (sans accents/casse: "fes" -> "Fès")
     if out["city"] not in ["ANY", "UNSET"] and isinstance(out["city"], str):
         found = None
         for c in CITIES:
-            if out["city"].lower() == c.lower():
+            if fold(out["city"]) == fold(c):
                 found = c
                 break
         out["city"] = found if found else "UNSET"
@@ -210,11 +325,22 @@ def normalize_slots(slots: Dict[str, Any]) -> Dict[str, Any]:
 # =========================
 # Question policy
 # =========================
-def pick_missing(slots: Dict[str, Any]) -> Optional[str]:
-    for k in QUESTION_ORDER:
-        if slots.get(k, "UNSET") == "UNSET":
-            return k
-    return None
+def pick_missing(slots: Dict[str, Any], facets: Optional[Dict[str, Dict[str, int]]] = None) -> Optional[str]:
+    """Prochain slot à demander. Avec les comptes des candidats (facets):
+    le plus discriminant, et None si plus aucun slot ne réduit le résultat."""
+    unset = [k for k in QUESTION_ORDER if slots.get(k, "UNSET") == "UNSET"]
+    if not unset:
+        return None
+    if facets is None or QUESTION_POLICY == "fixed":
+        return unset[0]
+    return most_informative(unset, facets)
+
+def session_candidates(session_id: str, slots: Dict[str, Any]):
+    """(catalogue, ids candidats, comptes par slot) pour les slots actuels.
+    L'ensemble de la session est affiné d'un tour à l'autre (voir candidates)."""
+    with stage("chat", "facets"):
+        facets, ids = CANDIDATES.get(session_id, slot_filters(slots))
+        return facets.catalog, ids, facets.counts(ids)
 
 def question_for_slot(slot: str) -> str:
     if slot == "type":
@@ -233,19 +359,15 @@ def question_for_slot(slot: str) -> str:
 # =========================
 # LLM prompt (slot filling)
 # =========================
-def build_prompt(user_message: str, current_slots: Dict[str, Any], last_asked: Optional[str]) -> str:
-    return f"""
+# Préfixe fixe (identique pour toutes les sessions et tous les tours): Ollama
+# garde son KV cache, seul le petit suffixe du tour est à évaluer (prefill).
+SYSTEM_PREFIX = """
+Tu réponds UNIQUEMENT en JSON.
+
 Tu es un assistant de slot-filling pour une recherche de voitures.
 Tu DOIS renvoyer UNIQUEMENT un JSON conforme.
 
-Slots actuels (JSON):
-{json.dumps(current_slots, ensure_ascii=False)}
-
-Dernier slot demandé (peut être null):
-{json.dumps(last_asked, ensure_ascii=False)}
-
-Message utilisateur:
-{user_message}
+Chaque message contient les slots actuels, le dernier slot demandé et le message utilisateur.
 
 Règles:
 - Remplis updated_slots avec les slots mis à jour (tu peux renvoyer tous les slots si tu veux).
@@ -263,104 +385,412 @@ Règle importante :
 - Ne mets JAMAIS "type" à ANY si l'utilisateur n'a pas explicitement dit "peu importe".
 
 JSON attendu:
-{{
-  "updated_slots": {{
+{
+  "updated_slots": {
     "type": "...",
     "price_max": "...",
     "fuel": "...",
     "gearbox": "...",
     "city": "..."
-  }},
+  },
   "done": true
-}}
+}
+""".strip()
+
+def build_prompt(user_message: str, current_slots: Dict[str, Any], last_asked: Optional[str]) -> str:
+    """Partie variable du tour (après SYSTEM_PREFIX)."""
+    return f"""
+Slots actuels (JSON):
+{json.dumps(current_slots, ensure_ascii=False)}
+
+Dernier slot demandé (peut être null):
+{json.dumps(last_asked, ensure_ascii=False)}
+
+Message utilisateur:
+{user_message}
 """.strip()
 
-def call_llm(prompt: str) -> str:
-    r = requests.post(
-        f"{OLLAMA_BASE}/api/generate",
-        json={
-            "model": OLLAMA_MODEL,
-            "prompt": "Tu réponds UNIQUEMENT en JSON.\n\n" + prompt,
-            "stream": False,
-            "options": {"temperature": 0.0, "num_predict": 250},
+LLM_OPTIONS = llm_tiers.LARGE.options
+RETRY_SUFFIX = "\n\nRAPPEL: JSON strict uniquement. Aucun texte hors JSON."
+
+# Échanges précédents de la session renvoyés à Ollama (/api/chat): la
+# conversation est un préfixe du prochain appel, donc déjà dans le KV cache
+# d'Ollama. Quand la fenêtre glisse, tout l'historique est réévalué: elle est
+# dimensionnée pour une conversation complète (5 slots). 0 = pas d'historique
+# (SYSTEM_PREFIX reste partagé entre sessions).
+LLM_HISTORY_TURNS = int(os.environ.get("LLM_HISTORY_TURNS", "6"))
+
+# Sortie structurée Ollama ("format"): le décodage est contraint à ce schéma
+# (LLMResponse + valeurs autorisées). updated_slots vient avant done: l'objet
+# se ferme juste après done, on coupe la génération à ce moment-là.
+LLM_FORMAT = {
+    "type": "object",
+    "properties": {
+        "updated_slots": {
+            "type": "object",
+            "properties": {
+                "type": {"type": "string"},
+                "price_max": {"anyOf": [{"type": "integer"}, {"type": "string", "enum": ["ANY", "UNSET"]}]},
+                "fuel": {"type": "string", "enum": ALLOWED_FUEL},
+                "gearbox": {"type": "string", "enum": ALLOWED_GEARBOX},
+                "city": {"type": "string"},
+            },
+            "required": list(SLOT_DEFAULTS),
         },
-        timeout=120,
+        "done": {"type": "boolean"},
+    },
+    "required": ["updated_slots", "done"],
+}
+
+def llm_messages(prompt: str, history: Sequence[Sequence[str]] = ()) -> List[Dict[str, str]]:
+    messages = [{"role": "system", "content": SYSTEM_PREFIX}]
+    for user_part, answer in history:
+        messages.append({"role": "user", "content": user_part})
+        messages.append({"role": "assistant", "content": answer})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+def llm_payload(prompt: str, stream: bool = False, history: Sequence[Sequence[str]] = (),
+                tier: Optional[llm_tiers.Tier] = None) -> Dict[str, Any]:
+    tier = tier or llm_tiers.LARGE
+    return {
+        "model": tier.model,
+        "messages": llm_messages(prompt, history),
+        "stream": stream,
+        "format": LLM_FORMAT,
+        "options": tier.options,
+        "keep_alive": ollama_client.OLLAMA_KEEP_ALIVE,
+    }
+
+async def warm_up_models(timeout: float) -> Dict[str, Any]:
+    """Charge chaque modèle de slot-filling dans Ollama (keep_alive) et met
+    SYSTEM_PREFIX dans son cache de prompt. tier -> secondes, ou l'erreur."""
+    async def warm(tier: llm_tiers.Tier):
+        payload = llm_payload("", False, (), tier)
+        payload["options"] = dict(tier.options, num_predict=1)
+        t0 = time.perf_counter()
+        try:
+            await ollama_client.awarm(payload, timeout)
+        except Exception as e:
+            return tier.name, f"{type(e).__name__}: {e}"
+        return tier.name, round(time.perf_counter() - t0, 3)
+
+    tiers = [t for t in (llm_tiers.SMALL, llm_tiers.LARGE) if t.model]
+    return dict(await asyncio.gather(*[warm(t) for t in tiers]))
+
+def remember_exchange(sess: Dict[str, Any], prompt: str, raw: str) -> None:
+    """Ajoute le tour à l'historique LLM de la session (borné à LLM_HISTORY_TURNS)."""
+    if LLM_HISTORY_TURNS <= 0:
+        return
+    history = sess.get("llm_history") or []
+    history.append([prompt, first_json_object(raw) or raw.strip()])
+    sess["llm_history"] = history[-LLM_HISTORY_TURNS:]
+
+async def stream_llm(prompt: str, history: Sequence[Sequence[str]] = (),
+                     tier: Optional[llm_tiers.Tier] = None,
+                     deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+    """Tokens de la réponse au fil de l'eau (Ollama /api/chat, stream=True).
+    deadline: DeadlineExceeded dès que le budget du tour est épuisé (file d'attente comprise)."""
+    tier = tier or llm_tiers.LARGE
+    deadline = deadline or Deadline(None)
+    timings: Dict[str, Any] = {}
+    mode = "history" if history else "prefix"
+    payload = llm_payload(prompt, True, history, tier)
+    try:
+        async with aclosing(ollama_client.astream_chat(
+                payload, timings, deadline.cap(tier.timeout), batch=True)) as chunks:
+            first = True
+            async for chunk in deadline.iterate(chunks):
+                if first:
+                    metrics.LLM_PREFILL.observe(timings["ttft"], mode)
+                    first = False
+                text = (chunk.get("message") or {}).get("content")
+                if text:
+                    yield text
+    finally:
+        if "prompt_eval_count" in timings:
+            metrics.LLM_PROMPT_TOKENS.inc(mode, amount=timings["prompt_eval_count"])
+
+def slots_member_ok(raw: str) -> bool:
+    """Validation de updated_slots dès sa fermeture (avant la fin de la réponse)."""
+    try:
+        slots = json.loads(raw)
+    except ValueError:
+        return False
+    return isinstance(slots, dict) and all(
+        v is None or isinstance(v, (str, int, float)) for v in slots.values()
     )
-    r.raise_for_status()
-    return r.json()["response"]
+
+async def stream_slots(prompt: str, history: Sequence[Sequence[str]] = (),
+                       tier: Optional[llm_tiers.Tier] = None,
+                       deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+    """stream_llm qui s'arrête dès que l'objet JSON est fermé, ou dès que
+    updated_slots est invalide (inutile d'attendre la fin pour relancer).
+    Quitter le flux ferme la connexion: Ollama arrête la génération."""
+    reader = JsonObjectStream()
+    async with aclosing(stream_llm(prompt, history, tier, deadline)) as tokens:
+        async for tok in tokens:
+            yield tok
+            if reader.feed(tok):
+                metrics.EARLY_STOPS.inc()
+                return
+            slots = reader.members.get("updated_slots")
+            if slots is not None and not slots_member_ok(slots):
+                return
+
+async def call_llm(prompt: str, history: Sequence[Sequence[str]] = (),
+                   tier: Optional[llm_tiers.Tier] = None,
+                   deadline: Optional[Deadline] = None) -> str:
+    return "".join([tok async for tok in stream_slots(prompt, history, tier, deadline)])
 
 def parse_llm_json(raw: str) -> Dict[str, Any]:
     raw = (raw or "").strip()
     try:
         return json.loads(raw)
-    except:
+    except ValueError:
         pass
-    m = re.search(r"\{.*\}", raw, re.DOTALL)
-    if not m:
+    # texte autour du JSON: premier objet équilibré (pas de regex gloutonne)
+    obj = first_json_object(raw)
+    if obj is None:
         raise ValueError("No JSON found in LLM output")
-    return json.loads(m.group(0))
+    return json.loads(obj)
 
 
 # =========================
 # Search
 # =========================
-def search_cars(slots: Dict[str, Any], limit=15) -> List[Dict[str, Any]]:
-    out = []
-    for c in cars:
-        if slots["type"] not in ["ANY", "UNSET"] and slots["type"].lower() not in (c.get("type", "").lower()):
-            continue
-        if slots["fuel"] not in ["ANY", "UNSET"] and slots["fuel"] != c.get("fuel"):
-            continue
-        if slots["gearbox"] not in ["ANY", "UNSET"] and slots["gearbox"] != c.get("gearbox"):
-            continue
-        if slots["city"] not in ["ANY", "UNSET"] and slots["city"].lower() != c.get("city", "").lower():
-            continue
-        if slots["price_max"] not in ["ANY", "UNSET"] and c.get("price") and c["price"] > slots["price_max"]:
-            continue
-
-        out.append(c)
-        if len(out) >= limit:
-            break
-    return out
+def slot_filters(slots: Dict[str, Any]) -> Dict[str, Any]:
+    """Slots -> arguments de CarCatalog.select (ANY/UNSET = pas de filtre)."""
+    def is_set(k):
+        return slots.get(k) not in ["ANY", "UNSET", None]
+
+    exact = {k: slots[k] for k in ["fuel", "gearbox", "city"] if is_set(k)}
+    contains = {"type": slots["type"]} if is_set("type") else {}
+    price_max = slots["price_max"] if is_set("price_max") else None
+    return {"exact": exact, "contains": contains, "price_max": price_max}
+
+def search_cars(slots: Dict[str, Any], limit=15, within: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """within: ids candidats déjà classés (recherche sémantique), ordre conservé."""
+    return get_catalog().select_cars(**slot_filters(slots), limit=limit, within=within)
+
+def search_for_session(sess: Dict[str, Any], slots: Dict[str, Any], limit=15, candidates=None) -> List[Dict[str, Any]]:
+    """candidates: (catalogue, ids triés) de session_candidates, déjà filtrés par les slots."""
+    # d'abord les annonces proches du souhait libre, sinon recherche classique
+    wish_ids = sess.get("wish_ids")
+    if wish_ids:
+        out = search_cars(slots, limit=limit, within=wish_ids)
+        if out:
+            return out
+    if candidates is not None:
+        catalog, ids = candidates
+        return [catalog.cars[i] for i in ids[:limit].tolist()]
+    return search_cars(slots, limit=limit)
+
+async def update_wish(sess: Dict[str, Any], user_message: str, deadline: Optional[Deadline] = None) -> None:
+    """Message libre => ids des annonces sémantiquement proches (si l'index est dispo)."""
+    index = get_semantic_index()
+    if index is None or len(re.findall(r"\w+", user_message or "")) < WISH_MIN_WORDS:
+        return
+    deadline = deadline or Deadline(None)
+    try:
+        with stage("chat", "wish"):
+            sess["wish_ids"] = await deadline.run(index.search(user_message))
+    except Exception:
+        # la recherche sémantique est un bonus: jamais bloquante
+        pass
 
 
 # =========================
 # Main turn
 # =========================
-def chat_turn(session_id: str, user_message: str) -> Dict[str, Any]:
-    sess = get_state(session_id)
-    state = sess["slots"]
+def begin_turn(sess: Dict[str, Any], user_message: str):
+    """Partie déterministe avant le LLM: extraction simple + prompt.
+    prompt=None quand le fast path suffit (pas d'appel LLM)."""
+    before = sess["slots"]
     last_asked = sess.get("last_asked")
 
     # 1) Cheap extraction first (safety net)
-    state = update_slots_from_message(dict(state), user_message, last_asked)
-    state = normalize_slots(state)
-
-    # 2) LLM slot-filling (can fill multiple at once)
-    prompt = build_prompt(user_message, state, last_asked)
-    raw = call_llm(prompt)
-
-    try:
-        data = parse_llm_json(raw)
-        parsed = LLMResponse(**data)
-    except Exception:
-        # fallback: re-ask strictly
-        raw2 = call_llm(prompt + "\n\nRAPPEL: JSON strict uniquement. Aucun texte hors JSON.")
-        data2 = parse_llm_json(raw2)
-        parsed = LLMResponse(**data2)
-
-    # 3) Merge: keep state + overwrite with LLM updates
+    with stage("chat", "extract"):
+        state = update_slots_from_message(dict(before), user_message, last_asked)
+    with stage("chat", "normalize"):
+        state = normalize_slots(state)
+
+    # 1b) Réponse entièrement comprise => pas besoin du LLM
+    if cheap_extraction_sufficient(user_message, before, state, last_asked):
+        return sess, state, None
+
+    with stage("chat", "prompt"):
+        prompt = build_prompt(user_message, state, last_asked)
+    return sess, state, prompt
+
+def parse_llm_response(raw: str) -> LLMResponse:
+    with stage("chat", "parse"):
+        try:
+            return LLMResponse(**parse_llm_json(raw))
+        except Exception:
+            metrics.PARSE_FAILURES.inc()
+            raise
+
+def slot_cache_key(sess: Dict[str, Any], state: Dict[str, Any], user_message: str) -> str:
+    # temperature 0 => même entrée, même réponse: réutilisable sans risque.
+    # L'historique envoyé au modèle fait partie de l'entrée: deux conversations
+    # différentes ne partagent jamais une réponse (cache ni singleflight)
+    history = json.dumps(sess.get("llm_history") or [], ensure_ascii=False)
+    return make_key(state, sess.get("last_asked"), user_message, OLLAMA_MODEL,
+                    {"options": LLM_OPTIONS, "format": LLM_FORMAT, "tiers": llm_tiers.signature(),
+                     "history": hashlib.sha256(history.encode("utf-8")).hexdigest()})
+
+def merge_llm_slots(state: Dict[str, Any], parsed: LLMResponse) -> Dict[str, Any]:
+    """Slots après la réponse du LLM (ce que finish_turn garde), normalisés."""
+    merged = dict(state)
     llm_slots = dict(SLOT_DEFAULTS)
     llm_slots.update(parsed.updated_slots or {})
-    merged = dict(state)
     merged.update(llm_slots)
+    return normalize_slots(merged)
+
+def small_answer_problem(parsed: LLMResponse, state: Dict[str, Any]) -> Optional[str]:
+    """None si la réponse du petit modèle peut être gardée, sinon la raison d'escalader:
+    - invalid: une valeur proposée est rejetée par normalize_slots (ville, carburant inconnus...)
+    - disagree: elle contredit un slot déjà connu ou trouvé par l'extraction déterministe"""
+    proposed = parsed.updated_slots or {}
+    merged = merge_llm_slots(state, parsed)
+    for k in SLOT_DEFAULTS:
+        v = proposed.get(k)
+        if v is not None and str(v).strip().upper() != "UNSET" and merged[k] == "UNSET":
+            return "invalid"
+    for k, v in state.items():
+        if v != "UNSET" and merged.get(k) != v:
+            return "disagree"
+    return None
 
-    merged = normalize_slots(merged)
+async def slot_attempts(sess: Dict[str, Any], prompt: str, state: Dict[str, Any],
+                        user_message: str, deadline: Optional[Deadline] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Appels LLM d'un tour: petit modèle si le message s'y prête, 14B sinon ou en
+    escalade, puis une relance stricte du 14B si son JSON est invalide.
+    Événements: "token", "escalate" (réponse du petit modèle rejetée), "retry";
+    le dernier est {"event": "parsed", "parsed": LLMResponse, "raw": texte}.
+    Tous les appels partagent le budget `deadline` (DeadlineExceeded une fois épuisé)."""
+    history = sess.get("llm_history") or ()
+    deadline = deadline or Deadline(None)
+
+    if llm_tiers.use_small(user_message):
+        tier = llm_tiers.SMALL
+        parts: List[str] = []
+        t0 = time.perf_counter()
+        try:
+            with stage("chat", "llm_small"):
+                async for tok in stream_slots(prompt, history, tier, deadline):
+                    parts.append(tok)
+                    yield {"event": "token", "text": tok}
+            parsed = parse_llm_response("".join(parts))
+            problem = small_answer_problem(parsed, state)
+        except (OllamaOverloaded, DeadlineExceeded):
+            tier.record(time.perf_counter() - t0, "error")
+            raise
+        except Exception:
+            # JSON illisible, timeout, modèle absent...: le 14B prend le relais
+            problem = "invalid" if parts else "error"
+        tier.record(time.perf_counter() - t0, problem or "accepted")
+        if problem is None:
+            yield {"event": "parsed", "parsed": parsed, "raw": "".join(parts)}
+            return
+        yield {"event": "escalate", "reason": problem}
+
+    tier = llm_tiers.LARGE
+    for attempt_prompt, hist, name in ((prompt, history, "llm"), (prompt + RETRY_SUFFIX, (), "llm_retry")):
+        if deadline.expired():
+            raise DeadlineExceeded("request budget exhausted")
+        parts = []
+        t0 = time.perf_counter()
+        try:
+            with stage("chat", name):
+                async for tok in stream_slots(attempt_prompt, hist, tier, deadline):
+                    parts.append(tok)
+                    yield {"event": "token", "text": tok}
+        except Exception:
+            tier.record(time.perf_counter() - t0, "error")
+            raise
+        try:
+            parsed = parse_llm_response("".join(parts))
+        except Exception:
+            tier.record(time.perf_counter() - t0, "invalid")
+            if name == "llm_retry":
+                raise
+            # fallback: re-ask strictly (sans historique: on repart d'un contexte propre)
+            metrics.LLM_RETRIES.inc()
+            yield {"event": "retry"}
+            continue
+        tier.record(time.perf_counter() - t0, "accepted")
+        yield {"event": "parsed", "parsed": parsed, "raw": "".join(parts)}
+        return
+
+# appels de slot-filling identiques en cours (même clé que le cache LLM)
+SLOT_FLIGHTS = SingleFlight()
+
+async def shared_slot_attempts(sess: Dict[str, Any], prompt: str, state: Dict[str, Any],
+                               user_message: str, cache_key: str,
+                               deadline: Optional[Deadline] = None) -> AsyncIterator[Dict[str, Any]]:
+    """slot_attempts derrière le singleflight: si le même tour (cache_key) est
+    déjà en cours pour un autre utilisateur, on attend sa réponse (rendue en
+    un seul "token") au lieu de prendre un slot du modèle."""
+    deadline = deadline or Deadline(None)
+    while True:
+        waiter = SLOT_FLIGHTS.join(cache_key)
+        if waiter is None:
+            break
+        # shield: notre budget épuisé ne doit pas annuler l'attente des autres
+        raw = await deadline.run(asyncio.shield(waiter))
+        if raw is not None:
+            metrics.LLM_COALESCED.inc()
+            parsed = parse_llm_response(raw)
+            yield {"event": "token", "text": raw}
+            yield {"event": "parsed", "parsed": parsed, "raw": raw}
+            return
+        # le meneur a échoué: un des suiveurs devient meneur, les autres l'attendent
+        SLOT_FLIGHTS.fallback()
+
+    raw = None
+    try:
+        async with aclosing(slot_attempts(sess, prompt, state, user_message, deadline)) as events:
+            async for ev in events:
+                if ev["event"] == "parsed":
+                    raw = ev["raw"]
+                    await LLM_CACHE.aset(cache_key, raw)
+                yield ev
+    finally:
+        # une seule fois: un second done() retirerait le vol d'un nouveau meneur
+        SLOT_FLIGHTS.done(cache_key, raw)
+
+async def fill_slots(sess: Dict[str, Any], prompt: str, cache_key: str,
+                     state: Dict[str, Any], user_message: str,
+                     deadline: Optional[Deadline] = None) -> LLMResponse:
+    """LLM slot-filling avec cache, petit modèle d'abord et une relance stricte si le JSON est invalide."""
+    cached = await LLM_CACHE.aget(cache_key)
+    if cached is not None:
+        parsed = parse_llm_response(cached)
+        remember_exchange(sess, prompt, cached)
+        return parsed
+
+    async with aclosing(shared_slot_attempts(sess, prompt, state, user_message, cache_key, deadline)) as events:
+        async for ev in events:
+            if ev["event"] == "parsed":
+                parsed, raw = ev["parsed"], ev["raw"]
+
+    remember_exchange(sess, prompt, raw)
+    return parsed
+
+def finish_turn(session_id: str, sess: Dict[str, Any], state: Dict[str, Any],
+                parsed: Optional[LLMResponse]) -> Dict[str, Any]:
+    # 3) Merge: keep state + overwrite with LLM updates (parsed=None => fast path)
+    with stage("chat", "merge"):
+        merged = merge_llm_slots(state, parsed) if parsed is not None else normalize_slots(state)
 
     sess["slots"] = merged
 
-    # 4) Decide missing deterministically (anti-loop)
-    missing = pick_missing(merged)
+    # 4) Decide missing deterministically (anti-loop), d'après les candidats restants
+    catalog, ids, facets = session_candidates(session_id, merged)
+    total = len(ids)
+    missing = pick_missing(merged, facets)
     sess["last_asked"] = missing
 
     # Done MUST be consistent with merged slots (never trust LLM blindly)
@@ -368,22 +798,142 @@ def chat_turn(session_id: str, user_message: str) -> Dict[str, Any]:
 
     # 5) If done => search
     if done_final:
-        cars_out = search_cars(merged, limit=15)
+        with stage("chat", "search"):
+            cars_out = search_for_session(sess, merged, limit=15, candidates=(catalog, ids))
         if not cars_out:
+            metrics.EMPTY_SEARCHES.inc("chat")
             return {
                 "assistant": "Je n’ai rien trouvé 😕 Tu veux élargir (budget, ville, type) ?",
                 "slots": merged,
-                "cars": []
+                "cars": [],
+                "candidates": total,
+                "facets": facets,
             }
         return {
             "assistant": "Parfait ✅ Voilà les meilleures options. Clique sur une voiture à droite pour voir les détails.",
             "slots": merged,
-            "cars": cars_out
+            "cars": cars_out,
+            "candidates": total,
+            "facets": facets,
         }
 
     # 6) done=false => next question
     return {
         "assistant": question_for_slot(missing),
         "slots": merged,
-        "cars": []
+        "cars": [],
+        "candidates": total,
+        "facets": facets,
     }
+
+async def chat_turn(session_id: str, user_message: str, budget_s: Optional[float] = None) -> Dict[str, Any]:
+    """budget_s: latence max souhaitée (bornée par TURN_BUDGET_S). Budget épuisé,
+    disjoncteur ouvert ou LLM en erreur => réponse déterministe (extraction
+    simple + question suivante / recherche) avec "degraded": true."""
+    deadline = turn_deadline(budget_s)
+    sess, state, prompt = begin_turn(await load_state(session_id), user_message)
+    count_turn(sess, skipped=prompt is None)
+
+    # 2) LLM slot-filling (can fill multiple at once), sauf fast path
+    parsed = None
+    reason = None
+    if prompt is not None:
+        # recherche sémantique en parallèle du slot-filling (indépendants, même budget);
+        # update_wish ne lève pas, l'erreur éventuelle est celle de fill_slots
+        _, result = await asyncio.gather(
+            update_wish(sess, user_message, deadline),
+            fill_slots(sess, prompt, slot_cache_key(sess, state, user_message), state, user_message, deadline),
+            return_exceptions=True,
+        )
+        if isinstance(result, BaseException):
+            reason = degraded_reason(result) if isinstance(result, Exception) else None
+            if reason is None:
+                raise result
+            count_degraded(reason)
+        else:
+            parsed = result
+
+    out = finish_turn(session_id, sess, state, parsed)
+    await store_state(session_id, sess)
+    return with_degraded(out, reason)
+
+async def chat_turn_stream(session_id: str, user_message: str,
+                           budget_s: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Même tour que chat_turn, découpé en événements:
+    - "slots": slots après extraction simple + prochaine question + résultats
+      provisoires (sans la recherche sémantique, qui tourne pendant le slot-filling)
+    - "token": morceaux de la réponse LLM dès qu'ils arrivent
+    - "escalate": réponse du petit modèle rejetée, le 14B reprend (tokens à ignorer)
+    - "retry": la réponse du 14B n'était pas un JSON valide (tokens à ignorer)
+    - "degraded": {reason}: on se passe du LLM (tokens à ignorer)
+    - "final": {assistant, slots, cars, candidates, facets, degraded} comme chat_turn
+    """
+    deadline = turn_deadline(budget_s)
+    sess, state, prompt = begin_turn(await load_state(session_id), user_message)
+    count_turn(sess, skipped=prompt is None)
+    if prompt is None:
+        out = finish_turn(session_id, sess, state, None)
+        await store_state(session_id, sess)
+        yield {"event": "final", **with_degraded(out, None)}
+        return
+
+    wish = asyncio.create_task(update_wish(sess, user_message, deadline))
+    try:
+        async with aclosing(_stream_llm_turn(session_id, sess, state, prompt, user_message, deadline, wish)) as events:
+            async for ev in events:
+                yield ev
+    finally:
+        wish.cancel()  # client parti avant la fin du tour
+
+async def _stream_llm_turn(session_id: str, sess: Dict[str, Any], state: Dict[str, Any], prompt: str,
+                           user_message: str, deadline: Deadline, wish: "asyncio.Task") -> AsyncIterator[Dict[str, Any]]:
+    """Suite de chat_turn_stream quand le LLM est nécessaire; `wish` (recherche
+    sémantique) est attendue juste avant les résultats finaux."""
+    catalog, ids, facets = session_candidates(session_id, state)
+    total = len(ids)
+    missing = pick_missing(state, facets)
+    yield {
+        "event": "slots",
+        "slots": state,
+        "next_question": question_for_slot(missing) if missing else None,
+        "cars": search_for_session(sess, state, limit=15, candidates=(catalog, ids)) if missing is None else [],
+        "candidates": total,
+        "facets": facets,
+    }
+
+    cache_key = slot_cache_key(sess, state, user_message)
+    cached = await LLM_CACHE.aget(cache_key)
+    if cached is not None:
+        yield {"event": "token", "text": cached}
+        parsed = parse_llm_response(cached)
+        remember_exchange(sess, prompt, cached)
+        await wish
+        out = finish_turn(session_id, sess, state, parsed)
+        await store_state(session_id, sess)
+        yield {"event": "final", **with_degraded(out, None)}
+        return
+
+    parsed = None
+    reason = None
+    try:
+        async with aclosing(shared_slot_attempts(sess, prompt, state, user_message, cache_key, deadline)) as events:
+            async for ev in events:
+                if ev["event"] != "parsed":
+                    yield ev
+                    continue
+                parsed, raw = ev["parsed"], ev["raw"]
+                remember_exchange(sess, prompt, raw)
+    except Exception as e:
+        reason = degraded_reason(e)
+        if reason is None and isinstance(e, OllamaOverloaded):
+            reason = "overloaded"  # flux déjà commencé: trop tard pour un 429/503
+        if reason is None:
+            raise
+        count_degraded(reason)
+    if reason is not None:
+        yield {"event": "degraded", "reason": reason}
+
+    await wish
+    out = finish_turn(session_id, sess, state, parsed)
+    await store_state(session_id, sess)
+    yield {"event": "final", **with_degraded(out, reason)}
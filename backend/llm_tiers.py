@@ -0,0 +1,88 @@
+"""Niveaux de modèles pour le slot-filling: petit modèle d'abord, 14B en escalade.
+
+Remplir cinq slots quasi énumérés ne demande pas un 14B. Le petit modèle
+répond d'abord; llm_chat vérifie sa réponse (LLMResponse, normalize_slots,
+accord avec l'extraction déterministe) et n'appelle le 14B que si elle est
+rejetée. Les messages longs ou ambigus vont directement au 14B.
+
+    LLM_SMALL_MODEL=""  -> un seul niveau (14B), comme avant
+"""
+import os
+import re
+import threading
+from typing import Dict, Any, Optional
+
+import metrics
+from entities import fold
+
+
+class Tier:
+    def __init__(self, name: str, model: str, options: Dict[str, Any], timeout: Optional[float]):
+        self.name = name
+        self.model = model
+        self.options = options
+        self.timeout = timeout
+        self.calls = 0
+        self.outcomes: Dict[str, int] = {}
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, outcome: str) -> None:
+        with self._lock:
+            self.calls += 1
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self.seconds += seconds
+        metrics.LLM_TIER_SECONDS.observe(seconds, self.name)
+        metrics.LLM_TIER_CALLS.inc(self.name, outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            **self.outcomes,
+            "hit_rate": round(self.outcomes.get("accepted", 0) / self.calls, 3) if self.calls else None,
+            "avg_ms": round(self.seconds / self.calls * 1000, 1) if self.calls else None,
+        }
+
+
+# =========================
+# CONFIG (un jeu de réglages par niveau)
+# =========================
+def _timeout(name: str, default: str) -> Optional[float]:
+    v = float(os.environ.get(name, default))
+    return v if v > 0 else None
+
+SMALL = Tier(
+    "small",
+    os.environ.get("LLM_SMALL_MODEL", "qwen2.5:1.5b-instruct"),
+    {"temperature": 0.0, "num_predict": int(os.environ.get("LLM_SMALL_NUM_PREDICT", "150"))},
+    _timeout("LLM_SMALL_TIMEOUT", "20"),
+)
+LARGE = Tier(
+    "large",
+    os.environ.get("LLM_LARGE_MODEL", "qwen2.5:14b-instruct"),
+    {"temperature": 0.0, "num_predict": int(os.environ.get("LLM_LARGE_NUM_PREDICT", "250"))},
+    _timeout("LLM_LARGE_TIMEOUT", "0"),  # 0 = OLLAMA_TIMEOUT
+)
+
+# au-delà de ce nombre de mots, le message va directement au 14B
+LLM_SMALL_MAX_WORDS = int(os.environ.get("LLM_SMALL_MAX_WORDS", "12"))
+# négations, alternatives, hésitations: le petit modèle s'y trompe
+AMBIGUOUS_WORDS = {"pas", "sauf", "plutot", "ou", "mais", "sinon", "hesite", "finalement", "non", "ni"}
+
+
+def use_small(message: str) -> bool:
+    """Le message peut-il être confié au petit modèle ?"""
+    if not SMALL.model:
+        return False
+    words = re.findall(r"[\w-]+", fold(message or ""))
+    return len(words) <= LLM_SMALL_MAX_WORDS and not AMBIGUOUS_WORDS.intersection(words)
+
+
+def signature() -> Dict[str, Any]:
+    """Réglages qui changent les réponses (clé du cache LLM)."""
+    return {t.name: [t.model, t.options] for t in (SMALL, LARGE) if t.model}
+
+
+def stats() -> Dict[str, Any]:
+    return {t.name: t.stats() for t in (SMALL, LARGE) if t.model}
@@ -0,0 +1,215 @@
+"""Test de charge: rejoue des conversations multi-tours contre /chat.
+
+Les sessions arrivent selon un processus de Poisson (--rate sessions/s);
+chaque session rejoue ses tours dans l'ordre avec son propre session_id.
+Par défaut l'app tourne dans le process (httpx ASGITransport) devant le
+faux serveur Ollama (fake_ollama.py); --url vise un serveur déjà lancé.
+
+Rapport: débit, p50/p95/p99 par numéro de tour, erreurs par statut,
+évolution de SESSIONS (via /stats) et mémoire du process.
+
+    python loadtest.py --rate 5 --sessions 200 --latency lognormal:-0.5,0.6 --malformed 0.05
+    python loadtest.py --conversations convs.json --url http://127.0.0.1:8000 --json report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional, Sequence
+
+import httpx
+
+# conversations types (chaque liste = les messages d'une session)
+CONVERSATIONS: List[List[str]] = [
+    ["Bonjour", "un SUV", "diesel", "automatique", "moins de 250000", "Casablanca"],
+    ["je cherche une citadine essence à Rabat", "manuelle", "120 000 dh"],
+    ["SUV hybride automatique à Marrakech pour 300000 max"],
+    ["salut", "berline", "peu importe", "peu importe", "200k", "Fès"],
+    ["une voiture familiale pas trop chère pour partir en vacances", "break", "diesel",
+     "manuelle", "150000", "Tanger"],
+    ["pickup", "diesel", "manuelle", "budget max 280000", "peu importe"],
+]
+
+
+def load_conversations(path: str) -> List[Dict[str, Any]]:
+    """JSON: liste de listes de messages, ou de {"session_id": ..., "turns": [...]}."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return [c if isinstance(c, dict) else {"turns": c} for c in data]
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> Optional[float]:
+    """Percentile (rang le plus proche) d'une liste triée."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+def latency_summary(values: List[float]) -> Dict[str, Any]:
+    v = sorted(values)
+    ms = lambda x: round(x * 1000, 1) if x is not None else None
+    return {"n": len(v), "p50_ms": ms(percentile(v, 50)), "p95_ms": ms(percentile(v, 95)),
+            "p99_ms": ms(percentile(v, 99)), "max_ms": ms(v[-1] if v else None)}
+
+
+# =========================
+# Rejeu
+# =========================
+class LoadRun:
+    def __init__(self, client: httpx.AsyncClient, endpoint: str = "/chat", think: float = 0.0):
+        self.client = client
+        self.endpoint = endpoint
+        self.think = think
+        self.turns: List[tuple] = []      # (numéro de tour, latence s, statut)
+        self.samples: List[Dict[str, Any]] = []
+        self.final_stats: Dict[str, Any] = {}
+
+    async def session(self, session_id: str, turns: Sequence[str]) -> None:
+        for n, message in enumerate(turns, 1):
+            t0 = time.perf_counter()
+            try:
+                r = await self.client.post(self.endpoint, json={"session_id": session_id, "message": message})
+                await r.aread()
+                status = str(r.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            self.turns.append((n, time.perf_counter() - t0, status))
+            if self.think:
+                await asyncio.sleep(self.think)
+
+    async def sample_stats(self, t0: float) -> Optional[Dict[str, Any]]:
+        """GET /stats; garde l'état de SESSIONS à l'instant t."""
+        try:
+            stats = (await self.client.get("/stats")).json()
+        except Exception:
+            return None
+        self.samples.append({"t": round(time.perf_counter() - t0, 2), **stats.get("sessions", {})})
+        return stats
+
+    async def _sampler(self, t0: float, every: float) -> None:
+        while True:
+            await self.sample_stats(t0)
+            await asyncio.sleep(every)
+
+    async def run(self, conversations: List[Dict[str, Any]], sessions: int, rate: float,
+                  seed: int = 0, sample_every: float = 1.0) -> float:
+        rng = random.Random(seed)
+        t0 = time.perf_counter()
+        sampler = asyncio.create_task(self._sampler(t0, sample_every))
+        tasks = []
+        for i in range(sessions):
+            conv = conversations[i % len(conversations)]
+            sid = f"load-{i}-{conv.get('session_id', i % len(conversations))}"
+            tasks.append(asyncio.create_task(self.session(sid, conv["turns"])))
+            await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+        sampler.cancel()
+        self.final_stats = await self.sample_stats(t0) or {}
+        return elapsed
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        by_turn = defaultdict(list)
+        statuses = Counter()
+        ok = []
+        for n, dt, status in self.turns:
+            statuses[status] += 1
+            if status == "200":
+                ok.append(dt)
+                by_turn[n].append(dt)
+        total = len(self.turns)
+        first, last = (self.samples[0], self.samples[-1]) if self.samples else ({}, {})
+        return {
+            "duration_s": round(elapsed, 2),
+            "turns": total,
+            "throughput_turns_per_s": round(len(ok) / elapsed, 2) if elapsed else None,
+            "error_rate": round(1 - statuses["200"] / total, 4) if total else 0.0,
+            "statuses": dict(statuses),
+            "latency": latency_summary(ok),
+            "latency_by_turn": {str(n): latency_summary(v) for n, v in sorted(by_turn.items())},
+            "sessions": {
+                "start": first.get("sessions"),
+                "end": last.get("sessions"),
+                "peak": max((s.get("sessions") or 0 for s in self.samples), default=None),
+                "bytes_start": first.get("bytes"),
+                "bytes_end": last.get("bytes"),
+                "timeline": self.samples,
+            },
+        }
+
+
+def print_report(r: Dict[str, Any]) -> None:
+    print(f"{r['turns']} tours en {r['duration_s']} s  ->  {r['throughput_turns_per_s']} tours/s, "
+          f"erreurs {r['error_rate']:.2%}  {r['statuses']}")
+    lat = r["latency"]
+    print(f"latence: p50 {lat['p50_ms']} ms  p95 {lat['p95_ms']} ms  p99 {lat['p99_ms']} ms  max {lat['max_ms']} ms")
+    print(f"{'tour':>4} {'n':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for n, s in r["latency_by_turn"].items():
+        print(f"{n:>4} {s['n']:>6} {s['p50_ms']:>10} {s['p95_ms']:>10} {s['p99_ms']:>10}")
+    s = r["sessions"]
+    print(f"SESSIONS: {s['start']} -> {s['end']} (pic {s['peak']}), octets {s['bytes_start']} -> {s['bytes_end']}")
+    if "process" in r:
+        print(f"process: RSS max {r['process']['max_rss_mb']} MB")
+    if "fake_ollama" in r:
+        print(f"faux Ollama: {r['fake_ollama']}")
+
+
+async def main(args) -> Dict[str, Any]:
+    conversations = (load_conversations(args.conversations) if args.conversations
+                     else [{"turns": t} for t in CONVERSATIONS])
+    fake = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        import fake_ollama
+        fake = fake_ollama.start(port=0, latency=args.latency, malformed=args.malformed, seed=args.seed)
+        # la config est lue à l'import: à régler avant d'importer l'app
+        os.environ["OLLAMA_BASE"] = f"http://127.0.0.1:{fake.server_port}"
+        if args.no_cache:
+            os.environ["LLM_CACHE_SIZE"] = "0"
+        import api
+        # erreurs de l'app => 500 comme derrière uvicorn (pas d'exception côté client)
+        transport = httpx.ASGITransport(app=api.app, raise_app_exceptions=False)
+        client = httpx.AsyncClient(transport=transport,
+                                   base_url="http://loadtest", timeout=args.timeout)
+
+    async with client:
+        runner = LoadRun(client, endpoint=args.endpoint, think=args.think)
+        elapsed = await runner.run(conversations, args.sessions, args.rate, seed=args.seed)
+
+    report = runner.report(elapsed)
+    report["config"] = {k: v for k, v in vars(args).items() if k != "json"}
+    report["server"] = {k: v for k, v in runner.final_stats.items() if k != "sessions"}
+    if fake is not None:
+        report["fake_ollama"] = {"calls": fake.calls, "malformed_sent": fake.malformed_sent}
+        report["process"] = {"max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+        fake.shutdown()
+    return report
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Rejoue des conversations contre /chat")
+    ap.add_argument("--conversations", help="fichier JSON de conversations (défaut: exemples intégrés)")
+    ap.add_argument("--sessions", type=int, default=100)
+    ap.add_argument("--rate", type=float, default=5.0, help="arrivées de sessions par seconde")
+    ap.add_argument("--think", type=float, default=0.0, help="pause entre deux tours d'une session (s)")
+    ap.add_argument("--endpoint", default="/chat", choices=["/chat", "/chat/stream"])
+    ap.add_argument("--url", help="serveur déjà lancé (sinon app + faux Ollama dans le process)")
+    ap.add_argument("--latency", default="lognormal:-0.5,0.6", help="distribution de latence du faux Ollama")
+    ap.add_argument("--malformed", type=float, default=0.05, help="part de réponses JSON invalides")
+    ap.add_argument("--no-cache", action="store_true", help="désactive le cache LLM (mode en process)")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="écrit le rapport JSON dans ce fichier")
+    args = ap.parse_args()
+
+    report = asyncio.run(main(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
@@ -0,0 +1,204 @@
+"""Métriques Prometheus (format texte) + temps par étape pour Server-Timing.
+
+Sans dépendance: histogrammes et compteurs minimaux, rendus par render()
+pour GET /metrics. Chaque étape chronométrée avec stage() alimente
+l'histogramme smartdrive_stage_seconds et, si une requête HTTP est en
+cours (begin_request), la liste des durées renvoyée dans Server-Timing.
+
+    with metrics.stage("chat", "search"):
+        cars = search_cars(...)
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# bornes (s): du µs de l'extraction aux dizaines de secondes du 14B sur CPU
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+# =========================
+# Types de métriques
+# =========================
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        values = self._values or ({(): 0} if not self.labelnames else {})
+        for labels, v in sorted(values.items()):
+            out.append(f"{self.name}{_labels(self.labelnames, labels)} {v:g}")
+        return out
+
+
+class Gauge:
+    """Valeur lue au moment du rendu (ex: nombre de sessions)."""
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> List[str]:
+        try:
+            v = self.read()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {v:g}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [compte par bucket (+Inf en dernier), somme, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def count(self, *labels: str) -> int:
+        s = self._series.get(labels)
+        return s[2] if s else 0
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for labels, counts, total, n in series:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket = _labels(self.labelnames, labels, 'le="%s"' % le)
+                out.append(f"{self.name}_bucket{bucket} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total:.6f}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {n}")
+        return out
+
+
+REGISTRY: List = []
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+def render() -> str:
+    lines: List[str] = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# =========================
+# Métriques de l'app
+# =========================
+STAGE_SECONDS = register(Histogram(
+    "smartdrive_stage_seconds", "Durée de chaque étape d'un tour", ("flow", "stage")))
+LLM_PREFILL = register(Histogram(
+    "smartdrive_llm_prefill_seconds",
+    "Délai avant le premier token du LLM (prefill); mode=prefix: sans historique, history: avec",
+    ("mode",)))
+LLM_PROMPT_TOKENS = register(Counter(
+    "smartdrive_llm_prompt_tokens_total", "Tokens de prompt évalués par Ollama (prompt_eval_count)", ("mode",)))
+LLM_TIER_SECONDS = register(Histogram(
+    "smartdrive_llm_tier_seconds", "Durée d'un appel de slot-filling par niveau de modèle", ("tier",)))
+LLM_TIER_CALLS = register(Counter(
+    "smartdrive_llm_tier_calls_total",
+    "Appels par niveau; outcome=accepted, invalid, disagree (petit modèle), error", ("tier", "outcome")))
+LLM_COALESCED = register(Counter(
+    "smartdrive_llm_coalesced_total", "Tours servis par un appel LLM identique déjà en cours"))
+LLM_RETRIES = register(Counter(
+    "smartdrive_llm_retries_total", "Relances du LLM après une réponse JSON invalide"))
+EARLY_STOPS = register(Counter(
+    "smartdrive_llm_early_stops_total", "Générations coupées dès la fermeture de l'objet JSON"))
+PARSE_FAILURES = register(Counter(
+    "smartdrive_llm_parse_failures_total", "Réponses LLM non conformes à LLMResponse"))
+EMPTY_SEARCHES = register(Counter(
+    "smartdrive_empty_searches_total", "Recherches sans résultat", ("flow",)))
+DEGRADED_TURNS = register(Counter(
+    "smartdrive_degraded_turns_total",
+    "Tours servis sans LLM (réponse déterministe); reason=deadline, circuit_open, overloaded, ...",
+    ("reason",)))
+TURNS = register(Counter(
+    "smartdrive_turns_total", "Tours de conversation (path=fast: sans LLM)", ("path",)))
+
+
+# =========================
+# Chronométrage par étape
+# =========================
+# durées de la requête HTTP en cours: [(étape, secondes)], None hors requête
+_TIMINGS: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = \
+    contextvars.ContextVar("stage_timings", default=None)
+
+def begin_request() -> List[Tuple[str, float]]:
+    """À appeler au début d'une requête: les étapes suivantes y sont ajoutées."""
+    timings: List[Tuple[str, float]] = []
+    _TIMINGS.set(timings)
+    return timings
+
+def record(flow: str, name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, flow, name)
+    timings = _TIMINGS.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+class stage:
+    """Chronomètre un bloc: `with stage("chat", "llm"): ...`"""
+    __slots__ = ("flow", "name", "t0")
+
+    def __init__(self, flow: str, name: str):
+        self.flow = flow
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.flow, self.name, time.perf_counter() - self.t0)
+        return False
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    """[("llm", 0.81)] -> "llm;dur=810.000" (ms). Étapes répétées: suffixe _2, _3..."""
+    seen: Dict[str, int] = {}
+    parts = []
+    for name, seconds in timings:
+        seen[name] = seen.get(name, 0) + 1
+        key = name if seen[name] == 1 else f"{name}_{seen[name]}"
+        parts.append(f"{key};dur={seconds * 1000:.3f}")
+    return ", ".join(parts)
@@ -1,14 +1,36 @@
 from neo4j import GraphDatabase
 import os
+import threading
 
-NEO4J_URI = "neo4j://localhost:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASSWORD = "12345678"  # 🔴 mets TON mot de passe Neo4j ici
+NEO4J_URI = os.environ.get("NEO4J_URI", "neo4j://localhost:7687")
+NEO4J_USER = os.environ.get("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.environ.get("NEO4J_PASSWORD", "12345678")  # 🔴 mets TON mot de passe Neo4j ici
 
-driver = GraphDatabase.driver(
-    NEO4J_URI,
-    auth=(NEO4J_USER, NEO4J_PASSWORD)
-)
+# Pool de connexions (à dimensionner selon le nb de workers / threads)
+NEO4J_MAX_POOL_SIZE = int(os.environ.get("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUIRE_TIMEOUT = float(os.environ.get("NEO4J_ACQUIRE_TIMEOUT", "10"))
+NEO4J_MAX_CONN_LIFETIME = float(os.environ.get("NEO4J_MAX_CONN_LIFETIME", "3600"))
+
+# ouvert au premier usage: importer le module ne se connecte à rien
+_driver = None
+_driver_lock = threading.Lock()
+
+def get_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            _driver = GraphDatabase.driver(
+                NEO4J_URI,
+                auth=(NEO4J_USER, NEO4J_PASSWORD),
+                max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_ACQUIRE_TIMEOUT,
+                max_connection_lifetime=NEO4J_MAX_CONN_LIFETIME,
+            )
+        return _driver
 
 def close_driver():
-    driver.close()
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
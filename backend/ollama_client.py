@@ -0,0 +1,435 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from deadline import current_deadline
+
+# =========================
+# OLLAMA CONFIG
+# =========================
+OLLAMA_BASE = os.environ.get("OLLAMA_BASE", "http://127.0.0.1:11434")
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "120"))
+
+# nb de générations en parallèle côté Ollama (OLLAMA_NUM_PARALLEL)
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", "2"))
+# nb max de requêtes en attente d'un slot; au-delà => 429
+OLLAMA_MAX_QUEUE = int(os.environ.get("OLLAMA_MAX_QUEUE", "32"))
+# attente max d'un slot; au-delà => 503
+OLLAMA_QUEUE_TIMEOUT = float(os.environ.get("OLLAMA_QUEUE_TIMEOUT", "30"))
+# disjoncteur (un par modèle): ouvert après N échecs consécutifs, réessai après la pause (s)
+OLLAMA_BREAKER_FAILURES = int(os.environ.get("OLLAMA_BREAKER_FAILURES", "5"))
+OLLAMA_BREAKER_COOLDOWN = float(os.environ.get("OLLAMA_BREAKER_COOLDOWN", "30"))
+# durée pendant laquelle Ollama garde le modèle chargé après un appel ("-1" = toujours)
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# micro-batching du slot-filling: fenêtre de regroupement (ms); 0 = désactivé
+OLLAMA_BATCH_WINDOW_MS = float(os.environ.get("OLLAMA_BATCH_WINDOW_MS", "0"))
+
+
+class OllamaOverloaded(Exception):
+    """File d'attente pleine (429) ou attente trop longue (503)."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OllamaUnavailable(OllamaOverloaded):
+    """Disjoncteur ouvert: le modèle a échoué plusieurs fois de suite, on ne l'appelle plus."""
+
+    def __init__(self, message: str = "LLM circuit open"):
+        super().__init__(message, 503)
+
+
+# =========================
+# File d'attente bornée devant le modèle
+# =========================
+class OllamaGate:
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_waiting_seen = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._loop is not loop:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._sem
+
+    @asynccontextmanager
+    async def slot(self):
+        sem = self._semaphore()
+        t0 = time.perf_counter()
+        if not sem.locked():
+            # un slot est libre: pas de file d'attente
+            await sem.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected_full += 1
+                raise OllamaOverloaded("LLM queue full", 429)
+
+            self.waiting += 1
+            self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+            try:
+                await asyncio.wait_for(sem.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise OllamaOverloaded("LLM queue wait timeout", 503)
+            finally:
+                self.waiting -= 1
+
+        waited = time.perf_counter() - t0
+        self.admitted += 1
+        self.wait_total_s += waited
+        self.wait_max_s = max(self.wait_max_s, waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            sem.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_depth": self.waiting,
+            "queue_depth_max": self.max_waiting_seen,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_avg_ms": round(1000 * self.wait_total_s / self.admitted, 2) if self.admitted else 0.0,
+            "wait_max_ms": round(1000 * self.wait_max_s, 2),
+        }
+
+
+gate = OllamaGate(OLLAMA_MAX_CONCURRENCY, OLLAMA_MAX_QUEUE, OLLAMA_QUEUE_TIMEOUT)
+
+
+# =========================
+# Disjoncteur autour d'Ollama
+# =========================
+def is_backend_failure(e: BaseException) -> bool:
+    """Erreur qui dit qu'Ollama est en panne ou trop lent (pas une erreur de la requête)."""
+    if isinstance(e, httpx.TransportError):
+        return True
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """closed -> (N échecs consécutifs) -> open -> (pause) -> half_open: un seul
+    appel d'essai; succès => closed, échec => open pour une nouvelle pause.
+    Tant qu'il est ouvert, les appels échouent tout de suite (OllamaUnavailable)
+    au lieu d'attendre un timeout."""
+
+    def __init__(self, max_failures: int, cooldown_s: float):
+        self.max_failures = max_failures
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def check(self) -> None:
+        """À appeler avant un appel: lève OllamaUnavailable si le circuit est ouvert."""
+        if self.max_failures <= 0:
+            return
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown_s:
+                self.state, self._probe = "half_open", False
+            if self.state == "closed" or (self.state == "half_open" and not self._probe):
+                self._probe = self.state == "half_open"
+                return
+            self.rejected += 1
+        raise OllamaUnavailable()
+
+    def success(self) -> None:
+        with self._lock:
+            self.state, self.failures, self._probe = "closed", 0, False
+
+    def release(self) -> None:
+        """Appel terminé sans verdict sur le backend (ex: file pleine): rend l'essai."""
+        with self._lock:
+            self._probe = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.max_failures):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+# un disjoncteur par modèle: un petit modèle lent ne coupe pas le 14B
+breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def breaker_for(model: Optional[str]) -> CircuitBreaker:
+    key = model or ""
+    with _breakers_lock:
+        b = breakers.get(key)
+        if b is None:
+            b = breakers[key] = CircuitBreaker(OLLAMA_BREAKER_FAILURES, OLLAMA_BREAKER_COOLDOWN)
+        return b
+
+def breaker_stats() -> Dict[str, Any]:
+    with _breakers_lock:
+        return {model: b.stats() for model, b in breakers.items()}
+
+def open_circuits() -> int:
+    with _breakers_lock:
+        return sum(b.state != "closed" for b in breakers.values())
+
+
+def _cancelled(breaker: CircuitBreaker) -> None:
+    """Appel annulé: coupé par le budget de la requête = backend trop lent;
+    client parti (fermeture de /chat/stream) ou tâche sœur annulée par un
+    gather = rien à reprocher au backend."""
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired():
+        breaker.failure()
+    else:
+        breaker.release()
+
+
+@asynccontextmanager
+async def _guarded(model: Optional[str]):
+    """Appel complet (non streamé) sous le disjoncteur du modèle."""
+    breaker = breaker_for(model)
+    breaker.check()
+    try:
+        yield
+    except Exception as e:
+        breaker.failure() if is_backend_failure(e) else breaker.release()
+        raise
+    except asyncio.CancelledError:
+        _cancelled(breaker)
+        raise
+    breaker.success()
+
+
+@asynccontextmanager
+async def _stream_guard(model: Optional[str]):
+    """Appel streamé sous le disjoncteur du modèle: le premier chunk suffit à dire
+    qu'il répond; un échec ou une coupure (budget) avant lui compte comme échec."""
+    breaker = breaker_for(model)
+    breaker.check()
+    state = {"ok": False}
+
+    def first_chunk() -> None:
+        if not state["ok"]:
+            state["ok"] = True
+            breaker.success()
+
+    try:
+        yield first_chunk
+    except Exception as e:
+        if not state["ok"]:
+            breaker.failure() if is_backend_failure(e) else breaker.release()
+        raise
+    except asyncio.CancelledError:
+        if not state["ok"]:
+            _cancelled(breaker)
+        raise
+
+
+# =========================
+# Micro-batching (optionnel)
+# =========================
+class MicroBatcher:
+    """Regroupe les requêtes arrivées dans une fenêtre de quelques ms et les
+    libère ensemble (ou dès que le lot atteint max_batch = OLLAMA_NUM_PARALLEL):
+    elles arrivent en même temps chez Ollama, qui les décode dans le même lot
+    au lieu de les enchaîner au fil des arrivées."""
+
+    def __init__(self, window_s: float, max_batch: int):
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self._pending: list = []
+        self._timer = None
+        self.batches = 0
+        self.requests = 0
+        self.batched = 0  # requêtes parties dans un lot de 2 ou plus
+        self.largest = 0
+
+    async def wait(self) -> None:
+        if self.window_s <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append(fut)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        live = [f for f in batch if not f.done()]  # annulées pendant l'attente
+        if not live:
+            return
+        self.batches += 1
+        self.requests += len(live)
+        if len(live) > 1:
+            self.batched += len(live)
+        self.largest = max(self.largest, len(live))
+        for f in live:
+            f.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_s * 1000,
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "largest": self.largest,
+            "batched_rate": round(self.batched / self.requests, 3) if self.requests else 0.0,
+        }
+
+
+batcher = MicroBatcher(OLLAMA_BATCH_WINDOW_MS / 1000, OLLAMA_MAX_CONCURRENCY)
+
+
+# =========================
+# Clients HTTP partagés (pool de connexions)
+# =========================
+_async_client: Optional[httpx.AsyncClient] = None
+_async_loop = None
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def async_client() -> httpx.AsyncClient:
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            base_url=OLLAMA_BASE,
+            timeout=OLLAMA_TIMEOUT,
+            limits=httpx.Limits(max_connections=OLLAMA_MAX_CONCURRENCY * 2,
+                                max_keepalive_connections=OLLAMA_MAX_CONCURRENCY * 2),
+        )
+        _async_loop = loop
+    return _async_client
+
+def session() -> requests.Session:
+    """requests.Session partagée pour les appelants synchrones (semantic_index)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_MAX_CONCURRENCY * 2)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+async def aclose() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+# =========================
+# Appels
+# =========================
+async def agenerate(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """POST /api/generate (stream=False) derrière la file bornée."""
+    async with _guarded(payload.get("model")):
+        async with gate.slot():
+            r = await async_client().post("/api/generate", json=dict(payload, stream=False))
+        r.raise_for_status()
+    return r.json()
+
+async def astream_generate(payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """POST /api/generate (stream=True): rend chaque chunk JSON d'Ollama."""
+    async with _stream_guard(payload.get("model")) as first_chunk:
+        async with gate.slot():
+            async with async_client().stream("POST", "/api/generate", json=dict(payload, stream=True)) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    first_chunk()
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+
+async def awarm(payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """POST /api/chat (stream=False) hors file et hors disjoncteur: préchauffage
+    au démarrage, avant le premier vrai tour."""
+    r = await async_client().post("/api/chat", json=dict(payload, stream=False), timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+async def astream_chat(payload: Dict[str, Any],
+                       timings: Optional[Dict[str, Any]] = None,
+                       timeout: Optional[float] = None,
+                       batch: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """POST /api/chat (stream=True): rend chaque chunk JSON d'Ollama.
+
+    timings (optionnel) reçoit "ttft" (s, du slot obtenu au premier chunk: le
+    prefill côté Ollama) et, si le flux va jusqu'au bout, "prompt_eval_count" /
+    "prompt_eval_s" rapportés par Ollama.
+    timeout: remplace OLLAMA_TIMEOUT pour cet appel (ex: petit modèle).
+    batch: passe par le micro-batching (si OLLAMA_BATCH_WINDOW_MS > 0)."""
+    extra = {"timeout": timeout} if timeout is not None else {}
+    async with _stream_guard(payload.get("model")) as first_chunk:
+        if batch:
+            await batcher.wait()
+        async with gate.slot():
+            t0 = time.perf_counter()
+            async with async_client().stream("POST", "/api/chat", json=dict(payload, stream=True), **extra) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    first_chunk()
+                    if timings is not None:
+                        timings.setdefault("ttft", time.perf_counter() - t0)
+                        if chunk.get("done") and "prompt_eval_count" in chunk:
+                            timings["prompt_eval_count"] = chunk["prompt_eval_count"]
+                            timings["prompt_eval_s"] = chunk.get("prompt_eval_duration", 0) / 1e9
+                    yield chunk
+                    if chunk.get("done"):
+                        break
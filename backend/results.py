@@ -0,0 +1,155 @@
+"""Pagination des résultats classés (GET /results).
+
+La première page classe tous les candidats des slots (score statique +
+bonus budget, comme smart_ai.rank_cars) et garde la liste d'ids classés
+dans un cache LRU. Le curseur renvoyé est opaque (JSON en base64url): il
+contient les slots au moment de la première page et la dernière position
+(score, id). Les pages suivantes retrouvent cette position par recherche
+dichotomique dans la liste en cache, sans refiltrer ni rescorer. Si la
+liste a été évincée (ou le catalogue rechargé), elle est reconstruite
+pour ces slots et la lecture reprend après (score, id).
+"""
+import base64
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from catalog import CarCatalog, get_catalog
+from llm_chat import SLOT_DEFAULTS, normalize_slots, slot_filters
+from smart_ai import budget_bonus, get_static_scores
+
+RESULTS_PAGE_SIZE = int(os.environ.get("RESULTS_PAGE_SIZE", "15"))
+RESULTS_MAX_PAGE_SIZE = 100
+# listes classées gardées (une par jeu de slots et version du catalogue)
+RESULTS_CACHE_SIZE = int(os.environ.get("RESULTS_CACHE_SIZE", "256"))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# =========================
+# Curseur opaque
+# =========================
+def encode_cursor(slots: Dict[str, Any], score: int, car_id: int) -> str:
+    raw = json.dumps({"slots": slots, "after": [score, car_id]}, separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def is_int(v: Any) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+def check_slots(slots: Any) -> Dict[str, Any]:
+    """Slots d'un curseur: exactement ceux de encode_cursor (tous les slots,
+    déjà normalisés). Le curseur vient du client: rien d'autre n'est accepté."""
+    if not isinstance(slots, dict):
+        raise InvalidCursor("invalid cursor: slots must be an object")
+    if set(slots) != set(SLOT_DEFAULTS):
+        raise InvalidCursor("invalid cursor: unexpected slot keys")
+    for k, v in slots.items():
+        ok = (is_int(v) or v in ("ANY", "UNSET")) if k == "price_max" else isinstance(v, str)
+        if not ok:
+            raise InvalidCursor(f"invalid cursor: bad value for {k}")
+    if normalize_slots(slots) != slots:
+        raise InvalidCursor("invalid cursor: slots not normalized")
+    return dict(slots)
+
+def decode_cursor(cursor: str) -> Tuple[Dict[str, Any], Tuple[int, int]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise TypeError("cursor must be an object")
+        after = data["after"]
+        if not (isinstance(after, list) and len(after) == 2 and all(is_int(v) for v in after)):
+            raise TypeError("after must be [score, id]")
+        slots = data["slots"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"invalid cursor: {e}") from None
+    return check_slots(slots), (after[0], after[1])
+
+
+# =========================
+# Listes classées (cache LRU)
+# =========================
+class RankedList:
+    """Candidats triés par score décroissant puis id croissant."""
+
+    def __init__(self, catalog: CarCatalog, slots: Dict[str, Any]):
+        filters = slot_filters(slots)
+        ids = catalog.select(**filters)
+        entries = get_static_scores(catalog).entries
+        prices = catalog.prices
+        price_max = filters["price_max"]
+        scores = [entries[i][0] + budget_bonus(prices[i], None, price_max)[0] for i in ids]
+
+        ids_a = np.array(ids, dtype=np.int64)
+        neg = -np.array(scores, dtype=np.int64)
+        order = np.lexsort((ids_a, neg))
+        self.ids = ids_a[order]
+        self.neg_scores = neg[order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def position_after(self, score: int, car_id: int) -> int:
+        """Index du premier élément strictement après (score, id) dans l'ordre du classement."""
+        lo = int(np.searchsorted(self.neg_scores, -score, side="left"))
+        hi = int(np.searchsorted(self.neg_scores, -score, side="right"))
+        return lo + int(np.searchsorted(self.ids[lo:hi], car_id, side="right"))
+
+
+class RankedCache:
+    def __init__(self, max_entries: int = RESULTS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[tuple, RankedList]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, catalog: CarCatalog, slots: Dict[str, Any]) -> RankedList:
+        key = (id(catalog), catalog.version, json.dumps(slots, sort_keys=True, ensure_ascii=False))
+        with self._lock:
+            ranked = self._data.get(key)
+            if ranked is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return ranked
+            self.misses += 1
+        ranked = RankedList(catalog, slots)
+        with self._lock:
+            self._data[key] = ranked
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return ranked
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+RANKED = RankedCache()
+
+
+def results_page(slots: Dict[str, Any], after: Optional[Tuple[int, int]] = None,
+                 limit: int = RESULTS_PAGE_SIZE) -> Dict[str, Any]:
+    """Une page de résultats: {cars, total, next_cursor} (next_cursor=None en fin de liste)."""
+    limit = max(1, min(limit, RESULTS_MAX_PAGE_SIZE))
+    catalog = get_catalog()
+    ranked = RANKED.get(catalog, slots)
+    start = ranked.position_after(*after) if after is not None else 0
+
+    cars: List[Dict[str, Any]] = []
+    for i, neg in zip(ranked.ids[start:start + limit].tolist(), ranked.neg_scores[start:start + limit].tolist()):
+        c = catalog.cars[i]
+        if c is None:
+            continue  # supprimée depuis le classement
+        cars.append({**c, "id": i, "score": -neg})
+
+    end = start + limit
+    next_cursor = None
+    if end < len(ranked):
+        next_cursor = encode_cursor(slots, -int(ranked.neg_scores[end - 1]), int(ranked.ids[end - 1]))
+    return {"cars": cars, "total": len(ranked), "next_cursor": next_cursor}
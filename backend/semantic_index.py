@@ -0,0 +1,327 @@
+"""Recherche sémantique des annonces (FAISS, index mappé en mémoire).
+
+- l'index de base est ouvert en mmap (lecture seule): plusieurs workers
+  partagent les mêmes pages
+- les ajouts/modifs vont dans un petit index delta en mémoire, les
+  suppressions dans un ensemble d'ids masqués; `rebuild` compacte le tout
+- les annonces modifiées sont embeddées en tâche de fond (EMBED_QUEUE):
+  une mise à jour du catalogue n'attend jamais Ollama
+- les requêtes sont embeddées via l'endpoint embeddings local d'Ollama
+
+Les ids FAISS sont les ids du catalogue (position dans cars.json).
+
+    python semantic_index.py rebuild      # (re)construit rag_index.faiss
+"""
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Optional, Sequence
+
+import faiss
+import numpy as np
+
+import ollama_client
+from catalog import CATALOG, CarCatalog, get_catalog
+
+# =========================
+# CONFIG
+# =========================
+SEMANTIC_SEARCH = os.environ.get("SEMANTIC_SEARCH", "0") == "1"
+SEMANTIC_INDEX = os.environ.get("SEMANTIC_INDEX", "rag_index.faiss")
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "nomic-embed-text")
+SEMANTIC_TOP_K = int(os.environ.get("SEMANTIC_TOP_K", "200"))
+# IVF à partir de cette taille (sinon index exact)
+IVF_MIN_VECTORS = 20000
+IVF_NPROBE = int(os.environ.get("SEMANTIC_NPROBE", "16"))
+EMBED_BATCH = 64
+# mises à jour en échec: nouvel essai après la pause (s), abandon après N essais
+EMBED_RETRY_S = float(os.environ.get("SEMANTIC_EMBED_RETRY_S", "5"))
+EMBED_MAX_ATTEMPTS = 3
+
+
+def meta_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + ".json"
+
+def listing_text(c: Dict[str, Any]) -> str:
+    parts = [c.get("title") or c.get("model"), c.get("brand"), c.get("type"), c.get("fuel"),
+             c.get("gearbox"), c.get("city")]
+    if c.get("year"):
+        parts.append(f"{c['year']}")
+    if c.get("km") is not None:
+        parts.append(f"{c['km']} km")
+    if c.get("price"):
+        parts.append(f"{c['price']} MAD")
+    return " ".join(str(p) for p in parts if p)
+
+
+# =========================
+# Embeddings (Ollama)
+# =========================
+def _to_matrix(vectors) -> np.ndarray:
+    x = np.asarray(vectors, dtype="float32")
+    faiss.normalize_L2(x)  # produit scalaire = cosinus
+    return x
+
+def embed(texts: Sequence[str]) -> np.ndarray:
+    out = []
+    for i in range(0, len(texts), EMBED_BATCH):
+        r = ollama_client.session().post(
+            f"{ollama_client.OLLAMA_BASE}/api/embed",
+            json={"model": EMBED_MODEL, "input": list(texts[i:i + EMBED_BATCH])},
+            timeout=ollama_client.OLLAMA_TIMEOUT,
+        )
+        r.raise_for_status()
+        out.extend(r.json()["embeddings"])
+    return _to_matrix(out)
+
+async def aembed(text: str) -> np.ndarray:
+    r = await ollama_client.async_client().post(
+        "/api/embed", json={"model": EMBED_MODEL, "input": [text]}
+    )
+    r.raise_for_status()
+    return _to_matrix(r.json()["embeddings"])
+
+
+# =========================
+# Index
+# =========================
+def build_index(x: np.ndarray, ids: np.ndarray) -> faiss.Index:
+    d = x.shape[1]
+    if len(x) >= IVF_MIN_VECTORS:
+        nlist = int(4 * np.sqrt(len(x)))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(d), d, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(x)
+    else:
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+    index.add_with_ids(x, ids.astype("int64"))
+    return index
+
+
+class SemanticIndex:
+    def __init__(self, path: str = SEMANTIC_INDEX):
+        self.path = path
+        with open(meta_path(path), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("model") != EMBED_MODEL:
+            raise ValueError(f"{path} built with {self.meta.get('model')}, not {EMBED_MODEL}")
+
+        self.base = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        if hasattr(self.base, "nprobe"):
+            self.base.nprobe = IVF_NPROBE
+        self.dim = self.base.d
+
+        self.delta = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        self.hidden: set = set()   # ids supprimés ou remplacés dans le delta
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.base.ntotal + self.delta.ntotal
+
+    # -------- mises à jour incrémentales --------
+    def upsert(self, car_id: int, vector: np.ndarray) -> None:
+        with self._lock:
+            self.delta.remove_ids(np.array([car_id], dtype="int64"))
+            self.delta.add_with_ids(vector.reshape(1, -1), np.array([car_id], dtype="int64"))
+            self.hidden.add(car_id)  # masque l'ancienne version dans la base
+
+    def remove(self, car_id: int) -> None:
+        with self._lock:
+            self.delta.remove_ids(np.array([car_id], dtype="int64"))
+            self.hidden.add(car_id)
+
+    # -------- recherche --------
+    def search_vector(self, q: np.ndarray, k: int = SEMANTIC_TOP_K) -> List[int]:
+        """Ids des k annonces les plus proches (base + delta, sans les masquées)."""
+        with self._lock:
+            hidden = set(self.hidden)
+            # on demande un peu plus à la base pour compenser les ids masqués
+            b_scores, b_ids = self.base.search(q, k + min(len(hidden), k))
+            if self.delta.ntotal:
+                d_scores, d_ids = self.delta.search(q, min(k, self.delta.ntotal))
+            else:
+                d_scores = d_ids = np.zeros((1, 0))
+
+        scored = [(float(s), int(i)) for s, i in zip(b_scores[0], b_ids[0])
+                  if i >= 0 and int(i) not in hidden]
+        scored += [(float(s), int(i)) for s, i in zip(d_scores[0], d_ids[0]) if i >= 0]
+        scored.sort(key=lambda t: -t[0])
+        return [i for _, i in scored[:k]]
+
+    async def search(self, text: str, k: int = SEMANTIC_TOP_K) -> List[int]:
+        return self.search_vector(await aembed(text), k)
+
+
+# =========================
+# Mises à jour en tâche de fond
+# =========================
+class EmbedQueue:
+    """Annonces à (ré)embedder, traitées par lots dans un thread. Seule la
+    dernière version compte: l'annonce est relue dans le catalogue au moment
+    de l'embedding. Une erreur d'Ollama ne remonte jamais au catalogue."""
+
+    def __init__(self):
+        self._pending: Dict[int, CarCatalog] = {}
+        self._attempts: Dict[int, int] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._busy = False
+        self.embedded = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_error: Optional[str] = None
+
+    def put(self, catalog: CarCatalog, car_id: int) -> None:
+        with self._cond:
+            self._pending[car_id] = catalog
+            self._attempts.pop(car_id, None)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="semantic-embed", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """True une fois la file vide et aucun lot en cours (tests, outils)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                batch = list(self._pending.items())[:EMBED_BATCH]
+                for car_id, _ in batch:
+                    del self._pending[car_id]
+                self._busy = True
+            try:
+                failed = self._embed(batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+            if failed:
+                time.sleep(EMBED_RETRY_S)
+                self._retry(failed)
+
+    def _embed(self, batch) -> list:
+        index = _INDEX
+        if index is None:
+            return []
+        todo = []
+        for car_id, catalog in batch:
+            c = catalog.cars[car_id] if car_id < len(catalog) else None
+            if c is None:
+                index.remove(car_id)
+            else:
+                todo.append((car_id, catalog, listing_text(c)))
+        if not todo:
+            return []
+        try:
+            vectors = embed([text for _, _, text in todo])
+        except Exception as e:
+            self.failed += len(todo)
+            self.last_error = f"{type(e).__name__}: {e}"
+            return [(car_id, catalog) for car_id, catalog, _ in todo]
+        for (car_id, _, _), v in zip(todo, vectors):
+            index.upsert(car_id, v)
+        with self._cond:
+            for car_id, _, _ in todo:
+                self._attempts.pop(car_id, None)
+        self.embedded += len(todo)
+        return []
+
+    def _retry(self, failed) -> None:
+        with self._cond:
+            for car_id, catalog in failed:
+                if car_id in self._pending:
+                    continue  # une version plus récente attend déjà
+                attempts = self._attempts.get(car_id, 1) + 1
+                if attempts > EMBED_MAX_ATTEMPTS:
+                    self._attempts.pop(car_id, None)
+                    self.dropped += 1
+                    continue
+                self._attempts[car_id] = attempts
+                self._pending[car_id] = catalog
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "embedded": self.embedded,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "last_error": self.last_error,
+        }
+
+
+EMBED_QUEUE = EmbedQueue()
+
+
+# =========================
+# Instance partagée (optionnelle)
+# =========================
+_INDEX: Optional[SemanticIndex] = None
+_INDEX_ERROR: Optional[str] = None
+
+def get_index() -> Optional[SemanticIndex]:
+    """None si la recherche sémantique est désactivée ou l'index absent/incompatible."""
+    global _INDEX, _INDEX_ERROR
+    if not SEMANTIC_SEARCH or _INDEX_ERROR is not None:
+        return None
+    if _INDEX is None:
+        try:
+            _INDEX = SemanticIndex()
+        except Exception as e:
+            _INDEX_ERROR = str(e)
+            return None
+        get_catalog().subscribe(_on_catalog_change)
+        CATALOG.on_reload(_on_catalog_reload)
+    return _INDEX
+
+def _on_catalog_change(catalog: CarCatalog, car_id: int) -> None:
+    if _INDEX is None:
+        return
+    if catalog.cars[car_id] is None:
+        _INDEX.remove(car_id)
+    else:
+        EMBED_QUEUE.put(catalog, car_id)
+
+def _on_catalog_reload(old: CarCatalog, new: CarCatalog) -> None:
+    """Rechargement du fichier: on n'embedde que les annonces modifiées
+    (les ids sont les positions dans le fichier), en tâche de fond."""
+    new.subscribe(_on_catalog_change)
+    if _INDEX is None:
+        return
+    for i in range(max(len(old), len(new))):
+        before = old.cars[i] if i < len(old) else None
+        after = new.cars[i] if i < len(new) else None
+        if before == after:
+            continue
+        if after is None:
+            _INDEX.remove(i)
+        elif before is None or listing_text(before) != listing_text(after):
+            EMBED_QUEUE.put(new, i)
+
+
+# =========================
+# Reconstruction complète
+# =========================
+def rebuild(catalog: Optional[CarCatalog] = None, path: str = SEMANTIC_INDEX) -> int:
+    """Embedde tout le catalogue et réécrit l'index + son fichier meta."""
+    catalog = catalog or get_catalog()
+    ids = np.array([i for i, c in enumerate(catalog.cars) if c is not None], dtype="int64")
+    x = embed([listing_text(catalog.cars[i]) for i in ids])
+    index = build_index(x, ids)
+
+    tmp = path + ".tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)  # remplacement atomique: les lecteurs mmap gardent l'ancien fichier
+    with open(meta_path(path), "w", encoding="utf-8") as f:
+        json.dump({"model": EMBED_MODEL, "dim": int(x.shape[1]), "count": int(len(ids))}, f)
+    return len(ids)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "rebuild":
+        print(f"{rebuild()} annonces indexées dans {SEMANTIC_INDEX}")
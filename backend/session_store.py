@@ -0,0 +1,189 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# =========================
+# CONFIG
+# =========================
+# "memory" (un seul process) ou "sqlite" (fichier WAL partagé entre workers uvicorn)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+SESSION_DB = os.environ.get("SESSION_DB", "sessions.db")
+SESSION_TTL = float(os.environ.get("SESSION_TTL", "1800"))      # inactivité max (s)
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "10000"))       # nb max de sessions
+
+
+def pack(state: Dict[str, Any]) -> str:
+    """Enregistrement compact: JSON sans espaces, sans champs None."""
+    return json.dumps({k: v for k, v in state.items() if v is not None},
+                      separators=(",", ":"), ensure_ascii=False)
+
+def unpack(record: str) -> Dict[str, Any]:
+    return json.loads(record)
+
+
+# =========================
+# Backend mémoire (LRU + TTL)
+# =========================
+class MemorySessionStore:
+    on_disk = False
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (touched, record)
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(session_id)
+            if item is None:
+                return None
+            if now - item[0] > self.ttl:
+                del self._data[session_id]
+                self.expired += 1
+                return None
+            return unpack(item[1])
+
+    def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        now = time.time()
+        record = pack(state)
+        with self._lock:
+            self._data[session_id] = (now, record)
+            self._data.move_to_end(session_id)
+            # l'ordre = dernier accès: on nettoie par le début
+            while self._data:
+                oldest_id, (touched, _) = next(iter(self._data.items()))
+                if now - touched > self.ttl:
+                    self.expired += 1
+                elif len(self._data) > self.max_sessions:
+                    self.evicted += 1
+                else:
+                    break
+                del self._data[oldest_id]
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "sessions": len(self._data),
+            "bytes": sum(len(r) for _, r in self._data.values()),
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+# =========================
+# Backend partagé (SQLite WAL)
+# =========================
+class SQLiteSessionStore:
+    """Accès bloquants (commit, fsync): les appelants async passent par un thread (on_disk)."""
+    PURGE_EVERY = 256  # nettoyage TTL/cap toutes les N écritures
+    on_disk = True
+
+    def __init__(self, path: str = SESSION_DB, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+        # put/get arrivent de plusieurs threads (to_thread): compteurs sous verrou
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.expired = 0
+        self.evicted = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, record TEXT NOT NULL, touched REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT record, touched FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.ttl:
+            self.delete(session_id)
+            with self._lock:
+                self.expired += 1
+            return None
+        return unpack(row[0])
+
+    def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, record, touched) VALUES (?, ?, ?)",
+            (session_id, pack(state), time.time()),
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            self.purge()
+
+    def purge(self) -> None:
+        conn = self._conn()
+        expired = conn.execute(
+            "DELETE FROM sessions WHERE touched < ?", (time.time() - self.ttl,)
+        ).rowcount
+        evicted = 0
+        extra = len(self) - self.max_sessions
+        if extra > 0:
+            evicted = conn.execute(
+                "DELETE FROM sessions WHERE id IN"
+                " (SELECT id FROM sessions ORDER BY touched LIMIT ?)", (extra,)
+            ).rowcount
+        conn.commit()
+        with self._lock:
+            self.expired += expired
+            self.evicted += evicted
+
+    def delete(self, session_id: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "sessions": len(self),
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+def create_store(backend: str = SESSION_BACKEND):
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
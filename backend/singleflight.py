@@ -0,0 +1,62 @@
+"""Coalescence des appels identiques en cours (singleflight).
+
+Le premier appelant d'une clé devient le meneur et fait l'appel; ceux qui
+arrivent pendant ce temps attendent son résultat au lieu de prendre un
+slot du modèle. Si le meneur échoue ou est annulé, les suiveurs reçoivent
+None et se représentent: l'un d'eux devient meneur (pas d'erreur partagée).
+
+    while (waiter := FLIGHTS.join(key)) is not None:
+        result = await waiter
+        if result is not None:
+            return result
+    result = None
+    try:
+        result = await call()
+    finally:
+        FLIGHTS.done(key, result)
+"""
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+        self.fallbacks = 0
+
+    def join(self, key: str) -> Optional[asyncio.Future]:
+        """None: l'appelant est le meneur et doit appeler done(); sinon le futur à attendre."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            fut = self._calls.get(key)
+            if fut is not None and not fut.done() and fut.get_loop() is loop:
+                self.shared += 1
+                return fut
+            self._calls[key] = loop.create_future()
+            self.leaders += 1
+            return None
+
+    def done(self, key: str, result: Any = None) -> None:
+        """Fin de l'appel du meneur: result=None si échec (les suiveurs se représentent)."""
+        with self._lock:
+            fut = self._calls.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_result(result)
+
+    def fallback(self) -> None:
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.shared
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "fallbacks": self.fallbacks,
+            "coalesced_rate": round(self.shared / total, 3) if total else 0.0,
+        }
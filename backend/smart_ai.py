@@ -1,9 +1,24 @@
-import json, re, requests
+import heapq
+import os
 
-cars = json.load(open("cars.json", encoding="utf-8"))
+import httpx
+
+import entities
+import fuzzy
+import metrics
+import ollama_client
+from catalog import CATALOG, get_catalog
+from deadline import Deadline, DeadlineExceeded
+from metrics import stage
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "qwen2.5:14b-instruct"
+# attente max de la réponse libre (s): au-delà, réponse de secours
+SMART_LLM_TIMEOUT = float(os.environ.get("SMART_LLM_TIMEOUT", "30"))
+
+LLM_UNAVAILABLE_ANSWER = (
+    "Je suis un peu débordé pour répondre librement 😅 "
+    "Dis-moi plutôt ce que tu cherches (type, budget, ville) et je te propose des voitures."
+)
 
 SYSTEM_PROMPT = """
 Tu es SmartDrive AI 🚗, un assistant spécialisé dans le marché automobile marocain.
@@ -21,123 +36,214 @@ Règles :
 # Détection voiture
 # -----------------------------
 def is_car_question(q):
-    q = q.lower()
-    keywords = [
-        "voiture","diesel","essence","budget","prix","moins","plus",
-        "automatique","manuel","rabat","fes","casablanca","tanger",
-        "marrakech","mercedes","dacia","toyota","hyundai","renault","golf","mazda",
-        "bmw","audi","peugeot"
-    ]
-    return any(k in q for k in keywords)
+    e = entities.extract(q)
+    if e.is_car_question():
+        return True
+    # un terme du catalogue écrit tel quel compte ("sandero", "casa"); une
+    # correction approximative seule ne suffit pas ("paris" n'est pas Yaris)
+    return any(m.distance == 0 for m in fuzzy.get_fuzzy().find(e.rest))
 
 # -----------------------------
 # LLM Ollama
 # -----------------------------
-def llm_answer(prompt):
+# appels derrière la file bornée et le disjoncteur d'ollama_client, comme le slot-filling
+async def llm_answer(prompt, timeout=SMART_LLM_TIMEOUT):
     full_prompt = SYSTEM_PROMPT + "\nUtilisateur: " + prompt + "\nAssistant:"
-    r = requests.post(OLLAMA_URL, json={
+    data = await Deadline(timeout).run(ollama_client.agenerate({
         "model": OLLAMA_MODEL,
         "prompt": full_prompt,
-        "stream": False
-    })
-    return r.json()["response"]
+    }))
+    return data["response"]
+
+async def llm_answer_or_fallback(prompt):
+    """(réponse, raison) : LLM lent, en panne ou disjoncteur ouvert => réponse
+    de secours et la raison (None si le LLM a répondu). File pleine
+    (OllamaOverloaded): remonte à l'appelant (429/503), comme pour /chat."""
+    try:
+        return await llm_answer(prompt), None
+    except ollama_client.OllamaUnavailable:
+        reason = "circuit_open"
+    except DeadlineExceeded:
+        reason = "deadline"
+    except httpx.HTTPError:
+        reason = "llm_error"
+    metrics.DEGRADED_TURNS.inc(reason)
+    return LLM_UNAVAILABLE_ANSWER, reason
 
 # -----------------------------
-# Moteur SmartDrive IA
+# Scoring statique (indépendant de la requête)
 # -----------------------------
-def smartdrive_answer(q):
-    q = q.lower()
-
-    budget_max = None
-    budget_min = None
-
-    m1 = re.search(r"moins de (\d+)", q)
-    m2 = re.search(r"plus de (\d+)", q)
-
-    if m1: budget_max = int(m1.group(1))
-    if m2: budget_min = int(m2.group(1))
+RELIABLE_BRANDS = ["dacia","toyota","hyundai","kia","mazda","renault"]
+COSTLY_BRANDS = ["bmw","mercedes","audi","porsche","range rover","ferrari"]
+RESALE_BRANDS = ["dacia","toyota","renault"]
+
+def static_score(c):
+    """Partie du score qui ne dépend que de l'annonce.
+    Retourne (score, exp avant budget, exp après budget) pour garder
+    l'ordre des explications de l'ancien calcul."""
+    score = 0
+    head, tail = [], []
+
+    # Year
+    y = c.get("year")
+    if isinstance(y, int):
+        score += max(0, 20 - (2026 - y) * 2)
+        if y >= 2021:
+            head.append("Modèle récent")
+
+    # Mileage
+    km = c.get("km")
+    if isinstance(km, int):
+        score += max(0, 20 - (km // 10000) * 2)
+        if km < 70000:
+            head.append("Kilométrage raisonnable")
+
+    # Value tier
+    price = c.get("price")
+    if isinstance(price, int):
+        if price < 180000:
+            score += 25; tail.append("Excellent prix")
+        elif price < 300000:
+            score += 15; tail.append("Prix correct")
+        else:
+            score += 5; tail.append("Prix élevé")
+
+    # Brand reliability
+    b = (c.get("brand") or "").lower()
+    if b in RELIABLE_BRANDS:
+        score += 10; tail.append("Marque fiable")
+
+    # Maintenance
+    if b in COSTLY_BRANDS:
+        score += 2; tail.append("Entretien coûteux")
+    else:
+        score += 10; tail.append("Entretien économique")
+
+    # Fuel hint
+    f = c.get("fuel")
+    if f == "diesel":
+        score += 10; tail.append("Diesel économique")
+    if f == "electrique":
+        score += 10; tail.append("Électrique économique")
+
+    # Resale
+    if b in RESALE_BRANDS:
+        score += 5; tail.append("Revente facile")
+
+    return score, tuple(head), tuple(tail)
+
+
+class StaticScores:
+    """static_score() de chaque annonce, calculé au chargement du catalogue
+    et tenu à jour à chaque modification d'annonce."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.entries = [static_score(c) if c is not None else None for c in catalog.cars]
+        catalog.subscribe(self._on_change)
+
+    def _on_change(self, catalog, car_id):
+        if car_id >= len(self.entries):
+            self.entries.extend([None] * (car_id + 1 - len(self.entries)))
+        c = catalog.cars[car_id]
+        self.entries[car_id] = static_score(c) if c is not None else None
+
+
+# catalogue en service + celui en préparation pendant un rechargement
+_STATIC_SCORES: list = []
+
+def get_static_scores(catalog=None):
+    catalog = catalog or get_catalog()
+    for s in _STATIC_SCORES:
+        if s.catalog is catalog:
+            return s
+    s = StaticScores(catalog)
+    _STATIC_SCORES[:] = [*_STATIC_SCORES[-1:], s]
+    return s
+
+# rechargement: scores calculés en arrière-plan, avant la bascule
+CATALOG.on_reload(lambda old, new: get_static_scores(new))
+
+def budget_bonus(price, budget_min, budget_max):
+    bonus = 0
+    exp = []
+    if isinstance(price, int):
+        if budget_max and price <= budget_max:
+            bonus += 10; exp.append("Respecte ton budget")
+        if budget_min and price >= budget_min:
+            bonus += 10; exp.append("Dans ta gamme de prix")
+    return bonus, exp
+
+def rank_cars(ids, budget_min=None, budget_max=None, limit=None, catalog=None):
+    """Classe les ids candidats: score statique + bonus budget.
+    Sélection top-k par tas (même ordre qu'un tri stable décroissant).
+    catalog: celui qui a produit les ids (par défaut le catalogue partagé)."""
+    catalog = catalog or get_catalog()
+    entries = get_static_scores(catalog).entries
+    prices = catalog.prices
+
+    def total(i):
+        return entries[i][0] + budget_bonus(prices[i], budget_min, budget_max)[0]
+
+    if limit is None:
+        top = sorted(ids, key=total, reverse=True)
+    else:
+        top = heapq.nlargest(limit, ids, key=total)
 
-    city = None
-    for c in ["rabat","fes","casablanca","tanger","marrakech","agadir","kenitra"]:
-        if c in q: city = c
+    out = []
+    for i in top:
+        score, head, tail = entries[i]
+        bonus, exp_budget = budget_bonus(prices[i], budget_min, budget_max)
+        out.append((score + bonus, catalog.cars[i], [*head, *exp_budget, *tail]))
+    return out
 
-    brand = None
-    for b in ["dacia","mercedes","toyota","hyundai","renault","golf","mazda","bmw","audi","peugeot"]:
-        if b in q: brand = b
+# -----------------------------
+# Moteur SmartDrive IA
+# -----------------------------
+def parse_query(q):
+    """Texte libre -> critères (budget, ville, marque, carburant)."""
+    e = entities.extract(q)
+    city, brand = e.first("city"), e.first("brand")
+    if city is None:
+        m = fuzzy.resolve(q, "city")
+        city = m.value if m is not None else None
+    if brand is None:
+        # "peugot" -> peugeot, "sandro" -> marque du modèle (Dacia)
+        m = fuzzy.resolve(q, "brand")
+        brand = m.brand if m is not None else None
+    return {
+        "budget_min": e.budget_min,
+        "budget_max": e.budget_max,
+        "city": city,
+        "brand": brand,
+        "fuel": e.first("fuel"),
+    }
+
+def query_filters(p):
+    """Critères parse_query -> arguments de CarCatalog.select."""
+    return {
+        "exact": {k: p[k] for k in ("city", "fuel") if p.get(k)},
+        "contains": {"brand": p["brand"]} if p.get("brand") else None,
+        "price_min": p.get("budget_min"),
+        "price_max": p.get("budget_max"),
+    }
 
-    fuel = None
-    if "diesel" in q: fuel = "diesel"
-    if "essence" in q: fuel = "essence"
-    if "electrique" in q: fuel = "electrique"
+def smartdrive_answer(q):
+    p = parse_query(q)
 
     # ---------- Filtrage ----------
-    candidates = []
-    for c in cars:
-        if budget_max and c["price"] > budget_max: continue
-        if budget_min and c["price"] < budget_min: continue
-        if city and c["city"].lower() != city: continue
-        if brand and brand not in c["brand"].lower(): continue
-        if fuel and c["fuel"] != fuel: continue
-        candidates.append(c)
-
-    if not candidates:
+    catalog = get_catalog()
+    ids = catalog.select(**query_filters(p))
+
+    if not ids:
         return None
 
     # ---------- Scoring IA ----------
-    scored = []
-    for c in candidates:
-        score = 0
-        exp = []
-
-        # Année
-        score += max(0, 20 - (2026 - c["year"]) * 2)
-        if c["year"] >= 2021: exp.append("Modèle récent")
-
-        # Kilométrage
-        score += max(0, 20 - (c["km"] // 10000) * 2)
-        if c["km"] < 70000: exp.append("Kilométrage raisonnable")
-
-        # Budget
-        if budget_max and c["price"] <= budget_max:
-            score += 10; exp.append("Respecte ton budget")
-        if budget_min and c["price"] >= budget_min:
-            score += 10; exp.append("Dans ta gamme de prix")
-
-        # Prix
-        if c["price"] < 180000:
-            score += 25; exp.append("Excellent prix")
-        elif c["price"] < 300000:
-            score += 15; exp.append("Prix correct")
-        else:
-            score += 5; exp.append("Prix élevé")
-
-        # Marque
-        if c["brand"].lower() in ["dacia","toyota","hyundai","kia","mazda","renault"]:
-            score += 10; exp.append("Marque fiable")
-
-        # Entretien
-        if c["brand"].lower() in ["bmw","mercedes","audi","porsche","range rover","ferrari"]:
-            score += 2; exp.append("Entretien coûteux")
-        else:
-            score += 10; exp.append("Entretien économique")
-
-        # Carburant
-        if c["fuel"] == "diesel":
-            score += 10; exp.append("Diesel économique")
-        if c["fuel"] == "electrique":
-            score += 10; exp.append("Électrique économique")
-
-        # Revente
-        if c["brand"].lower() in ["dacia","toyota","renault"]:
-            score += 5; exp.append("Revente facile")
-
-        scored.append((score, c, exp))
-
-    scored.sort(reverse=True, key=lambda x: x[0])
+    scored = rank_cars(ids, p["budget_min"], p["budget_max"], limit=3, catalog=catalog)
 
     # ---------- Message ----------
     msg = ""
-    for score, c, exp in scored[:3]:
+    for score, c, exp in scored:
         if score >= 70:
             tag = "🟢 EXCELLENT"
         elif score >= 55:
@@ -159,113 +265,24 @@ def smartdrive_answer(q):
 # -----------------------------
 def smartdrive_results(q, limit=12):
     """Return a list of ranked cars with score + short 'why' text."""
-    q_low = q.lower()
-
-    budget_max = None
-    budget_min = None
-    m1 = re.search(r"moins de (\d+)", q_low)
-    m2 = re.search(r"plus de (\d+)", q_low)
-    if m1: budget_max = int(m1.group(1))
-    if m2: budget_min = int(m2.group(1))
-
-    city = None
-    for c in ["rabat","fes","casablanca","tanger","marrakech","agadir","kenitra"]:
-        if c in q_low:
-            city = c
-
-    brand = None
-    for b in ["dacia","mercedes","toyota","hyundai","renault","golf","mazda","bmw","audi","peugeot"]:
-        if b in q_low:
-            brand = b
-
-    fuel = None
-    if "diesel" in q_low: fuel = "diesel"
-    if "essence" in q_low: fuel = "essence"
-    if "electrique" in q_low: fuel = "electrique"
+    with stage("smart", "parse"):
+        p = parse_query(q)
 
     # ---------- Filtering ----------
-    candidates = []
-    for c in cars:
-        if budget_max and c.get("price") and c["price"] > budget_max:
-            continue
-        if budget_min and c.get("price") and c["price"] < budget_min:
-            continue
-        if city and c.get("city","").lower() != city:
-            continue
-        if brand and brand not in c.get("brand","").lower():
-            continue
-        if fuel and c.get("fuel") != fuel:
-            continue
-        candidates.append(c)
-
-    if not candidates:
-        return []
-
-    # ---------- Scoring ----------
-    scored = []
-    for c in candidates:
-        score = 0
-        exp = []
-
-        # Year
-        y = c.get("year")
-        if isinstance(y, int):
-            score += max(0, 20 - (2026 - y) * 2)
-            if y >= 2021:
-                exp.append("Modèle récent")
-
-        # Mileage
-        km = c.get("km")
-        if isinstance(km, int):
-            score += max(0, 20 - (km // 10000) * 2)
-            if km < 70000:
-                exp.append("Kilométrage raisonnable")
-
-        # Budget match
-        price = c.get("price")
-        if isinstance(price, int):
-            if budget_max and price <= budget_max:
-                score += 10; exp.append("Respecte ton budget")
-            if budget_min and price >= budget_min:
-                score += 10; exp.append("Dans ta gamme de prix")
-
-            # Value tier
-            if price < 180000:
-                score += 25; exp.append("Excellent prix")
-            elif price < 300000:
-                score += 15; exp.append("Prix correct")
-            else:
-                score += 5; exp.append("Prix élevé")
-
-        # Brand reliability
-        b = (c.get("brand") or "").lower()
-        if b in ["dacia","toyota","hyundai","kia","mazda","renault"]:
-            score += 10; exp.append("Marque fiable")
-
-        # Maintenance
-        if b in ["bmw","mercedes","audi","porsche","range rover","ferrari"]:
-            score += 2; exp.append("Entretien coûteux")
-        else:
-            score += 10; exp.append("Entretien économique")
-
-        # Fuel hint
-        f = c.get("fuel")
-        if f == "diesel":
-            score += 10; exp.append("Diesel économique")
-        if f == "electrique":
-            score += 10; exp.append("Électrique économique")
+    with stage("smart", "search"):
+        catalog = get_catalog()
+        ids = catalog.select(**query_filters(p))
 
-        # Resale
-        if b in ["dacia","toyota","renault"]:
-            score += 5; exp.append("Revente facile")
-
-        scored.append((score, c, exp))
+    if not ids:
+        return []
 
-    scored.sort(reverse=True, key=lambda x: x[0])
+    # ---------- Scoring (static part precomputed, top-k by heap) ----------
+    with stage("smart", "rank"):
+        scored = rank_cars(ids, p["budget_min"], p["budget_max"], limit=limit, catalog=catalog)
 
     # Build car objects for the frontend
     out = []
-    for score, c, exp in scored[:limit]:
+    for score, c, exp in scored:
         car = dict(c)  # copy
         car["score"] = int(score)
         car["why"] = " • ".join(exp[:6]) if exp else ""
@@ -274,28 +291,33 @@ def smartdrive_results(q, limit=12):
     return out
 
 
-def smart_response(q):
+async def smart_response(q):
     """Unified response for the frontend.
     - If car query: returns {cars:[...], summary:'...'}
     - Else: returns {answer:'...'}
     """
-    if is_car_question(q):
+    with stage("smart", "classify"):
+        car_question = is_car_question(q)
+    if car_question:
         cars_out = smartdrive_results(q, limit=15)
         if cars_out:
             return {
                 "cars": cars_out,
                 "summary": f"Je t’ai sélectionné {len(cars_out)} voiture(s). Clique à droite pour voir les détails 📌",
             }
+        metrics.EMPTY_SEARCHES.inc("smart")
 
     # fallback: normal LLM chat
-    return { "answer": llm_answer(q) }
+    with stage("smart", "llm"):
+        answer, reason = await llm_answer_or_fallback(q)
+    return {"answer": answer, "degraded": reason is not None}
 
 # -----------------------------
 # ROUTEUR FINAL
 # -----------------------------
-def smart_answer(q):
+async def smart_answer(q):
     if is_car_question(q):
         r = smartdrive_answer(q)
         if r:
             return r
-    return llm_answer(q)
+    return (await llm_answer_or_fallback(q))[0]
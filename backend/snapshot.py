@@ -0,0 +1,196 @@
+"""Snapshot binaire colonnaire du catalogue (cars.json -> cars.snap).
+
+Un seul fichier: en-tête JSON puis des tableaux NumPy alignés, lus en
+mémoire mappée (np.memmap). Chaque champ est une colonne:
+  - "int" / "float": valeurs int64 / float64
+  - "str" / "json": codes int32 vers un dictionnaire de valeurs distinctes
+    (octets UTF-8 + offsets), "json" pour les valeurs d'un autre type
+  - state (uint8): 0 = clé absente, 1 = valeur, 2 = null
+L'en-tête garde la signature (mtime, taille) du JSON source pour savoir
+si le snapshot est à jour.
+"""
+import json
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"SDCARS1\n"
+ALIGN = 64
+
+MISSING, VALUE, NULL = 0, 1, 2
+
+
+def source_signature(path: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _kind(values: List[Any]) -> str:
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return "int"
+    if present and all(isinstance(v, float) for v in present):
+        return "float"  # int et float mélangés: "json", pour garder le type de chaque valeur
+    if all(isinstance(v, str) for v in present):
+        return "str"
+    return "json"
+
+
+def _dictionary(values: List[Any], encode) -> Tuple[np.ndarray, List[bytes]]:
+    """codes (ordre de première apparition) + valeurs distinctes encodées."""
+    index: Dict[Any, int] = {}
+    distinct: List[bytes] = []
+    codes = np.full(len(values), -1, dtype=np.int32)
+    for i, v in enumerate(values):
+        if v is None:
+            continue
+        key = encode(v)
+        code = index.get(key)
+        if code is None:
+            code = index[key] = len(distinct)
+            distinct.append(key)
+        codes[i] = code
+    return codes, distinct
+
+
+# =========================
+# Écriture
+# =========================
+def write_snapshot(cars: List[Optional[Dict[str, Any]]], path: str, source: Optional[str] = None) -> None:
+    """Écrit le snapshot (fichier temporaire + rename: les lecteurs ne voient
+    jamais un fichier partiel). Les annonces None (supprimées) sont conservées."""
+    fields: List[str] = []
+    seen = set()
+    for c in cars:
+        for k in (c or ()):
+            if k not in seen:
+                seen.add(k)
+                fields.append(k)
+
+    arrays: List[Tuple[str, np.ndarray]] = []
+    columns: Dict[str, Dict[str, Any]] = {}
+    alive = np.array([c is not None for c in cars], dtype=np.uint8)
+    arrays.append(("alive", alive))
+
+    for f in fields:
+        raw = [c.get(f) if c is not None else None for c in cars]
+        state = np.array(
+            [MISSING if c is None or f not in c else (NULL if c[f] is None else VALUE) for c in cars],
+            dtype=np.uint8,
+        )
+        kind = _kind(raw)
+        col = {"kind": kind}
+        arrays.append((f"{f}.state", state))
+        if kind == "int":
+            arrays.append((f"{f}.values", np.array([v if v is not None else 0 for v in raw], dtype=np.int64)))
+        elif kind == "float":
+            arrays.append((f"{f}.values", np.array([v if v is not None else 0.0 for v in raw], dtype=np.float64)))
+        else:
+            encode = (lambda v: v.encode("utf-8")) if kind == "str" else \
+                (lambda v: json.dumps(v, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            codes, distinct = _dictionary(raw, encode)
+            offsets = np.zeros(len(distinct) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in distinct], out=offsets[1:])
+            arrays.append((f"{f}.codes", codes))
+            arrays.append((f"{f}.offsets", offsets))
+            arrays.append((f"{f}.blob", np.frombuffer(b"".join(distinct), dtype=np.uint8)))
+        columns[f] = col
+
+    # placement des tableaux (offsets relatifs au début de la zone de données)
+    layout = {}
+    pos = 0
+    for name, a in arrays:
+        layout[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": pos}
+        pos += -(-a.nbytes // ALIGN) * ALIGN
+    header = json.dumps({
+        "count": len(cars),
+        "fields": fields,
+        "columns": columns,
+        "arrays": layout,
+        "source": source_signature(source) if source else None,
+    }).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, a in arrays:
+            start = data_start + layout[name]["offset"]
+            f.write(b"\0" * (start - f.tell()))
+            f.write(a.tobytes())
+    os.replace(tmp, path)
+
+
+# =========================
+# Lecture
+# =========================
+class Snapshot:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path}: not a catalog snapshot")
+            n = int.from_bytes(f.read(8), "little")
+            self.header = json.loads(f.read(n))
+        self.data_start = -(-(len(MAGIC) + 8 + n) // ALIGN) * ALIGN
+        self.count: int = self.header["count"]
+        self.fields: List[str] = self.header["fields"]
+        self.columns: Dict[str, Dict[str, Any]] = self.header["columns"]
+
+    def is_fresh(self, source: str) -> bool:
+        sig = source_signature(source)
+        return sig is None or sig == self.header.get("source")
+
+    def array(self, name: str) -> np.ndarray:
+        meta = self.header["arrays"][name]
+        shape = tuple(meta["shape"])
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=meta["dtype"])
+        return np.memmap(self.path, dtype=meta["dtype"], mode="r",
+                         offset=self.data_start + meta["offset"], shape=shape)
+
+    def dictionary(self, field: str) -> List[Any]:
+        """Valeurs distinctes d'une colonne str/json (indexées par code)."""
+        offsets = self.array(f"{field}.offsets").tolist()
+        blob = self.array(f"{field}.blob").tobytes()
+        raw = [blob[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+        return raw if self.columns[field]["kind"] == "str" else [json.loads(v) for v in raw]
+
+    def codes(self, field: str) -> np.ndarray:
+        return self.array(f"{field}.codes")
+
+    def column(self, field: str) -> List[Any]:
+        """Valeurs Python de la colonne (None si absente ou null)."""
+        kind = self.columns[field]["kind"]
+        state = self.array(f"{field}.state")
+        if kind in ("int", "float"):
+            values = self.array(f"{field}.values").tolist()
+        else:
+            table = np.array(self.dictionary(field) + [None], dtype=object)
+            values = table[self.codes(field)].tolist()  # code -1 -> None (dernier)
+        if not (state == VALUE).all():
+            values = [v if s == VALUE else None for v, s in zip(values, state.tolist())]
+        return values
+
+    def cars(self) -> List[Optional[Dict[str, Any]]]:
+        """Reconstruit les annonces (mêmes dicts que le JSON source)."""
+        fields = self.fields
+        cols = [self.column(f) for f in fields]
+        rows = zip(*cols) if cols else iter([()] * self.count)
+        states = [self.array(f"{f}.state") for f in fields]
+        if all((s != MISSING).all() for s in states) and self.array("alive").all():
+            return [dict(zip(fields, row)) for row in rows]
+
+        present = list(zip(*[s.tolist() for s in states])) if states else [()] * self.count
+        alive = self.array("alive").tolist()
+        return [
+            {f: v for f, v, s in zip(fields, row, st) if s != MISSING} if ok else None
+            for row, st, ok in zip(rows, present, alive)
+        ]
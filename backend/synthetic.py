@@ -0,0 +1,77 @@
+"""Catalogue synthétique au format de cars.json (benchmarks, tests de charge).
+
+Les marques/modèles/types viennent du vrai catalogue; prix, année, km,
+carburant, boîte et ville sont tirés aléatoirement (graine fixe =
+catalogue reproductible). Les chaînes sont partagées entre annonces pour
+que 1M d'annonces tiennent en mémoire.
+
+    python synthetic.py 100000 -o cars_100k.json
+"""
+import argparse
+import json
+import random
+from typing import Dict, Any, List
+
+from catalog import load_cars
+
+# villes telles qu'écrites dans les annonces (poids ~ taille du marché)
+CITY_WEIGHTS = {
+    "Casablanca": 30, "Rabat": 15, "Marrakech": 10, "Tanger": 10, "Fes": 8, "Agadir": 7,
+    "Meknes": 5, "Kenitra": 5, "Oujda": 3, "Tetouan": 3, "Safi": 2, "El Jadida": 2,
+}
+FUEL_WEIGHTS = {"diesel": 55, "essence": 30, "hybride": 10, "electrique": 5}
+GEARBOX_WEIGHTS = {"automatique": 55, "manuelle": 45}
+
+
+def _templates(seed_cars: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"brand": c["brand"], "model": c["model"], "type": c["type"], "price": c["price"],
+         "image": c.get("image", "")}
+        for c in seed_cars if c.get("brand") and c.get("model") and isinstance(c.get("price"), int)
+    ]
+
+
+def generate_cars(n: int, seed: int = 42, seed_cars: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    templates = _templates(seed_cars if seed_cars is not None else load_cars())
+    cities, city_w = list(CITY_WEIGHTS), list(CITY_WEIGHTS.values())
+    fuels, fuel_w = list(FUEL_WEIGHTS), list(FUEL_WEIGHTS.values())
+    gearboxes, gearbox_w = list(GEARBOX_WEIGHTS), list(GEARBOX_WEIGHTS.values())
+
+    out = []
+    for i in range(n):
+        t = templates[rng.randrange(len(templates))]
+        year = rng.randint(2008, 2024)
+        age = 2025 - year
+        # décote ~7%/an autour du prix de référence, arrondi au millier
+        price = int(t["price"] * (1.15 - 0.07 * (age - 3)) * rng.uniform(0.85, 1.15)) // 1000 * 1000
+        out.append({
+            "model": t["model"],
+            "type": t["type"],
+            "price": max(price, 15000),
+            "year": year,
+            "km": age * rng.randint(8, 25) * 1000,
+            "fuel": rng.choices(fuels, fuel_w)[0],
+            "gearbox": rng.choices(gearboxes, gearbox_w)[0],
+            "city": rng.choices(cities, city_w)[0],
+            "whatsapp": f"2126{i:08d}",
+            "image": t["image"],
+            "brand": t["brand"],
+            "title": t["model"],
+        })
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Génère un catalogue synthétique (schéma cars.json)")
+    ap.add_argument("n", type=int)
+    ap.add_argument("-o", "--out", default="-")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    cars = generate_cars(args.n, seed=args.seed)
+    if args.out == "-":
+        print(json.dumps(cars, ensure_ascii=False))
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(cars, f, ensure_ascii=False)
@@ -0,0 +1,115 @@
+"""Démarrage de l'app: préchauffage lancé par le lifespan de api.py.
+
+Rien de coûteux ne se fait à l'import (catalogue, index, clients HTTP,
+driver Neo4j sont créés au premier usage). Au démarrage, WARMUP.run()
+déclenche ces initialisations en tâche de fond, en parallèle:
+  - catalogue + index, scores statiques, facettes, index des fautes de
+    frappe (fuzzy), index sémantique
+  - chargement des modèles dans Ollama (keep_alive) et de SYSTEM_PREFIX
+    dans leur cache de prompt
+/healthz répond dès que le process tourne; /readyz seulement une fois le
+préchauffage fini (503 avant). Les durées (depuis le démarrage du process)
+jusqu'à "prêt" et jusqu'à la première réponse de /chat sont dans /readyz
+et /stats.
+
+    WARMUP_MODELS=0  -> pas de préchauffage des modèles (tests, CI)
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Any, Optional
+
+import entities
+from catalog import get_catalog
+from facets import get_facets
+from fuzzy import get_fuzzy
+from llm_chat import warm_up_models
+from semantic_index import get_index as get_semantic_index
+from smart_ai import get_static_scores
+
+WARMUP_MODELS = os.environ.get("WARMUP_MODELS", "1") == "1"
+# chargement d'un 14B depuis le disque: peut prendre plusieurs minutes
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", "300"))
+
+
+def process_start() -> float:
+    """Instant (time.time) du démarrage du process; à défaut, maintenant."""
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])  # champ 22: starttime
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+class Warmup:
+    def __init__(self):
+        self.started_at = process_start()
+        self.state = "starting"  # starting -> warming -> ready | failed
+        self.steps: Dict[str, float] = {}
+        self.models: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.ready_s: Optional[float] = None
+        self.first_response_s: Optional[float] = None
+
+    def since_start(self) -> float:
+        return round(time.time() - self.started_at, 3)
+
+    def _step(self, name: str, fn) -> None:
+        t0 = time.perf_counter()
+        fn()
+        self.steps[name] = round(time.perf_counter() - t0, 3)
+
+    def prime_indexes(self) -> None:
+        """Partie CPU (thread): catalogue et tout ce qui en dérive."""
+        self._step("catalog", get_catalog)
+        catalog = get_catalog()
+        self._step("static_scores", lambda: get_static_scores(catalog))
+        self._step("facets", lambda: get_facets(catalog))
+        self._step("fuzzy", lambda: get_fuzzy(catalog))
+        self._step("semantic_index", get_semantic_index)
+        self._step("entities", lambda: entities.extract("berline diesel automatique Casablanca 150000"))
+
+    async def warm_models(self) -> None:
+        if not WARMUP_MODELS:
+            return
+        t0 = time.perf_counter()
+        self.models = await warm_up_models(WARMUP_TIMEOUT)
+        self.steps["models"] = round(time.perf_counter() - t0, 3)
+
+    async def run(self) -> None:
+        self.state = "warming"
+        try:
+            # les modèles se chargent côté Ollama pendant qu'on construit les index
+            await asyncio.gather(asyncio.to_thread(self.prime_indexes), self.warm_models())
+        except Exception as e:
+            # sans catalogue l'app ne peut rien servir; un modèle absent, si
+            # (réponses dégradées): warm_up_models ne lève pas
+            self.state = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            return
+        self.state = "ready"
+        self.ready_s = self.since_start()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def first_response(self) -> None:
+        if self.first_response_s is None:
+            self.first_response_s = self.since_start()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready_s": self.ready_s,
+            "first_response_s": self.first_response_s,
+            "steps": self.steps,
+            "models": self.models,
+            "error": self.error,
+        }
+
+
+WARMUP = Warmup()
@@ -9,5 +9,44 @@
         return await res.json(); // { assistant, slots, cars }
     }
 
-    window.Api = { postTurn };
+    // Variante streaming (POST /chat/stream, NDJSON).
+    // onEvent reçoit chaque événement: "slots" (slots + résultats provisoires),
+    // "token" (morceaux bruts du JSON LLM), "escalate" (petit modèle rejeté,
+    // le 14B reprend), "retry" (relance stricte), "degraded" ({reason}: sans LLM)
+    // et "final".
+    // Résout avec le même objet que postTurn: { assistant, slots, cars }
+    async function streamTurn(sessionId, message, onEvent){
+        const res = await fetch(window.CONFIG.API_URL + "/stream", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ session_id: sessionId, message })
+        });
+        if(!res.ok || !res.body) throw new Error("API error");
+
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buf = "";
+        let final = null;
+
+        while(true){
+            const { value, done } = await reader.read();
+            if(done) break;
+            buf += decoder.decode(value, { stream: true });
+            let nl;
+            while((nl = buf.indexOf("\n")) >= 0){
+                const line = buf.slice(0, nl).trim();
+                buf = buf.slice(nl + 1);
+                if(!line) continue;
+                const ev = JSON.parse(line);
+                if(onEvent) onEvent(ev);
+                if(ev.event === "final"){
+                    final = { assistant: ev.assistant, slots: ev.slots, cars: ev.cars };
+                }
+            }
+        }
+        if(!final) throw new Error("API stream interrupted");
+        return final;
+    }
+
+    window.Api = { postTurn, streamTurn };
 })();
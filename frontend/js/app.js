@@ -67,6 +67,8 @@
         window.Renderer.renderAll();
     }
 
+    const TYPING_TEXT = "MyFutureDrive AI est en train d’écrire ...";
+
     function addTyping(){
         window.Store.updateActive(s => {
             if(s.messages.some(m => m._typing)) return;
@@ -74,13 +76,21 @@
                 role:"bot",
                 kind:"text",
                 time:new Date().toISOString(),
-                text:"MyFutureDrive AI est en train d’écrire ...",
+                text:TYPING_TEXT,
                 _typing:true
             });
         });
         window.Renderer.renderAll();
     }
 
+    function setTyping(text){
+        window.Store.updateActive(s => {
+            const m = (s.messages || []).find(m => m._typing);
+            if(m) m.text = text;
+        });
+        window.Renderer.renderAll();
+    }
+
     function removeTyping(){
         window.Store.updateActive(s => {
             s.messages = (s.messages || []).filter(m => !m._typing);
@@ -88,6 +98,46 @@
         window.Renderer.renderAll();
     }
 
+    // prefs + insights + cars (panneau résultats) depuis un tour du backend
+    function applyTurn(data){
+        window.Store.updateActive(s => {
+            if(data?.slots){
+                s.prefs = s.prefs || {};
+                s.prefs.type = data.slots.type !== "ANY" ? data.slots.type : "";
+                s.prefs.fuel = data.slots.fuel !== "ANY" ? data.slots.fuel : "";
+                s.prefs.gearbox = data.slots.gearbox !== "ANY" ? data.slots.gearbox : "";
+                s.prefs.city = data.slots.city !== "ANY" ? data.slots.city : "";
+
+                s.prefs.budgetMax = data.slots.price_max !== "ANY" ? data.slots.price_max : "";
+                s.prefs.kmMax = data.slots.km_max !== "ANY" ? data.slots.km_max : "";
+                s.prefs.yearMin = data.slots.year_min !== "ANY" ? data.slots.year_min : "";
+            }
+
+            if(data?.slots){
+                s.insights = buildInsightsFromSlots(data.slots);
+            }
+
+            if(Array.isArray(data?.cars)){
+                s.cars = data.cars;
+            }
+        });
+    }
+
+    // événements du flux avant "final" (les tokens sont le JSON brut du LLM:
+    // on ne les affiche pas, la réponse arrive dans "final")
+    function onStreamEvent(ev){
+        if(ev.event === "slots"){
+            // slots extraits sans LLM: on met à jour le panneau tout de suite,
+            // sans vider les résultats tant que la recherche n'est pas lancée
+            applyTurn(ev.cars?.length ? ev : { slots: ev.slots });
+            window.Renderer.renderAll();
+        }else if(ev.event === "escalate" || ev.event === "retry"){
+            setTyping("MyFutureDrive AI réfléchit encore ...");
+        }else if(ev.event === "degraded"){
+            setTyping("MyFutureDrive AI répond en mode simplifié ...");
+        }
+    }
+
     async function send(){
         const userText = (inputEl.value || "").trim();
         if(!userText) return;
@@ -105,8 +155,8 @@
         addTyping();
 
         try{
-            // ✅ APPEL BACKEND /chat
-            const data = await window.Api.postTurn(sessionId, userText);
+            // ✅ APPEL BACKEND /chat/stream (NDJSON)
+            const data = await window.Api.streamTurn(sessionId, userText, onStreamEvent);
 
             removeTyping();
 
@@ -116,27 +166,7 @@
             }
 
             // update prefs + cars (panneau résultats)
-            window.Store.updateActive(s => {
-                if(data?.slots){
-                    s.prefs = s.prefs || {};
-                    s.prefs.type = data.slots.type !== "ANY" ? data.slots.type : "";
-                    s.prefs.fuel = data.slots.fuel !== "ANY" ? data.slots.fuel : "";
-                    s.prefs.gearbox = data.slots.gearbox !== "ANY" ? data.slots.gearbox : "";
-                    s.prefs.city = data.slots.city !== "ANY" ? data.slots.city : "";
-
-                    s.prefs.budgetMax = data.slots.price_max !== "ANY" ? data.slots.price_max : "";
-                    s.prefs.kmMax = data.slots.km_max !== "ANY" ? data.slots.km_max : "";
-                    s.prefs.yearMin = data.slots.year_min !== "ANY" ? data.slots.year_min : "";
-                }
-
-                if(data?.slots){
-                    s.insights = buildInsightsFromSlots(data.slots);
-                }
-
-                if(Array.isArray(data?.cars)){
-                    s.cars = data.cars;
-                }
-            });
+            applyTurn(data);
 
             window.Renderer.renderAll();
             window.UI.setApiStatus("ok");
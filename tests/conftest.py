@@ -0,0 +1,37 @@
+"""Config commune des tests: backend/ importable, Ollama simulé (fake_ollama).
+
+La config des modules backend est lue à l'import: tout est réglé ici avant
+le premier import d'un module de l'app.
+"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+import fake_ollama  # noqa: E402
+
+FAKE = fake_ollama.start(port=0, latency="const:0", seed=0)
+# requêtes coupées par le budget d'un tour: pas de trace de "Broken pipe"
+FAKE.handle_error = lambda request, client_address: None
+
+os.environ["OLLAMA_BASE"] = f"http://127.0.0.1:{FAKE.server_port}"
+os.environ.setdefault("CATALOG_WATCH_SECONDS", "0")
+os.environ.setdefault("CATALOG_WRITE_SNAPSHOT", "0")
+os.environ.setdefault("WARMUP_MODELS", "0")
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("LLM_CACHE_DB", "")
+
+
+@pytest.fixture
+def fake_ollama_server():
+    """Serveur Ollama simulé partagé; latence et taux d'erreurs restaurés après le test."""
+    latency, malformed = FAKE.latency, FAKE.malformed
+    yield FAKE
+    FAKE.latency, FAKE.malformed = latency, malformed
+
+
+def pytest_unconfigure(config):
+    FAKE.shutdown()
@@ -0,0 +1,9 @@
+import os
+
+import bench
+
+
+def test_thresholds_found_from_any_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert os.path.isabs(bench.THRESHOLDS_PATH)
+    assert bench.load_json(bench.THRESHOLDS_PATH)
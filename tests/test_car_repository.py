@@ -0,0 +1,63 @@
+import json
+
+import car_repository
+from catalog import load_cars
+from car_repository import import_cars, listing_id
+
+CAR = {"brand": "Dacia", "model": "Dacia Logan", "title": "Dacia Logan", "year": 2022, "km": 65000,
+       "price": 140000, "city": "Casablanca", "whatsapp": "212600000001", "image": "logan.jpg"}
+
+
+def test_same_seller_different_listings():
+    other = {**CAR, "model": "Dacia Duster", "title": "Dacia Duster", "image": "duster.jpg"}
+    assert listing_id(CAR) != listing_id(other)
+
+
+def test_listing_id_is_stable_across_updates():
+    assert listing_id(CAR) == listing_id({**CAR, "price": 130000, "km": 70000})
+    assert listing_id({**CAR, "id": 17}) == "17"
+
+
+def test_catalog_listings_have_distinct_ids():
+    cars = [c for c in load_cars() if c]
+    assert len({listing_id(c) for c in cars}) == len(cars)
+
+
+class FakeSession:
+    def __init__(self, runs):
+        self.runs = runs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, **params):
+        self.runs.append((query, params))
+        return self
+
+    def consume(self):
+        return None
+
+    def execute_write(self, fn):
+        return fn(self)
+
+
+class FakeDriver:
+    def __init__(self):
+        self.runs = []
+
+    def session(self):
+        return FakeSession(self.runs)
+
+
+def test_import_merges_on_listing_id(monkeypatch):
+    driver = FakeDriver()
+    monkeypatch.setattr(car_repository, "get_driver", lambda: driver)
+    second = {**CAR, "model": "Dacia Duster", "title": "Dacia Duster", "image": "duster.jpg"}
+    assert import_cars([CAR, second, None]) == 2
+    [(query, params)] = [r for r in driver.runs if "UNWIND" in r[0]]
+    assert "MERGE (c:Car {listing_id: row.listing_id})" in query
+    assert [r["listing_id"] for r in params["rows"]] == [listing_id(CAR), listing_id(second)]
+    assert json.dumps(params["rows"])  # sérialisable pour le driver
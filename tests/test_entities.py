@@ -0,0 +1,54 @@
+import pytest
+
+import car_engine
+import entities
+
+
+@pytest.mark.parametrize("text", ["une automobile", "autoroute", "auto-école", "électricien"])
+def test_word_starting_with_a_form_is_not_a_criterion(text):
+    e = entities.extract(text)
+    assert not e.has("gearbox") and not e.has("fuel")
+
+
+@pytest.mark.parametrize("text, kind, value", [
+    ("auto", "gearbox", "automatique"),
+    ("boite auto", "gearbox", "automatique"),
+    ("Automatique", "gearbox", "automatique"),
+    ("bvm", "gearbox", "manuelle"),
+    ("manuelle", "gearbox", "manuelle"),
+    ("électrique", "fuel", "electrique"),
+    ("hybrid", "fuel", "hybride"),
+    ("compactes", "type", "compacte"),
+])
+def test_listed_spellings(text, kind, value):
+    assert entities.extract(text).all(kind) == [value]
+
+
+@pytest.mark.parametrize("text, budget_min, budget_max", [
+    ("plus de 5 places", None, None),
+    ("moins de 3 ans", None, None),
+    ("moins de 200 dh", None, 200),
+    ("max 150k", None, 150000),
+    ("plus de 100.000", 100000, None),
+    ("moins de 200 000", None, 200000),
+    ("budget 90000", None, 90000),
+])
+def test_budget_needs_an_amount(text, budget_min, budget_max):
+    e = entities.extract(text)
+    assert (e.budget_min, e.budget_max) == (budget_min, budget_max)
+
+
+def test_small_number_after_plus_de_stays_a_number():
+    e = entities.extract("plus de 5 places")
+    assert e.all("number") == [5] and e.is_car_question()
+
+
+def test_find_cars_prefers_diesel_like_before():
+    cars = car_engine.find_cars("essence ou diesel")
+    assert cars and all(c["fuel"] == "diesel" for c in cars)
+
+
+def test_find_cars_budget_is_explicit():
+    assert car_engine.find_cars("diesel 2018") == car_engine.find_cars("diesel")
+    cars = car_engine.find_cars("diesel moins de 150000")
+    assert cars and all(c["price"] <= 150000 for c in cars)
@@ -0,0 +1,42 @@
+import pytest
+
+from llm_chat import SLOT_DEFAULTS, begin_turn
+
+
+def turn(message, last_asked=None):
+    sess = {"slots": dict(SLOT_DEFAULTS), "last_asked": last_asked}
+    _, state, prompt = begin_turn(sess, message)
+    return state, prompt
+
+
+@pytest.mark.parametrize("message, last_asked", [
+    ("diesel", "fuel"),
+    ("boite auto", "gearbox"),
+    ("automatique", "gearbox"),
+    ("Casablanca", "city"),
+])
+def test_fully_understood_reply_skips_llm(message, last_asked):
+    _, prompt = turn(message, last_asked)
+    assert prompt is None
+
+
+@pytest.mark.parametrize("message, last_asked", [
+    ("une automobile", None),
+    ("une automobile", "gearbox"),
+    ("autoroute", "gearbox"),
+    ("électricien", "fuel"),
+    ("essence diesel", "fuel"),
+])
+def test_doubtful_reply_goes_to_llm(message, last_asked):
+    state, prompt = turn(message, last_asked)
+    assert prompt is not None
+
+
+@pytest.mark.parametrize("message, slot", [
+    ("une automobile", "gearbox"),
+    ("autoroute", "gearbox"),
+    ("électricien", "fuel"),
+])
+def test_prefix_of_a_word_sets_nothing(message, slot):
+    state, _ = turn(message, slot)
+    assert state[slot] == "UNSET"
@@ -0,0 +1,71 @@
+import pytest
+
+import fuzzy
+import smart_ai
+from catalog import CarCatalog
+
+
+@pytest.fixture(scope="module")
+def index():
+    return fuzzy.get_fuzzy()
+
+
+@pytest.mark.parametrize("text, kind, value", [
+    ("peugot", "brand", "peugeot"),
+    ("mercedez", "brand", "mercedes"),
+    ("marakech", "city", "Marrakech"),
+    ("casa", "city", "Casablanca"),
+    ("sandro", "model", "Dacia Sandero"),
+    ("je veux une clio", "model", "Renault Clio 4"),
+    ("megane diesel", "model", "Renault Megane 4"),
+    ("ford ranger", "model", "Ford Ranger"),
+])
+def test_typos_and_short_forms(index, text, kind, value):
+    [m] = index.find(text)
+    assert (m.kind, m.value) == (kind, value)
+
+
+@pytest.mark.parametrize("text", [
+    "tu connais paris",
+    "ranger la chambre",
+    "rio de janeiro",
+    "fiesta ce soir",
+    "bonjour ça va",
+])
+def test_small_talk_is_not_a_car_question(index, text):
+    assert index.find(text) == []
+    assert not smart_ai.is_car_question(text)
+
+
+def test_short_terms_need_exact_form(index):
+    # "paris" -> "yaris": une lettre sur cinq
+    assert index.lookup("paris") is None
+    assert index.find("paris", min_confidence=0.0) == []
+
+
+def test_threshold_is_strict(index):
+    m = index.lookup("peugot")
+    assert m.value == "peugeot"
+    assert index.find("peugot", min_confidence=m.confidence) == []
+
+
+def test_ordinary_model_needs_car_context(index):
+    assert index.find("ranger") == []
+    [m] = index.find("ranger", car_context=True)
+    assert m.value == "Ford Ranger"
+    assert fuzzy.resolve("une ford ranger diesel", "brand").brand == "Ford"
+    assert smart_ai.is_car_question("je cherche une kia rio")
+
+
+def test_fuzzy_alone_does_not_make_a_car_question():
+    assert fuzzy.get_fuzzy().find("sandro")
+    assert not smart_ai.is_car_question("sandro")
+    assert smart_ai.is_car_question("sandero")
+
+
+def test_index_follows_catalog():
+    catalog = CarCatalog([{"brand": "Lada", "model": "Lada Niva 2", "city": "Rabat", "price": 90000}])
+    idx = fuzzy.FuzzyIndex(catalog)
+    assert idx.lookup("niva").value == "Lada Niva 2"
+    catalog.upsert({"brand": "Seat", "model": "Seat Alhambra", "city": "Rabat", "price": 120000})
+    assert idx.lookup("alhambre").value == "Seat Alhambra"
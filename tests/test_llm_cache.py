@@ -0,0 +1,64 @@
+import time
+
+from llm_cache import LLMCache, SQLiteCacheBackend, make_key
+
+
+def test_memory_lru_and_ttl():
+    cache = LLMCache(max_entries=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")  # "b" est le moins récemment utilisé
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+    expired = LLMCache(ttl=-1)
+    expired.set("a", "1")
+    assert expired.get("a") is None
+
+
+def test_key_ignores_message_formatting():
+    slots = {"type": "SUV"}
+    assert make_key(slots, None, "Diesel !", "m", {}) == make_key(slots, None, "  diesel", "m", {})
+
+
+def test_disk_backend_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    LLMCache(backend=SQLiteCacheBackend(path)).set("k", "raw")
+    cache = LLMCache(backend=SQLiteCacheBackend(path))
+    assert cache.get("k") == "raw"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_hit_keeps_its_expiry(tmp_path):
+    path = str(tmp_path / "cache.db")
+    LLMCache(ttl=0.2, backend=SQLiteCacheBackend(path)).set("k", "raw")
+    time.sleep(0.1)
+    # même entrée relue par une instance au TTL bien plus long
+    cache = LLMCache(ttl=3600, backend=SQLiteCacheBackend(path))
+    assert cache.get("k") == "raw"
+    time.sleep(0.15)
+    assert cache.get("k") is None
+
+
+def test_disk_purge_drops_expired_and_caps_entries(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), max_entries=3)
+    now = time.time()
+    backend.set("old", "x", now - 1)
+    for i in range(5):
+        backend.set(f"k{i}", "x", now + 100 + i)
+    assert backend.purge(now) == 3
+    assert len(backend) == 3
+    # les plus anciennes écritures partent d'abord
+    assert backend.get("k0", now) is None
+    assert backend.get("k4", now) == ("x", now + 104)
+    assert (backend.expired, backend.evicted) == (1, 2)
+
+
+def test_disk_purge_runs_on_writes(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), max_entries=10)
+    backend.PURGE_EVERY = 5
+    now = time.time()
+    for i in range(20):
+        backend.set(f"k{i}", "x", now + i)
+    assert len(backend) == 10
@@ -0,0 +1,143 @@
+"""Disjoncteur, budget de latence et surcharge, contre le faux serveur Ollama."""
+import asyncio
+import time
+import uuid
+
+import httpx
+import pytest
+
+import llm_chat
+import ollama_client
+import smart_ai
+from deadline import Deadline, DeadlineExceeded
+from ollama_client import CircuitBreaker, OllamaGate, OllamaUnavailable
+
+
+def message() -> str:
+    return f"je cherche un truc confortable zx{uuid.uuid4().hex[:8]}"
+
+
+async def post_chat(path: str, **body):
+    import api
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(path, json={"session_id": uuid.uuid4().hex, "message": message(), **body})
+
+
+@pytest.fixture
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(ollama_client, "breakers", {})
+    monkeypatch.setattr(ollama_client, "OLLAMA_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(ollama_client, "OLLAMA_BREAKER_COOLDOWN", 60)
+
+
+def test_breaker_opens_then_probes_once():
+    b = CircuitBreaker(max_failures=2, cooldown_s=0.05)
+    b.check(); b.failure()
+    b.check(); b.failure()
+    with pytest.raises(OllamaUnavailable):
+        b.check()
+    time.sleep(0.06)
+    b.check()  # essai
+    with pytest.raises(OllamaUnavailable):
+        b.check()  # un seul essai à la fois
+    b.success()
+    b.check()
+    assert b.stats()["state"] == "closed"
+
+
+def test_breakers_are_per_model(fresh_breakers):
+    small = ollama_client.breaker_for("small")
+    small.failure(); small.failure()
+    with pytest.raises(OllamaUnavailable):
+        small.check()
+    ollama_client.breaker_for("large").check()
+    assert ollama_client.open_circuits() == 1
+
+
+def test_dead_backend_degrades_then_opens_circuit(monkeypatch, fresh_breakers):
+    monkeypatch.setattr(ollama_client, "OLLAMA_BASE", "http://127.0.0.1:9")
+    monkeypatch.setattr(ollama_client, "_async_client", None)
+
+    reasons = [asyncio.run(llm_chat.chat_turn(uuid.uuid4().hex, message())).get("degraded_reason")
+               for _ in range(3)]
+    assert reasons[0] == "llm_error"
+    assert reasons[-1] == "circuit_open"
+    assert ollama_client.breaker_for(llm_chat.llm_tiers.LARGE.model).state == "open"
+
+
+def test_budget_degrades_slow_turn(fake_ollama_server, fresh_breakers):
+    fake_ollama_server.latency = lambda: 2.0
+    t0 = time.perf_counter()
+    r = asyncio.run(post_chat("/chat", budget_ms=300))
+    assert time.perf_counter() - t0 < 1.5
+    assert r.status_code == 200
+    assert r.json()["degraded_reason"] == "deadline"
+
+
+def test_full_queue_is_429_on_chat(fake_ollama_server, monkeypatch, fresh_breakers):
+    fake_ollama_server.latency = lambda: 0.5
+    monkeypatch.setattr(ollama_client, "gate", OllamaGate(1, 0, 30))
+
+    async def run():
+        return await asyncio.gather(post_chat("/chat"), post_chat("/chat"))
+
+    statuses = sorted(r.status_code for r in asyncio.run(run()))
+    assert statuses == [200, 429]
+
+
+def test_full_queue_degrades_started_stream(fake_ollama_server, monkeypatch, fresh_breakers):
+    fake_ollama_server.latency = lambda: 0.5
+    monkeypatch.setattr(ollama_client, "gate", OllamaGate(1, 0, 30))
+
+    async def run():
+        return await asyncio.gather(post_chat("/chat/stream"), post_chat("/chat/stream"))
+
+    bodies = [r.text for r in asyncio.run(run())]
+    assert all(r'"event": "final"' in b for b in bodies)
+    assert any(r'"reason": "overloaded"' in b for b in bodies)
+
+
+def test_free_answer_goes_through_the_gate(fake_ollama_server, fresh_breakers):
+    before = ollama_client.gate.admitted
+    answer, reason = asyncio.run(smart_ai.llm_answer_or_fallback("bonjour"))
+    assert reason is None and answer
+    assert ollama_client.gate.admitted == before + 1
+
+
+def chat_payload() -> dict:
+    return {"model": llm_chat.llm_tiers.LARGE.model, "messages": [{"role": "user", "content": message()}]}
+
+
+async def consume(chunks) -> None:
+    async for _ in chunks:
+        pass
+
+
+def test_client_disconnect_is_not_a_backend_failure(fake_ollama_server, fresh_breakers):
+    fake_ollama_server.latency = lambda: 0.5
+
+    async def run():
+        # onglet fermé pendant que le modèle réfléchit: la tâche est annulée
+        for _ in range(3):
+            task = asyncio.create_task(consume(ollama_client.astream_chat(chat_payload())))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(run())
+    breaker = ollama_client.breaker_for(chat_payload()["model"])
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_deadline_cancellation_is_a_backend_failure(fake_ollama_server, fresh_breakers):
+    fake_ollama_server.latency = lambda: 0.5
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(DeadlineExceeded):
+                await consume(Deadline(0.05).iterate(ollama_client.astream_chat(chat_payload())))
+
+    asyncio.run(run())
+    assert ollama_client.breaker_for(chat_payload()["model"]).state == "open"
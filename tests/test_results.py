@@ -0,0 +1,64 @@
+import base64
+import json
+
+import pytest
+
+from llm_chat import SLOT_DEFAULTS
+from results import InvalidCursor, decode_cursor, encode_cursor, results_page
+
+
+def raw_cursor(data) -> str:
+    raw = json.dumps(data).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+SLOTS = {**SLOT_DEFAULTS, "type": "SUV", "fuel": "diesel", "price_max": 300000}
+
+
+def test_cursor_round_trip():
+    slots, after = decode_cursor(encode_cursor(SLOTS, 42, 7))
+    assert slots == SLOTS
+    assert after == (42, 7)
+
+
+def test_pages_cover_ranking_without_duplicates():
+    slots = dict(SLOT_DEFAULTS)
+    first = results_page(slots, limit=10)
+    seen = [c["id"] for c in first["cars"]]
+    page = first
+    while page["next_cursor"]:
+        s, after = decode_cursor(page["next_cursor"])
+        page = results_page(s, after, limit=10)
+        seen += [c["id"] for c in page["cars"]]
+    assert len(seen) == len(set(seen)) == first["total"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "!!!",
+    raw_cursor([1, 2]),
+    raw_cursor({"slots": SLOTS}),
+    raw_cursor({"slots": SLOTS, "after": [1]}),
+    raw_cursor({"slots": SLOTS, "after": ["1", 2]}),
+    raw_cursor({"slots": SLOTS, "after": [1.5, 2]}),
+    raw_cursor({"slots": SLOTS, "after": [True, 2]}),
+    raw_cursor({"slots": [], "after": [1, 2]}),
+    raw_cursor({"slots": {}, "after": [1, 2]}),
+    raw_cursor({"slots": {**SLOTS, "type": 5}, "after": [1, 2]}),
+    raw_cursor({"slots": {**SLOTS, "price_max": "abc"}, "after": [1, 2]}),
+    raw_cursor({"slots": {**SLOTS, "fuel": "kerosene"}, "after": [1, 2]}),
+    raw_cursor({"slots": {**SLOTS, "extra": "x"}, "after": [1, 2]}),
+])
+def test_invalid_cursor_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_invalid_cursor_is_400():
+    from fastapi.testclient import TestClient
+    import api
+
+    client = TestClient(api.app)
+    bad = raw_cursor({"slots": {**SLOTS, "type": 5}, "after": [1, 2]})
+    r = client.get("/results", params={"cursor": bad})
+    assert r.status_code == 400
+    assert "error" in r.json()
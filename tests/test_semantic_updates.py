@@ -0,0 +1,72 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+import semantic_index
+from catalog import CarCatalog
+from semantic_index import EMBED_MODEL, SemanticIndex, build_index, meta_path
+
+DIM = 8
+CARS = [{"brand": "Dacia", "model": "Dacia Logan", "city": "Rabat", "price": 100000}]
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    path = str(tmp_path / "index.faiss")
+    x = np.eye(DIM, dtype="float32")[:1]
+    semantic_index.faiss.write_index(build_index(x, np.array([0])), path)
+    with open(meta_path(path), "w", encoding="utf-8") as f:
+        json.dump({"model": EMBED_MODEL, "dim": DIM, "count": 1}, f)
+    idx = SemanticIndex(path)
+    monkeypatch.setattr(semantic_index, "_INDEX", idx)
+    monkeypatch.setattr(semantic_index, "EMBED_RETRY_S", 0.01)
+    monkeypatch.setattr(semantic_index, "EMBED_QUEUE", semantic_index.EmbedQueue())
+    return idx
+
+
+def catalog_with_index():
+    catalog = CarCatalog([dict(c) for c in CARS])
+    catalog.subscribe(semantic_index._on_catalog_change)
+    return catalog
+
+
+def test_upsert_does_not_wait_for_embedding(index, monkeypatch):
+    def slow_embed(texts):
+        time.sleep(0.5)
+        return np.ones((len(texts), DIM), dtype="float32")
+
+    monkeypatch.setattr(semantic_index, "embed", slow_embed)
+    catalog = catalog_with_index()
+    t0 = time.perf_counter()
+    car_id = catalog.upsert({"brand": "Kia", "model": "Kia Rio", "city": "Fès", "price": 90000})
+    assert time.perf_counter() - t0 < 0.2
+    assert semantic_index.EMBED_QUEUE.wait_idle(5)
+    assert index.delta.ntotal == 1
+    assert car_id in index.hidden
+
+
+def test_embed_failure_stays_in_background(index, monkeypatch):
+    def broken_embed(texts):
+        raise ConnectionError("ollama down")
+
+    monkeypatch.setattr(semantic_index, "embed", broken_embed)
+    catalog = catalog_with_index()
+    catalog.upsert({"brand": "Kia", "model": "Kia Rio", "city": "Fès", "price": 90000})
+    queue = semantic_index.EMBED_QUEUE
+    deadline = time.time() + 5
+    while queue.dropped == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert queue.stats()["failed"] == semantic_index.EMBED_MAX_ATTEMPTS
+    assert queue.stats()["dropped"] == 1
+    assert "ollama down" in queue.stats()["last_error"]
+    assert index.delta.ntotal == 0
+
+
+def test_embeds_with_fake_ollama(index):
+    catalog = catalog_with_index()
+    car_id = catalog.upsert({"brand": "Kia", "model": "Kia Rio", "city": "Fès", "price": 90000})
+    assert semantic_index.EMBED_QUEUE.wait_idle(5)
+    assert semantic_index.EMBED_QUEUE.stats()["embedded"] == 1
+    assert car_id in index.hidden
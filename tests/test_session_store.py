@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import llm_chat
+from llm_cache import LLMCache, SQLiteCacheBackend
+from session_store import MemorySessionStore, SQLiteSessionStore, create_store
+
+
+STATE = {"slots": {"type": "SUV", "fuel": "UNSET"}, "last_asked": "fuel", "turns": 1, "wish": None}
+
+
+def test_memory_store_ttl_and_cap():
+    store = MemorySessionStore(ttl=60, max_sessions=2)
+    for sid in ("a", "b", "c"):
+        store.put(sid, STATE)
+    assert store.get("a") is None
+    assert store.get("c") == {k: v for k, v in STATE.items() if v is not None}
+    assert store.stats()["evicted"] == 1
+
+    expired = MemorySessionStore(ttl=-1)
+    expired.put("a", STATE)
+    assert expired.get("a") is None
+
+
+def test_sqlite_store_shared_between_instances(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SQLiteSessionStore(path).put("a", STATE)
+    assert SQLiteSessionStore(path).get("a")["slots"] == STATE["slots"]
+
+
+def test_sqlite_store_purge(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), max_sessions=2)
+    for sid in ("a", "b", "c"):
+        store.put(sid, STATE)
+        time.sleep(0.01)
+    store.purge()
+    assert len(store) == 2
+    assert store.get("a") is None
+
+
+def test_sqlite_store_counts_writes_across_threads(tmp_path, monkeypatch):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    monkeypatch.setattr(store, "PURGE_EVERY", 16)
+    purges = []
+    monkeypatch.setattr(store, "purge", lambda: purges.append(1))
+
+    def writer(n):
+        for i in range(64):
+            store.put(f"{n}-{i}", STATE)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store._writes == 8 * 64
+    assert len(purges) == 8 * 64 // 16
+
+
+def test_unknown_backend():
+    try:
+        create_store("redis")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError attendu")
+
+
+class RecordingSessions(SQLiteSessionStore):
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = set()
+
+    def get(self, session_id):
+        self.threads.add(threading.get_ident())
+        return super().get(session_id)
+
+    def put(self, session_id, state):
+        self.threads.add(threading.get_ident())
+        super().put(session_id, state)
+
+
+class RecordingBackend(SQLiteCacheBackend):
+    threads = set()
+
+    def get(self, key, now):
+        self.threads.add(threading.get_ident())
+        return super().get(key, now)
+
+    def set(self, key, value, expires):
+        self.threads.add(threading.get_ident())
+        super().set(key, value, expires)
+
+
+def test_sqlite_io_stays_off_the_event_loop(tmp_path, monkeypatch):
+    sessions = RecordingSessions(str(tmp_path / "sessions.db"))
+    backend = RecordingBackend(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(llm_chat, "SESSIONS", sessions)
+    monkeypatch.setattr(llm_chat, "LLM_CACHE", LLMCache(backend=backend))
+
+    async def run():
+        loop_thread = threading.get_ident()
+        sid = f"st-{uuid.uuid4().hex}"
+        out = await llm_chat.chat_turn(sid, f"je cherche un truc confortable zx{uuid.uuid4().hex[:8]}")
+        return loop_thread, sid, out
+
+    loop_thread, sid, out = asyncio.run(run())
+    assert out["degraded"] is False
+    assert sessions.threads and loop_thread not in sessions.threads
+    assert backend.threads and loop_thread not in backend.threads
+    assert sessions.get(sid)["slots"] == out["slots"]
@@ -0,0 +1,59 @@
+import asyncio
+import uuid
+
+import llm_chat
+from singleflight import SingleFlight
+
+
+def unique_message() -> str:
+    # jamais en cache LLM: un mot inconnu force aussi l'appel au modèle
+    return f"je cherche un truc confortable zx{uuid.uuid4().hex[:8]}"
+
+
+def test_followers_get_leader_result():
+    async def run():
+        flights = SingleFlight()
+        assert flights.join("k") is None
+        waiters = [flights.join("k") for _ in range(3)]
+        flights.done("k", "raw")
+        return await asyncio.gather(*waiters), flights.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == ["raw"] * 3
+    assert (stats["leaders"], stats["shared"], stats["in_flight"]) == (1, 3, 0)
+
+
+def test_failed_leader_lets_a_follower_lead():
+    async def run():
+        flights = SingleFlight()
+        assert flights.join("k") is None
+        waiter = flights.join("k")
+        flights.done("k", None)
+        assert await waiter is None
+        return flights.join("k")
+
+    assert asyncio.run(run()) is None
+
+
+def test_identical_turns_share_one_slot_fill(fake_ollama_server):
+    fake_ollama_server.latency = lambda: 0.3
+    msg = unique_message()
+    before = llm_chat.SLOT_FLIGHTS.stats()["shared"]
+
+    async def run():
+        return await asyncio.gather(*[llm_chat.chat_turn(f"sf-{uuid.uuid4().hex}", msg) for _ in range(3)])
+
+    outs = asyncio.run(run())
+    assert llm_chat.SLOT_FLIGHTS.stats()["shared"] - before == 2
+    assert llm_chat.SLOT_FLIGHTS.stats()["in_flight"] == 0
+    assert all(o["slots"] == outs[0]["slots"] for o in outs)
+
+
+def test_leader_calls_done_once(monkeypatch):
+    calls = []
+    done = llm_chat.SLOT_FLIGHTS.done
+    monkeypatch.setattr(llm_chat.SLOT_FLIGHTS, "done", lambda key, raw=None: (calls.append(key), done(key, raw)))
+
+    out = asyncio.run(llm_chat.chat_turn(f"sf-{uuid.uuid4().hex}", unique_message()))
+    assert out["degraded"] is False
+    assert len(calls) == 1
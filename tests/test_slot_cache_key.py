@@ -0,0 +1,23 @@
+from llm_chat import SLOT_DEFAULTS, slot_cache_key
+
+
+def session(history=None):
+    sess = {"slots": dict(SLOT_DEFAULTS), "last_asked": "fuel", "turns": 2}
+    if history is not None:
+        sess["llm_history"] = history
+    return sess
+
+
+def test_same_turn_same_key():
+    history = [["prompt 1", '{"updated_slots": {}, "done": false}']]
+    state = dict(SLOT_DEFAULTS)
+    assert slot_cache_key(session(history), state, "diesel") == slot_cache_key(session(list(history)), state, "diesel")
+
+
+def test_history_is_part_of_the_key():
+    state = dict(SLOT_DEFAULTS)
+    a = session([["prompt 1", '{"updated_slots": {"type": "SUV"}, "done": false}']])
+    b = session([["prompt 1", '{"updated_slots": {"type": "berline"}, "done": false}']])
+    keys = {slot_cache_key(s, state, "diesel") for s in (a, b, session(), session([]))}
+    # sans historique et historique vide: même entrée envoyée au modèle
+    assert len(keys) == 3
@@ -0,0 +1,52 @@
+"""Recherche sémantique (update_wish) en parallèle du slot-filling."""
+import asyncio
+import time
+import uuid
+
+import llm_chat
+
+LATENCY = 0.4
+
+
+class SlowIndex:
+    async def search(self, text, k=200):
+        await asyncio.sleep(LATENCY)
+        return [0, 1, 2]
+
+
+def message() -> str:
+    return f"je voudrais une voiture confortable et spacieuse pour partir en vacances zx{uuid.uuid4().hex[:8]}"
+
+
+def test_wish_runs_alongside_slot_filling(fake_ollama_server, monkeypatch):
+    fake_ollama_server.latency = lambda: LATENCY
+    monkeypatch.setattr(llm_chat, "get_semantic_index", lambda: SlowIndex())
+    sid = uuid.uuid4().hex
+    calls = fake_ollama_server.calls
+
+    t0 = time.perf_counter()
+    out = asyncio.run(llm_chat.chat_turn(sid, message()))
+    elapsed = time.perf_counter() - t0
+
+    assert out["degraded"] is False
+    assert llm_chat.get_state(sid)["wish_ids"] == [0, 1, 2]
+    # l'embedding ne s'ajoute pas aux appels LLM (petit modèle, 14B...)
+    llm_calls = fake_ollama_server.calls - calls
+    assert llm_calls >= 1
+    assert elapsed < LATENCY * (llm_calls + 0.5)
+
+
+def test_stream_waits_for_wish_before_final(fake_ollama_server, monkeypatch):
+    fake_ollama_server.latency = lambda: 0.0
+    monkeypatch.setattr(llm_chat, "get_semantic_index", lambda: SlowIndex())
+    sid = uuid.uuid4().hex
+
+    async def run():
+        return [ev async for ev in llm_chat.chat_turn_stream(sid, message())]
+
+    t0 = time.perf_counter()
+    events = asyncio.run(run())
+    assert events[0]["event"] == "slots"
+    assert time.perf_counter() - t0 >= LATENCY
+    assert events[-1]["event"] == "final"
+    assert llm_chat.get_state(sid)["wish_ids"] == [0, 1, 2]